@@ -7,6 +7,7 @@ from django.db.models import QuerySet
 
 from bot.models import TgUser
 from bot.tg.client import TgClient
+from core.db.pool import release_connections
 from goals.models import Goal, GoalCategory, BoardParticipant
 from todolist.settings import TG_BOT_TOKEN
 
@@ -74,6 +75,9 @@ class Command(BaseCommand):
             for item in response.result:
                 offset = item.update_id + 1
                 self.handle_message(item.message)
+            # like the end of a request: hand the connection back to the pool while long polling,
+            # a broken one is dropped instead of failing every later update
+            release_connections()
 
     def handle_message(self, message):
         tg_user, created = TgUser.objects.get_or_create(
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0002_tguser_username_tguser_verification_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tguser',
+            index=models.Index(condition=models.Q(('verification_code__isnull', False)), fields=['verification_code'], name='tguser_verification_code_idx'),
+        ),
+    ]
@@ -22,6 +22,15 @@ class TgUser(models.Model):
     # in_operation = models.BooleanField(verbose_name='in operation', default=False)
     # operation_buff = models.CharField(verbose_name='operation buffer', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['verification_code'],
+                condition=models.Q(verification_code__isnull=False),
+                name='tguser_verification_code_idx',
+            ),
+        ]
+
     def generate_verification_code(self):
         verification_code = ''.join(
             secrets.choice(string.ascii_lowercase + string.ascii_uppercase + string.digits) for x in range(16)
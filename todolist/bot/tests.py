@@ -1,3 +1,32 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from bot.models import TgUser
+from core.models import User
+
+
+class VerificationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', password='test_password')
+        TgUser.objects.bulk_create([
+            TgUser(tg_user_id=index, tg_chat_id=index, verification_code=f'test_code_{index}') for index in range(50)
+        ])
+        self.client.force_login(self.user)
+
+    @mock.patch('bot.views.TgClient')
+    def test_verification_links_user_within_query_budget(self, tg_client):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                '/bot/verify', {'verification_code': 'test_code_7'}, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user_id'], self.user.id)
+        self.assertEqual(TgUser.objects.get(tg_user_id=7).user, self.user)
+        tg_client.return_value.send_message.assert_called_once_with(chat_id=7, text=mock.ANY)
+        self.assertLessEqual(len(queries), 4)
@@ -18,7 +18,8 @@ class VerificationView(GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        instance = TgUser.objects.filter(verification_code=request.data.get('verification_code')).first()
+        # looked up once by TgUserSerializer.validate
+        instance = serializer.validated_data['tg_user']
 
         instance.user = self.request.user
         instance.save(update_fields=['user'])
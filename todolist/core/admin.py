@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.forms import AuthenticationForm
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from .models import User
+from .models import RequestProfile, User
 
 
 @admin.register(User)
@@ -36,3 +40,43 @@ class UserAdmin(admin.ModelAdmin):
     #     return 'username', 'email', 'first_name', 'last_name'
 
 # admin.site.register(User, UserAdmin)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created', 'user', 'method', 'path', 'status', 'duration_ms', 'samples', 'flamegraph')
+    list_filter = ('method', 'status')
+    search_fields = ('path', 'user__username')
+    fields = ('created', 'user', 'method', 'path', 'status', 'duration_ms', 'samples', 'flamegraph', 'summary')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/collapsed/', self.admin_site.admin_view(self.collapsed_view),
+                 name='core_requestprofile_collapsed'),
+        ] + super().get_urls()
+
+    def collapsed_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        file_path = profile.file_path('collapsed')
+        if not file_path.exists():
+            raise Http404
+        return FileResponse(file_path.open('rb'), as_attachment=True, filename=file_path.name)
+
+    @admin.display(description='collapsed stacks')
+    def flamegraph(self, obj):
+        return format_html('<a href="{}">{}.collapsed</a>',
+                           reverse('admin:core_requestprofile_collapsed', args=[obj.pk]), obj.name)
+
+    @admin.display(description='top functions')
+    def summary(self, obj):
+        file_path = obj.file_path('txt')
+        if not file_path.exists():
+            return '-'
+        return format_html('<pre>{}</pre>', file_path.read_text(encoding='utf-8'))
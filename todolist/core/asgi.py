@@ -0,0 +1,46 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+_exhausted = object()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django 4.1 iterates streaming responses inside the event loop, where the ORM refuses to run.
+    Pull every part in the request's sync thread instead, so generators can keep reading rows
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+
+        try:
+            parts = iter(response)
+            next_part = sync_to_async(next, thread_sensitive=True)
+            while (part := await next_part(parts, _exhausted)) is not _exhausted:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # sends request_finished, which hands the request's connections back to the pool,
+            # on client disconnects too
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """django.core.asgi.get_asgi_application() with the handler above"""
+    import django
+
+    django.setup(set_prefix=False)
+    return ASGIHandler()
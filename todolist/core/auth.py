@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, _get_user_session_key, load_backend
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+from core.db.routers import use_primary
+from core.metrics import CACHE_REQUESTS
+from core.models import User
+
+USER_KEY = 'core:user:{user_id}'
+
+
+def cached_user(user_id, backend_path: str):
+    """backend.get_user() through the cache, inactive and missing users are not cached"""
+    if not settings.CACHE_SHARED:
+        # a logout or password change on one worker could not drop the user cached by the others
+        return load_backend(backend_path).get_user(user_id)
+
+    key = USER_KEY.format(user_id=user_id)
+    user = cache.get(key)
+    if user is not None:
+        CACHE_REQUESTS.labels('users', 'hit').inc()
+        return user
+
+    CACHE_REQUESTS.labels('users', 'miss').inc()
+    # cached for USER_CACHE_TIMEOUT, a lagging replica would keep an old password hash alive that long
+    with use_primary():
+        user = load_backend(backend_path).get_user(user_id)
+    if user is not None:
+        cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def get_user(request):
+    """django.contrib.auth.get_user() with the user read through the cache"""
+    try:
+        user_id = _get_user_session_key(request)
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    user = cached_user(user_id, backend_path)
+    if user is None:
+        return AnonymousUser()
+    # the hash changes with the password, so sessions from before a password change end here
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+    return user
+
+
+def invalidate_users(user_ids):
+    """Same as goals.roles.invalidate_role_maps(): now and once more after commit"""
+    keys = [USER_KEY.format(user_id=user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # profile updates, password changes and last_login on every login
+    invalidate_users([instance.id])
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_users([user.id])
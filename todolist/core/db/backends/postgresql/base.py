@@ -0,0 +1,14 @@
+from django.db.backends.postgresql import base, creation
+
+from core.db.pool import PooledDatabaseWrapperMixin, drain_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections keep the test database busy and DROP DATABASE would fail
+        drain_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def pooled(self) -> bool:
+        # Django never closes in-memory databases, their connections would not come back
+        return not self.is_in_memory_db() and super().pooled()
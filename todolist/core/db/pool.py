@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import NamedTuple
+
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Lease(NamedTuple):
+    connection: object
+    created: float
+    owner: threading.Thread
+    taken: float
+
+
+def ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    """
+    LIFO pool of DB-API connections shared by every thread of one process, at most ``size`` of them open.
+    Checkout waits up to ``timeout`` seconds for a free connection, drops connections older than ``recycle``
+    seconds and pings the ones idle for ``ping_after`` seconds or more, replacing those that fail.
+    Connections only come back when Django closes them: a full pool takes back the ones of threads that
+    ended without closing theirs, and a checkout timing out logs which threads hold them
+    """
+
+    def __init__(self, alias: str, size: int, timeout: float, recycle: float, ping_after: float):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.open = 0
+        self._idle = deque()  # (connection, created, returned)
+        self._in_use = {}  # id(connection) -> Lease
+        self._condition = threading.Condition()
+
+    def checkout(self, connect, validate=ping):
+        started = time.monotonic()
+        orphans = []
+        with self._condition:
+            while not self._idle and self.open >= self.size:
+                if reclaimed := self._reclaim():
+                    orphans += reclaimed
+                    continue
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.count('timeout')
+                    self._log_holders()
+                    raise PoolTimeout(
+                        f'No connection to database "{self.alias}" freed up in {self.timeout:g} s, '
+                        f'all {self.size} are in use'
+                    )
+                self._condition.wait(remaining)
+            if self._idle:
+                connection, created, returned = self._idle.pop()
+            else:
+                # the slot is taken now, the connection is opened outside the lock
+                connection, created, returned = None, None, None
+                self.open += 1
+        metrics.DB_POOL_WAIT.labels(self.alias).observe(time.monotonic() - started)
+        for orphan in orphans:
+            logger.warning(
+                'Reclaimed a connection to database "%s" left open by thread %s, ended after holding it %.0f s',
+                self.alias, orphan.owner.name, time.monotonic() - orphan.taken,
+            )
+            self.count('reclaimed')
+            self._close(orphan.connection)
+
+        if connection is not None:
+            reason = self.stale(connection, created, returned, validate)
+            if reason is None:
+                return self._hand_out(connection, created, 'reused')
+            self.count(reason)
+            self._close(connection)
+
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self.open -= 1
+                self._condition.notify()
+            raise
+        return self._hand_out(connection, time.monotonic(), 'created')
+
+    def stale(self, connection, created, returned, validate) -> str | None:
+        now = time.monotonic()
+        if self.recycle and now - created >= self.recycle:
+            return 'recycled'
+        if now - returned >= self.ping_after:
+            try:
+                validate(connection)
+            except Exception:
+                return 'broken'
+        return None
+
+    def checkin(self, connection, reusable: bool = True):
+        with self._condition:
+            lease = self._in_use.pop(id(connection), None)
+            if lease is not None and reusable:
+                self._idle.append((connection, lease.created, time.monotonic()))
+            elif lease is not None:
+                self.open -= 1
+            self._condition.notify()
+            self.update_gauges()
+        if lease is None or not reusable:
+            self.count('discarded')
+            self._close(connection)
+
+    def drain(self):
+        """Close every idle connection, the ones in use are closed when checked in"""
+        with self._condition:
+            idle, self._idle = self._idle, deque()
+            self.open -= len(idle)
+            self._condition.notify_all()
+            self.update_gauges()
+        for connection, _, _ in idle:
+            self._close(connection)
+
+    def _reclaim(self) -> list[Lease]:
+        """Take back the slots of threads that ended without closing their connection, called with the lock held"""
+        orphans = [lease for lease in self._in_use.values() if not lease.owner.is_alive()]
+        for lease in orphans:
+            del self._in_use[id(lease.connection)]
+        self.open -= len(orphans)
+        if orphans:
+            self.update_gauges()
+        return orphans
+
+    def _log_holders(self):
+        now = time.monotonic()
+        logger.warning(
+            'No connection to database "%s" freed up, held by: %s', self.alias, ', '.join(
+                f'{lease.owner.name} for {now - lease.taken:.0f} s' for lease in self._in_use.values()
+            ) or 'connections being opened',
+        )
+
+    def _hand_out(self, connection, created, event):
+        with self._condition:
+            self._in_use[id(connection)] = Lease(connection, created, threading.current_thread(), time.monotonic())
+            self.update_gauges()
+        self.count(event)
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def count(self, event):
+        metrics.DB_POOL_EVENTS.labels(self.alias, event).inc()
+
+    def update_gauges(self):
+        metrics.DB_POOL_CONNECTIONS.labels(self.alias, 'idle').set(len(self._idle))
+        metrics.DB_POOL_CONNECTIONS.labels(self.alias, 'in_use').set(len(self._in_use))
+
+
+def get_pool(alias: str, settings_dict: dict) -> ConnectionPool:
+    """One pool per alias and target database, test databases get their own"""
+    key = (alias, settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'])
+    with _pools_lock:
+        if key not in _pools:
+            options = settings_dict['POOL']
+            _pools[key] = ConnectionPool(
+                alias, options['SIZE'], options['TIMEOUT'], options['RECYCLE'], options['PING_AFTER']
+            )
+        return _pools[key]
+
+
+def drain_pools(alias: str | None = None):
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if alias is None or key[0] == alias]
+    for pool in pools:
+        pool.drain()
+
+
+def release_connections():
+    """
+    close_old_connections() for long running commands, called between units of work so connections
+    go back to the pool and broken ones are dropped. Connections inside an atomic block are left alone
+    """
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    DatabaseWrapper that checks its connection out of a ConnectionPool instead of opening one,
+    and checks it back in on close(). Configured by the ``POOL`` dict of the database settings,
+    a ``SIZE`` of 0 opens and closes connections like the stock backend
+    """
+
+    # pool of the current connection, None when it was opened directly
+    pool = None
+
+    def pooled(self) -> bool:
+        return bool(self.settings_dict.get('POOL', {}).get('SIZE'))
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, self.settings_dict) if self.pooled() else None
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return self.pool.checkout(partial(super().get_new_connection, conn_params))
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        self.pool.checkin(self.connection, reusable=self.reset_connection())
+
+    def reset_connection(self) -> bool:
+        """Whether the connection can serve another thread, rolled back to a clean state"""
+        # closed mid transaction or after a connection level error: the session state is unknown
+        if self.in_atomic_block or self.errors_occurred:
+            return False
+        try:
+            self.connection.rollback()
+        except Exception:
+            return False
+        return True
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_routing = Local()
+
+
+class Routing:
+    """Where the ORM reads of the current request go, and whether it wrote anything"""
+
+    def __init__(self, replica: str | None):
+        self.replica = replica
+        self.wrote = False
+
+
+def current() -> Routing | None:
+    return getattr(_routing, 'value', None)
+
+
+@contextmanager
+def route_reads(replica: str | None):
+    """Send reads inside the block to the replica alias, None keeps them on the primary"""
+    previous = current()
+    routing = _routing.value = Routing(replica)
+    try:
+        yield routing
+    finally:
+        _routing.value = previous
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, for reads whose results outlive the request,
+    like cached data or sync tokens, and must not come from a lagging replica
+    """
+    routing = current()
+    if routing is None or routing.replica is None:
+        yield
+        return
+    replica, routing.replica = routing.replica, None
+    try:
+        yield
+    finally:
+        routing.replica = replica
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica ReplicaMiddleware picked for the request, writes and reads inside
+    transactions go to the primary. Code running outside requests, like management commands,
+    always uses the primary. Replicas are never migrated, they follow the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current()
+        if routing is None or routing.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = current()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
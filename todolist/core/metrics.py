@@ -0,0 +1,68 @@
+import ipaddress
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, \
+    generate_latest, multiprocess
+
+# prometheus_client picks its file backed multiprocess store when this is set before it is imported,
+# gunicorn.conf.py cleans up after dead workers
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to the response object, streaming bodies excluded',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled', multiprocess_mode='livesum',
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request', ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Database time per request', ['view'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by result', ['cache', 'result'],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pooled database connections by state', ['alias', 'state'], multiprocess_mode='livesum',
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time waiting for a free pooled connection', ['alias'],
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+DB_POOL_EVENTS = Counter(
+    'db_pool_events_total',
+    'Checkouts by outcome (reused, created, timeout) and replaced connections by reason '
+    '(recycled, broken, discarded, reclaimed)',
+    ['alias', 'event'],
+)
+
+
+def view_label(request) -> str:
+    """Route pattern, not the path, so ids do not blow up the label cardinality"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else '<unmatched>'
+
+
+def allowed(request, token: str, networks: list[str]) -> bool:
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def exposition() -> tuple[bytes, str]:
+    """Metrics of every worker when running multiprocess, of this process otherwise"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
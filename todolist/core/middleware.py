@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from core import auth, metrics
+from core.db import routers
+from core.models import RequestProfile
+from core.profiling import SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql: str) -> str:
+    """Statements differing only in values and IN list lengths normalize to the same text"""
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = LITERAL.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """connection.execute_wrapper() hook summing query time, grouped by statement text"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, '')
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if duration > self.slowest[0]:
+                self.slowest = (duration, sql)
+            count, total = self.statements.get(sql, (0, 0.0))
+            self.statements[sql] = (count + 1, total + duration)
+
+    def top(self, limit: int) -> list[tuple[str, int, float]]:
+        """(normalized sql, executions, seconds) of the statements taking the most time"""
+        grouped = {}
+        for sql, (count, total) in self.statements.items():
+            sql = normalize_sql(sql)
+            old_count, old_total = grouped.get(sql, (0, 0.0))
+            grouped[sql] = (old_count + count, old_total + total)
+        ranked = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, total) for sql, (count, total) in ranked[:limit]]
+
+    def install(self):
+        """Wrap the connections of the calling thread"""
+        for alias in connections:
+            connections[alias].execute_wrappers.append(self)
+
+    def uninstall(self):
+        for alias in connections:
+            connections[alias].execute_wrappers.remove(self)
+
+
+class HybridMiddleware:
+    """
+    Base of middleware that runs sync or async, matching the handler chain it wraps,
+    so async views are not pushed into a thread. Subclasses implement process() and aprocess()
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django's MiddlewareMixin tells the handler that this instance is a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.aprocess(request)
+        return self.process(request)
+
+    def process(self, request):
+        raise NotImplementedError
+
+    async def aprocess(self, request):
+        raise NotImplementedError
+
+
+class SQLInstrumentationMiddleware(HybridMiddleware):
+    """
+    Query count, database time, the slowest statement and the remaining view time of every
+    request as a Server-Timing header; requests slower than SQL_SLOW_REQUEST_MS are logged
+    with their most expensive normalized statements. Queries run while a streaming response
+    is consumed happen after the header is sent and are not counted
+    """
+
+    def process(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return self.get_response(request)
+
+        stats = request.sql_stats = QueryStats()
+        started = time.perf_counter()
+        stats.install()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats.uninstall()
+        return self.report(request, response, stats, time.perf_counter() - started)
+
+    async def aprocess(self, request):
+        if not settings.SQL_INSTRUMENTATION:
+            return await self.get_response(request)
+
+        stats = request.sql_stats = QueryStats()
+        started = time.perf_counter()
+        # the async ORM runs queries in the request's sync thread, whose connections get the wrapper
+        await sync_to_async(stats.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stats.uninstall)()
+        return self.report(request, response, stats, time.perf_counter() - started)
+
+    @staticmethod
+    def report(request, response, stats: QueryStats, total: float):
+        response['Server-Timing'] = ', '.join([
+            f'db;desc="{stats.count} queries";dur={stats.duration * 1000:.2f}',
+            f'db-slowest;dur={stats.slowest[0] * 1000:.2f}',
+            f'app;dur={(total - stats.duration) * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+        if total * 1000 >= settings.SQL_SLOW_REQUEST_MS:
+            statements = '\n'.join(
+                f'  {count}x {duration * 1000:.2f} ms: {sql}'
+                for sql, count, duration in stats.top(settings.SQL_SLOW_LOG_STATEMENTS)
+            )
+            logger.warning(
+                'Slow request %s %s %s: %.2f ms total, %d queries in %.2f ms\n%s',
+                request.method, request.path, response.status_code, total * 1000,
+                stats.count, stats.duration * 1000, statements,
+            )
+        return response
+
+
+class ReplicaMiddleware(HybridMiddleware):
+    """
+    GET, HEAD and OPTIONS requests read from a random replica of DATABASE_REPLICAS. A request that
+    writes pins its client to the primary for DATABASE_PIN_SECONDS with a cookie, so it reads its
+    own writes while the replicas catch up. Listed before SessionMiddleware, sessions are read there too
+    """
+    cookie_name = 'db_primary_until'
+
+    def replica(self, request) -> str | None:
+        if not settings.DATABASE_REPLICAS or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        try:
+            pinned = float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return None if pinned else random.choice(settings.DATABASE_REPLICAS)
+
+    def process(self, request):
+        with routers.route_reads(self.replica(request)) as routing:
+            response = self.get_response(request)
+        return self.pin(response, routing)
+
+    async def aprocess(self, request):
+        with routers.route_reads(self.replica(request)) as routing:
+            response = await self.get_response(request)
+        return self.pin(response, routing)
+
+    def pin(self, response, routing: routers.Routing):
+        if routing.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                self.cookie_name, str(int(time.time()) + settings.DATABASE_PIN_SECONDS),
+                max_age=settings.DATABASE_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Prometheus latency, in-flight and per request query metrics labelled by route,
+    listed before SQLInstrumentationMiddleware so it can read request.sql_stats
+    """
+
+    def process(self, request):
+        started = time.perf_counter()
+        with metrics.REQUESTS_IN_FLIGHT.track_inprogress():
+            response = self.get_response(request)
+        return self.observe(request, response, time.perf_counter() - started)
+
+    async def aprocess(self, request):
+        started = time.perf_counter()
+        with metrics.REQUESTS_IN_FLIGHT.track_inprogress():
+            response = await self.get_response(request)
+        return self.observe(request, response, time.perf_counter() - started)
+
+    @staticmethod
+    def observe(request, response, duration: float):
+        view = metrics.view_label(request)
+        metrics.REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(duration)
+        stats = getattr(request, 'sql_stats', None)
+        if stats is not None:
+            metrics.REQUEST_QUERIES.labels(view).observe(stats.count)
+            metrics.REQUEST_DB_DURATION.labels(view).observe(stats.duration)
+        return response
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Runs the rest of the request under SamplingProfiler when a staff user asks for it with an
+    ``X-Profile`` header or a ``_profile`` query parameter. Other requests only pay two dict lookups.
+    Async requests are sampled on the event loop, time spent in other threads is not seen
+    """
+    header = 'HTTP_X_PROFILE'
+    query_param = '_profile'
+
+    def flagged(self, request) -> bool:
+        if self.header in request.META:
+            return True
+        return self.query_param in request.META.get('QUERY_STRING', '') and self.query_param in request.GET
+
+    @staticmethod
+    def is_staff(request) -> bool:
+        return request.user.is_authenticated and request.user.is_staff
+
+    def process(self, request):
+        if not self.flagged(request) or not self.is_staff(request):
+            return self.get_response(request)
+
+        profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.save(request, response, profiler, (time.perf_counter() - started) * 1000)
+
+    async def aprocess(self, request):
+        if not self.flagged(request) or not await sync_to_async(self.is_staff)(request):
+            return await self.get_response(request)
+
+        profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        return await sync_to_async(self.save)(request, response, profiler, (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def save(request, response, profiler: SamplingProfiler, duration: float):
+        name = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        title = f'{request.method} {request.get_full_path()} {response.status_code} in {duration:.1f} ms'
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'{name}.collapsed').write_text(profiler.collapsed(), encoding='utf-8')
+        (directory / f'{name}.txt').write_text(profiler.summary(title, settings.PROFILE_TOP), encoding='utf-8')
+
+        profile = RequestProfile.objects.create(
+            user=request.user, method=request.method, path=request.get_full_path(),
+            status=response.status_code, duration_ms=duration, samples=profiler.samples, name=name,
+        )
+        response['X-Profile-Id'] = str(profile.id)
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware resolving request.user through core.auth.get_user(), no query on a warm cache"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: auth.get_user(request))
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('method', models.CharField(max_length=10, verbose_name='method')),
+                ('path', models.TextField(verbose_name='path')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='status')),
+                ('duration_ms', models.FloatField(verbose_name='duration, ms')),
+                ('samples', models.PositiveIntegerField(verbose_name='samples')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='file name')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'Request profile',
+                'verbose_name_plural': 'Request profiles',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -1,3 +1,6 @@
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
@@ -10,3 +13,23 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+
+class RequestProfile(models.Model):
+    """Profile of one staff request, the sampled stacks live in PROFILE_DIR as <name>.collapsed and <name>.txt"""
+    created = models.DateTimeField(verbose_name='created', auto_now_add=True)
+    user = models.ForeignKey(User, verbose_name='user', on_delete=models.CASCADE, related_name='request_profiles')
+    method = models.CharField(verbose_name='method', max_length=10)
+    path = models.TextField(verbose_name='path')
+    status = models.PositiveSmallIntegerField(verbose_name='status')
+    duration_ms = models.FloatField(verbose_name='duration, ms')
+    samples = models.PositiveIntegerField(verbose_name='samples')
+    name = models.CharField(verbose_name='file name', max_length=64, unique=True)
+
+    class Meta:
+        verbose_name = 'Request profile'
+        verbose_name_plural = 'Request profiles'
+        ordering = ['-created']
+
+    def file_path(self, extension: str) -> Path:
+        return Path(settings.PROFILE_DIR) / f'{self.name}.{extension}'
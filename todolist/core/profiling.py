@@ -0,0 +1,66 @@
+import sys
+import threading
+from collections import Counter
+
+
+def frame_label(frame) -> str:
+    return f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_qualname}'
+
+
+class SamplingProfiler:
+    """
+    Stack sampler of one thread driven from a helper thread, stdlib only.
+    Stacks are counted in collapsed form ("outer;inner;leaf"), what flamegraph.pl and speedscope read,
+    starting at the frame that called start() so the server's own frames stay out. Samples whose
+    stack does not reach that frame, an event loop running another task, are dropped
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._root = None
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._root = sys._getframe(1)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                if frame is self._root:
+                    break
+                frame = frame.f_back
+            else:
+                continue
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int) -> list[tuple[str, int, int]]:
+        """(function, self samples, total samples) of the functions seen in the most samples"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            functions = stack.split(';')
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+        return [(function, own[function], count) for function, count in total.most_common(limit)]
+
+    def summary(self, title: str, limit: int) -> str:
+        lines = [title, f'{self.samples} samples every {self.interval * 1000:g} ms', '', '  self  total  function']
+        lines += [f'{own:6d} {count:6d}  {function}' for function, own, count in self.top(limit)]
+        return '\n'.join(lines) + '\n'
@@ -1,9 +1,30 @@
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
 from django.contrib.auth.hashers import make_password
-from django.test import TestCase, Client
-from django.urls import reverse
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX as SESSION_CACHE_PREFIX
+from django.core.cache import cache, caches
+from django.db import connection, connections, OperationalError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, AsyncClient, RequestFactory, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from prometheus_client import REGISTRY
 from rest_framework import status
 
-from core.models import User
+from core.asgi import ASGIHandler
+from core.db.backends.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from core.auth import USER_KEY
+from core.db import routers
+from core.db.pool import ConnectionPool, PoolTimeout, get_pool
+from core.middleware import ReplicaMiddleware, normalize_sql
+from core.models import RequestProfile, User
 
 
 class SignUpTestCase(TestCase):
@@ -405,3 +426,466 @@ class ProfileTestCase(TestCase):
                 'last_name': self.user.last_name,
             }
         )
+
+
+# profile updates copy the profile to the user's shards on top of the budget
+@override_settings(GOAL_SHARDS=['default'])
+class QueryBudgetTestCase(TestCase):
+    """core routes answer in a fixed number of queries whatever the number of users"""
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create_user(username='test_user_name', password='123qwert#!@!3%')
+        User.objects.bulk_create([User(username=f'test_other_user_{index}', password='!') for index in range(50)])
+
+    def assertBudget(self, budget, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, content_type='application/json')
+        self.assertLess(response.status_code, 300, f'{method} {url}')
+        self.assertLessEqual(len(queries), budget, f'{method} {url}')
+
+    def test_anonymous_routes(self):
+        self.assertBudget(0, 'get', reverse('ping'))
+        self.assertBudget(3, 'post', reverse('signup'), {
+            'username': 'test_new_user', 'password': '123qwert#!@!3%', 'password_repeat': '123qwert#!@!3%'
+        })
+        self.assertBudget(10, 'post', reverse('login'), {'username': 'test_user_name', 'password': '123qwert#!@!3%'})
+
+    def test_authenticated_routes(self):
+        self.client.force_login(self.user)
+        self.assertBudget(2, 'get', reverse('profile'))
+        self.assertBudget(3, 'patch', reverse('profile'), {'first_name': 'test_first_name'})
+        self.assertBudget(5, 'patch', reverse('update_password'), {
+            'old_password': '123qwert#!@!3%', 'new_password': 'ntk4j3ht98un;'
+        })
+        self.user.refresh_from_db()
+        self.client.force_login(self.user)
+        self.assertBudget(4, 'delete', reverse('profile'))
+
+
+class CachedAuthTestCase(TestCase):
+    def setUp(self) -> None:
+        # a cache every worker shares, like redis in deploy/
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.settings_override = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir.name
+            }},
+            CACHE_SHARED=True,
+            SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='test_user_name', password='123qwert#!@!3%')
+        self.client.force_login(self.user)
+        self.key = USER_KEY.format(user_id=self.user.id)
+
+    def test_warm_cache_authenticates_without_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_200_OK)
+
+    def test_profile_update_invalidates(self):
+        self.client.get(reverse('profile'))
+        self.client.patch(reverse('profile'), {'first_name': 'new_first_name'}, content_type='application/json')
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.client.get(reverse('profile')).json()['first_name'], 'new_first_name')
+
+    def test_password_change_ends_other_sessions(self):
+        other = Client()
+        other.force_login(self.user)
+        other.get(reverse('profile'))
+
+        response = self.client.patch(reverse('update_password'), {
+            'old_password': '123qwert#!@!3%', 'new_password': 'ntk4j3ht98un;'
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(other.get(reverse('profile')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_logout_invalidates(self):
+        self.client.get(reverse('profile'))
+        self.assertIsNotNone(cache.get(self.key))
+
+        self.assertEqual(self.client.delete(reverse('profile')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_logout_reaches_other_workers(self):
+        other_worker = caches.create_connection('default')
+        session_key = SESSION_CACHE_PREFIX + self.client.session.session_key
+        self.client.get(reverse('profile'))
+        self.assertIsNotNone(other_worker.get(self.key))
+        self.assertIsNotNone(other_worker.get(session_key))
+
+        self.client.delete(reverse('profile'))
+        self.assertIsNone(other_worker.get(self.key))
+        self.assertIsNone(other_worker.get(session_key))
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CACHE_SHARED=False,
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+    )
+    def test_unshared_cache_is_bypassed(self):
+        client = Client()
+        client.force_login(self.user)
+        # session and user from the database on every request
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                self.assertEqual(client.get(reverse('profile')).status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(self.key))
+
+
+class SQLInstrumentationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create_user(username='test_user_name', password='123qwert#!@!3%')
+        self.client.force_login(self.user)
+
+    def test_server_timing_header_counts_queries(self):
+        response = self.client.get(reverse('profile'))
+
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'db', 'db-slowest', 'app', 'total'})
+        self.assertIn('desc="2 queries"', timings['db'])
+
+    @override_settings(SQL_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_normalized_sql(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('profile'))
+
+        self.assertIn('Slow request GET /core/profile 200', logs.output[0])
+        self.assertIn('1x', logs.output[0])
+        self.assertIn('FROM "core_user"', logs.output[0])
+
+    @override_settings(SQL_INSTRUMENTATION=False)
+    def test_instrumentation_can_be_switched_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('profile')))
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT *  FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('metrics')
+
+    def test_metrics_report_latency_per_route(self):
+        self.client.get(reverse('ping'))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",status="200",view="ping/"}', content)
+        self.assertIn('http_request_db_queries_bucket{le="0.0",view="ping/"}', content)
+        self.assertIn('http_requests_in_flight', content)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'], METRICS_TOKEN='test_token')
+    def test_metrics_need_allowed_address_or_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.1.2.3').status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_AUTHORIZATION='Bearer test_token').status_code, status.HTTP_200_OK
+        )
+        self.assertEqual(
+            self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN
+        )
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self) -> None:
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.settings_override = override_settings(PROFILE_DIR=self.profile_dir.name, PROFILE_INTERVAL_MS=1)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.client = Client()
+        self.staff = User.objects.create_user(
+            username='test_staff', password='123qwert#!@!3%', is_staff=True, is_superuser=True
+        )
+        self.user = User.objects.create_user(username='test_user_name', password='123qwert#!@!3%')
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.staff)
+
+        response = self.client.get(reverse('profile'), {'_profile': 1})
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.user, profile.method, profile.status), (self.staff, 'GET', 200))
+        self.assertEqual(profile.path, '/core/profile?_profile=1')
+        self.assertIn('GET /core/profile?_profile=1 200', profile.file_path('txt').read_text())
+        self.assertTrue(profile.file_path('collapsed').exists())
+
+        admin_list = self.client.get(reverse('admin:core_requestprofile_changelist'))
+        self.assertContains(admin_list, profile.name)
+        download = self.client.get(reverse('admin:core_requestprofile_collapsed', args=[profile.pk]))
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+
+    def test_header_works_too(self):
+        self.client.force_login(self.staff)
+
+        response = self.client.get(reverse('profile'), HTTP_X_PROFILE='1')
+
+        self.assertTrue(RequestProfile.objects.filter(pk=response['X-Profile-Id']).exists())
+
+    async def test_async_request_is_profiled(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.staff)
+
+        response = await client.get(reverse('goal-list'), {'_profile': 1})
+
+        profile = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.method, profile.status), ('GET', 200))
+
+    def test_other_requests_are_not_profiled(self):
+        self.client.force_login(self.user)
+
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('profile'), {'_profile': 1}))
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('profile')))
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class PooledDatabaseMixin:
+    """
+    The rest of the test, in this thread and the ones it starts, runs on a pooled file copy of the test database.
+    The in-memory SQLite database the tests run on is never pooled. Rows are copied as committed so far,
+    use it from a TransactionTestCase
+    """
+
+    def use_pooled_database(self, size: int = 1) -> ConnectionPool:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = str(Path(directory.name) / 'pooled.sqlite3')
+        connection.ensure_connection()
+        copy = sqlite3.connect(path)
+        connection.connection.backup(copy)
+        copy.close()
+
+        settings_dict = {
+            **connections.settings['default'], 'NAME': path,
+            'POOL': {'SIZE': size, 'TIMEOUT': 0.5, 'RECYCLE': 0, 'PING_AFTER': 0},
+        }
+        patcher = mock.patch.dict(connections.settings, {'default': settings_dict})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pool = get_pool('default', settings_dict)
+        self.addCleanup(pool.drain)
+
+        original = connections['default']
+        del connections['default']
+
+        def restore():
+            connections['default'].close()
+            connections['default'] = original
+
+        self.addCleanup(restore)
+        return pool
+
+    @staticmethod
+    def in_use() -> float:
+        return REGISTRY.get_sample_value('db_pool_connections', {'alias': 'default', 'state': 'in_use'})
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.opened = []
+
+    def connect(self):
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.opened.append(connection)
+        return connection
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool('test', size=2, timeout=1, recycle=0, ping_after=0)
+
+        first = pool.checkout(self.connect)
+        pool.checkin(first)
+        self.assertIs(pool.checkout(self.connect), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_checkout_waits_for_a_free_connection_then_times_out(self):
+        pool = ConnectionPool('test', size=1, timeout=0.05, recycle=0, ping_after=0)
+        first = pool.checkout(self.connect)
+
+        with self.assertRaises(PoolTimeout), self.assertLogs('core.db.pool', 'WARNING') as logs:
+            pool.checkout(self.connect)
+        self.assertIn(f'held by: {threading.current_thread().name} for 0 s', logs.output[0])
+
+        pool.timeout = 5
+        threading.Timer(0.05, pool.checkin, [first]).start()
+        self.assertIs(pool.checkout(self.connect), first)
+        self.assertEqual(pool.open, 1)
+
+    def test_broken_recycled_and_discarded_connections_are_replaced(self):
+        pool = ConnectionPool('test', size=1, timeout=0.05, recycle=0, ping_after=0)
+        broken = pool.checkout(self.connect)
+        pool.checkin(broken)
+        broken.close()
+        replacement = pool.checkout(self.connect)
+        self.assertIsNot(replacement, broken)
+
+        pool.checkin(replacement, reusable=False)
+        self.assertEqual(pool.open, 0)
+        fresh = pool.checkout(self.connect)
+
+        pool.recycle = 0.01
+        pool.checkin(fresh)
+        threading.Event().wait(0.02)
+        self.assertIsNot(pool.checkout(self.connect), fresh)
+        self.assertEqual((len(self.opened), pool.open), (4, 1))
+
+
+    def test_connections_of_ended_threads_are_reclaimed(self):
+        pool = ConnectionPool('test', size=1, timeout=5, recycle=0, ping_after=0)
+        holder = threading.Thread(target=pool.checkout, args=[self.connect], name='test_holder')
+        holder.start()
+        holder.join()
+
+        with self.assertLogs('core.db.pool', 'WARNING') as logs:
+            replacement = pool.checkout(self.connect)
+        self.assertIn('left open by thread test_holder', logs.output[0])
+        self.assertIsNot(replacement, self.opened[0])
+        self.assertEqual(pool.open, 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.opened[0].execute('SELECT 1')
+
+
+def stream_usernames(request):
+    def lines():
+        while True:
+            yield f'{User.objects.count()}\n'
+
+    return StreamingHttpResponse(lines())
+
+
+urlpatterns = [path('stream', stream_usernames)]
+
+
+@override_settings(ROOT_URLCONF='core.tests')
+class PooledStreamingTestCase(PooledDatabaseMixin, TransactionTestCase):
+    async def test_abandoned_stream_returns_its_connection(self):
+        pool = await sync_to_async(self.use_pooled_database)()
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http', 'method': 'GET', 'path': '/stream', 'query_string': b'', 'headers': [],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        self.assertEqual((await communicator.receive_output(5))['status'], status.HTTP_200_OK)
+        self.assertEqual((await communicator.receive_output(5))['body'], b'0\n')
+        self.assertEqual(self.in_use(), 1)
+
+        # the client went away, the server cancels the application
+        await communicator.wait(0.1)
+        self.assertTrue(communicator.future.cancelled())
+        self.assertEqual(self.in_use(), 0)
+        self.assertEqual(pool.open, 1)
+
+
+class PooledBackendTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = {
+            **connection.settings_dict,
+            'ENGINE': 'core.db.backends.sqlite3',
+            'NAME': str(Path(directory.name) / 'pool.sqlite3'),
+            'POOL': {'SIZE': 1, 'TIMEOUT': 0.05, 'RECYCLE': 0, 'PING_AFTER': 0},
+        }
+
+    def wrapper(self):
+        wrapper = PooledSQLiteWrapper(self.settings_dict, alias='pool_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_wrappers_share_pooled_connections(self):
+        first, second = self.wrapper(), self.wrapper()
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TABLE test_pool (id integer)')
+        raw = first.connection
+
+        # the only connection is taken
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+
+        first.close()
+        reused = REGISTRY.get_sample_value('db_pool_events_total', {'alias': 'pool_test', 'event': 'reused'}) or 0
+        with second.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM test_pool')
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertIs(second.connection, raw)
+        self.assertEqual(
+            REGISTRY.get_sample_value('db_pool_events_total', {'alias': 'pool_test', 'event': 'reused'}), reused + 1
+        )
+
+    def test_connections_closed_after_errors_are_not_reused(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.errors_occurred = True
+        first.close()
+
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIsNot(second.connection, raw)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], DATABASE_PIN_SECONDS=5)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def view(self, write=False):
+        def get_response(request):
+            self.seen.append(self.router.db_for_read(User))
+            with routers.use_primary():
+                self.seen.append(self.router.db_for_read(User))
+            if write:
+                self.seen.append(self.router.db_for_write(User))
+            return HttpResponse()
+        return ReplicaMiddleware(get_response)
+
+    def test_safe_requests_read_from_a_replica(self):
+        response = self.view()(self.factory.get('/'))
+
+        self.assertEqual(self.seen, ['replica_0', 'default'])
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+        # outside requests everything goes to the primary
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.view(write=True)(self.factory.post('/'))
+        self.assertEqual(self.seen, ['default', 'default', 'default'])
+        cookie = response.cookies[ReplicaMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 5)
+
+        self.seen.clear()
+        request = self.factory.get('/')
+        request.COOKIES[ReplicaMiddleware.cookie_name] = cookie.value
+        self.view()(request)
+        self.assertEqual(self.seen, ['default', 'default'])
+
+    def test_expired_or_invalid_pins_are_ignored(self):
+        for value in ('1', 'abc'):
+            request = self.factory.get('/')
+            request.COOKIES[ReplicaMiddleware.cookie_name] = value
+            self.view()(request)
+        self.assertEqual(self.seen, ['replica_0', 'default'] * 2)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_no_pins(self):
+        response = self.view(write=True)(self.factory.get('/'))
+        self.assertEqual(self.seen, ['default', 'default', 'default'])
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework import status
@@ -8,6 +9,7 @@ from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView,
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from . import metrics as prometheus
 from .models import User
 from .serializers import SignUpSerializer, LoginSerializer, RetrieveUpdateSerializer, PasswordUpdateSerializer
 
@@ -18,6 +20,14 @@ def ping(request):
     return Response(status=status.HTTP_200_OK, data={'status': 'alive'})
 
 
+# Prometheus scrape target
+def metrics(request):
+    if not prometheus.allowed(request, settings.METRICS_TOKEN, settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    content, content_type = prometheus.exposition()
+    return HttpResponse(content, content_type=content_type)
+
+
 class SignUpView(CreateAPIView):
     serializer_class = SignUpSerializer
 
@@ -9,4 +9,10 @@ if [[ $status != 0 ]]; then
   python manage.py migrate
 fi
 
+# metrics of the previous run's workers must not be summed into this one
+if [[ -n $PROMETHEUS_MULTIPROC_DIR ]]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec "$@"
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from goals.models import GoalCategory, Goal, GoalComment
+from goals.models import GoalCategory, Goal, GoalComment, CascadeJob
 
 
 @admin.register(GoalCategory)
@@ -16,7 +16,7 @@ class GoalCategoryAdmin(admin.ModelAdmin):
 class GoalAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'user', 'category', 'due_date', 'status', 'priority']
     search_fields = ['title', 'user']
-    readonly_fields = ['created', 'updated']
+    readonly_fields = ['created', 'updated', 'board']
     list_display_links = ['id', 'title']
     list_filter = ['created', 'updated', 'due_date']
 
@@ -25,3 +25,10 @@ class GoalAdmin(admin.ModelAdmin):
 class GoalCommentAdmin(admin.ModelAdmin):
     list_display = ['user', 'text']
     readonly_fields = ['created', 'updated']
+
+
+@admin.register(CascadeJob)
+class CascadeJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'target_id', 'user', 'status', 'processed', 'total', 'updated']
+    readonly_fields = ['created', 'updated', 'last_goal_id', 'processed', 'total']
+    list_filter = ['kind', 'status']
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class GoalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goals'
+
+    def ready(self):
+        from goals import signals  # noqa: F401
+        from goals.search import repair_sqlite_triggers
+
+        post_migrate.connect(repair_sqlite_triggers, sender=self)
@@ -0,0 +1,57 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from goals import sharding
+from goals.models import CascadeJob, GoalCategory, Goal
+
+
+def process_next_chunk(chunk_size: int) -> CascadeJob | None:
+    """
+    Archive the next id-range chunk of the oldest unfinished job in one short transaction.
+    The job row is locked (SKIP LOCKED) for the chunk only, progress is committed with it,
+    so any number of workers can share the queue and an interrupted job resumes where it stopped.
+    """
+    with transaction.atomic():
+        job = CascadeJob.objects.select_for_update(skip_locked=True).exclude(
+            status=CascadeJob.Status.done
+        ).order_by('id').first()
+        if job is None:
+            return None
+
+        try:
+            goals = job.goals(job_shard(job))
+        except sharding.BoardMoving:
+            # the queue waits for the move, goals archived on the old database would be lost
+            return None
+        if job.total is None:
+            job.total = goals.exclude(status=Goal.Status.archived).count()
+            job.status = CascadeJob.Status.running
+
+        remaining = goals.filter(id__gt=job.last_goal_id)
+        bound = list(remaining.order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size])
+        chunk = remaining.filter(id__lte=bound[0]) if bound else remaining
+
+        job.processed += chunk.exclude(status=Goal.Status.archived).update(status=Goal.Status.archived)
+        if bound:
+            job.last_goal_id = bound[0]
+        else:
+            job.status = CascadeJob.Status.done
+        job.save()
+
+    return job
+
+
+def job_shard(job: CascadeJob) -> str:
+    """Database of the job's goals, looked up on every chunk: the board may move while the job runs"""
+    if not sharding.sharded():
+        return DEFAULT_DB_ALIAS
+    board_id = job.target_id
+    if job.kind == CascadeJob.Kind.category:
+        board_id = sharding.locate(
+            GoalCategory.objects.using(alias).filter(pk=job.target_id).values_list('board_id', flat=True)
+            for alias in sharding.shards_in_use()
+        )
+    return sharding.writable_shard(board_id)
+
+
+def queue_cascade(kind: str, target_id: int, user) -> CascadeJob:
+    return CascadeJob.objects.create(kind=kind, target_id=target_id, user=user)
@@ -0,0 +1,120 @@
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from goals import sharding
+from goals.models import Goal, GoalCounter
+
+KEY_FIELDS = ('board_id', 'category_id', 'status', 'priority')
+KEY_ALIASES = {'board': 'board_id', 'category': 'category_id'}
+OPEN_STATUSES = (Goal.Status.to_do, Goal.Status.in_progress)
+
+
+def counter_key(goal) -> tuple:
+    return tuple(getattr(goal, name) for name in KEY_FIELDS)
+
+
+def group(queryset) -> dict[tuple, int]:
+    """Goal counts of the queryset grouped by counter key"""
+    rows = queryset.order_by().values(*KEY_FIELDS).annotate(goals=Count('id'))
+    return {tuple(row[name] for name in KEY_FIELDS): row['goals'] for row in rows}
+
+
+def diff(before: dict[tuple, int], after: dict[tuple, int]) -> Counter:
+    deltas = Counter()
+    for key in before.keys() | after.keys():
+        deltas[key] = after.get(key, 0) - before.get(key, 0)
+    return deltas
+
+
+def normalize_update(values: dict) -> dict | None:
+    """Counter relevant part of QuerySet.update() kwargs, None when a value is an expression"""
+    normalized = {}
+    for name, value in values.items():
+        name = KEY_ALIASES.get(name, name)
+        if name not in KEY_FIELDS:
+            continue
+        if hasattr(value, 'resolve_expression'):
+            return None
+        normalized[name] = getattr(value, 'pk', value)
+    return normalized
+
+
+def update_deltas(before: dict[tuple, int], values: dict) -> Counter:
+    after = Counter()
+    for key, goals in before.items():
+        after[tuple(values.get(name, old) for name, old in zip(KEY_FIELDS, key))] += goals
+    return diff(before, after)
+
+
+def apply_deltas(deltas: Counter, using: str = DEFAULT_DB_ALIAS):
+    """Counters live on the database of their goals, ``using``"""
+    counters = GoalCounter.objects.using(using)
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(KEY_FIELDS, key))
+        if counters.filter(**lookup).update(count=F('count') + delta) or delta < 0:
+            # a missing row on decrement means its board/category is being deleted with it
+            continue
+        try:
+            with transaction.atomic(using=using):
+                counters.create(count=delta, **lookup)
+        except IntegrityError:
+            counters.filter(**lookup).update(count=F('count') + delta)
+
+
+def rebuild(board_ids=None, dry_run=False, using: str = DEFAULT_DB_ALIAS) -> list[tuple[tuple, int, int]]:
+    """Recount counters of one database from its goals table, returns drift as (key, stored, actual)"""
+    goals = Goal.objects.using(using)
+    counters = GoalCounter.objects.using(using)
+    if board_ids is not None:
+        goals = goals.filter(board_id__in=board_ids)
+        counters = counters.filter(board_id__in=board_ids)
+
+    with transaction.atomic(using=using):
+        actual = group(goals)
+        stored = {tuple(row[:-1]): row[-1] for row in counters.values_list(*KEY_FIELDS, 'count')}
+        drift = [
+            (key, stored.get(key, 0), actual.get(key, 0))
+            for key in sorted(stored.keys() | actual.keys())
+            if stored.get(key, 0) != actual.get(key, 0)
+        ]
+        if drift and not dry_run:
+            counters.delete()
+            GoalCounter.objects.using(using).bulk_create(
+                [GoalCounter(count=count, **dict(zip(KEY_FIELDS, key))) for key, count in actual.items()],
+                batch_size=1000,
+            )
+    return drift
+
+
+def board_stats(board) -> dict:
+    counters, goals = GoalCounter.objects.all(), Goal.objects.all()
+    if sharding.sharded():
+        alias = sharding.shard_of(board.id)
+        counters, goals = counters.using(alias), goals.using(alias)
+
+    by_status, by_priority, by_category = Counter(), Counter(), {}
+    rows = counters.filter(board=board, count__gt=0).values_list(
+        'category_id', 'category__title', 'category__is_deleted', 'status', 'priority', 'count'
+    )
+    for category_id, title, is_deleted, status, priority, count in rows:
+        by_status[status] += count
+        by_priority[priority] += count
+        if not is_deleted:
+            by_category.setdefault(category_id, {'category': category_id, 'title': title, 'count': 0})
+            by_category[category_id]['count'] += count
+
+    overdue = goals.filter(board=board, status__in=OPEN_STATUSES, due_date__lt=timezone.now()).count()
+
+    return {
+        'board': board.id,
+        'total': sum(by_status.values()),
+        'by_status': [{'status': status, 'count': count} for status, count in sorted(by_status.items())],
+        'by_priority': [{'priority': priority, 'count': count} for priority, count in sorted(by_priority.items())],
+        'by_category': sorted(by_category.values(), key=lambda row: row['title']),
+        'overdue': overdue,
+    }
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import re
+import select
+import threading
+import time
+from collections import defaultdict
+from functools import cache
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.http import parse_cookie
+from django.utils.module_loading import import_string
+
+from goals.roles import get_board_role
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = re.compile(r'^/goals/board/(?P<pk>\d+)/events/?$')
+RESYNC = {'event': 'resync'}
+
+
+class Hub:
+    """Fan-out of board events to the event streams open in this process"""
+
+    def __init__(self):
+        self.loop = None
+        self.subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, board_id: int) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.subscribers[board_id].add(queue)
+        return queue
+
+    def unsubscribe(self, board_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(board_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[board_id]
+
+    def dispatch(self, event: dict):
+        """Runs in the event loop thread"""
+        for queue in self.subscribers.get(event['board'], ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # a stalled client resyncs through goals/sync instead of buffering without bound
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def dispatch_threadsafe(self, event: dict):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.dispatch, event)
+
+
+hub = Hub()
+
+
+class BaseBroker:
+    """Carries published events to the hub of every process serving event streams"""
+
+    def start(self, hub: Hub):
+        raise NotImplementedError
+
+    def publish(self, event: dict):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """Single process deployments: events go straight to this process' hub"""
+
+    def __init__(self):
+        self.hub = None
+
+    def start(self, hub: Hub):
+        self.hub = hub
+
+    def publish(self, event: dict):
+        if self.hub is not None:
+            self.hub.dispatch_threadsafe(event)
+
+
+class PostgresBroker(BaseBroker):
+    """
+    LISTEN/NOTIFY on the main database, so writes from any worker, the bot or
+    the cascade runner reach streams held by other processes
+    """
+    channel = 'goals_events'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, hub: Hub):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, args=(hub,), name='goals-events', daemon=True)
+                self._thread.start()
+
+    def publish(self, event: dict):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps(event)])
+
+    def _listen(self, hub: Hub):
+        while True:
+            try:
+                self._consume(hub)
+            except Exception:
+                logger.exception('Board events listener failed, reconnecting')
+                time.sleep(1)
+
+    def _consume(self, hub: Hub):
+        import psycopg2
+
+        wrapper = connections['default']
+        conn = psycopg2.connect(**wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            while True:
+                if select.select([conn], [], [], settings.EVENTS_HEARTBEAT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    hub.dispatch_threadsafe(json.loads(conn.notifies.pop(0).payload))
+        finally:
+            conn.close()
+
+
+@cache
+def get_broker() -> BaseBroker:
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def publish(board_id: int, model: str, object_id: int, action: str, using: str = DEFAULT_DB_ALIAS, **extra):
+    """Announce a change once the transaction on ``using``, the database it was written to, commits"""
+    event = {'board': board_id, 'model': model, 'id': object_id, 'action': action, **extra}
+    transaction.on_commit(lambda: get_broker().publish(event), using=using)
+
+
+def get_scope_user(scope):
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies = parse_cookie(value.decode('latin-1'))
+    engine = import_string(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME)))
+    return get_user(request)
+
+
+def authorize(scope, board_id: int):
+    """
+    The scope's user and their role on the board. Runs outside Django's request handling, so connections
+    are checked and handed back to the pool here, like request_started and request_finished would
+    """
+    close_old_connections()
+    try:
+        user = get_scope_user(scope)
+        return user, get_board_role(user, board_id) if user.is_authenticated else None
+    finally:
+        connections.close_all()
+
+
+def format_event(event: dict) -> bytes:
+    if event is RESYNC:
+        return b'event: resync\ndata: {}\n\n'
+    return f'data: {json.dumps(event)}\n\n'.encode()
+
+
+async def send_json(send, status: int, data: dict):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_board_events(board_id: int, scope, receive, send):
+    if scope['method'] != 'GET':
+        return await send_json(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'})
+
+    user, role = await sync_to_async(authorize)(scope, board_id)
+    if not user.is_authenticated:
+        return await send_json(send, 403, {'detail': 'Authentication credentials were not provided.'})
+    if role is None:
+        return await send_json(send, 404, {'detail': 'Not found.'})
+
+    queue = hub.subscribe(board_id)
+    get_broker().start(hub)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, disconnected}, timeout=settings.EVENTS_HEARTBEAT,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                getter.cancel()
+                return
+            if not getter.done():
+                getter.cancel()
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+
+            event = getter.result()
+            await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+            revoked = event.get('model') == 'participant' and event.get('user') == user.id \
+                and event['action'] == 'deleted'
+            if event is RESYNC or revoked:
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(board_id, queue)
+
+
+class BoardEventsApplication:
+    """Serves board event streams without a worker thread per connection, the rest goes to Django"""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = EVENTS_PATH.match(scope['path']) if scope['type'] == 'http' else None
+        if match is None:
+            return await self.application(scope, receive, send)
+        await stream_board_events(int(match['pk']), scope, receive, send)
@@ -0,0 +1,175 @@
+from functools import cache
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from goals import sharding
+from goals.pagination import KeysetPagination
+from goals.renderers import FastJSONRenderer
+
+# representation of these fields is the database value itself
+IDENTITY_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class DateTimeConverter:
+    """DateTimeField.to_representation() with the current timezone looked up once per response, not per value"""
+
+    def __init__(self, field):
+        self.field = field
+
+    @staticmethod
+    def supports(field) -> bool:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return output_format is not None and output_format.lower() == ISO_8601 and not hasattr(field, 'timezone')
+
+    def bind(self):
+        field = self.field
+        field_timezone = field.default_timezone()
+        if field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if isinstance(value, str) or value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+        return convert
+
+
+class FastRowSerializer:
+    """
+    Read-only twin of a ModelSerializer built from its own fields: rows are fetched with
+    values_list() and converted by a precompiled plan, no model instances and no per-field
+    get_attribute() calls. Fields it can not reproduce exactly raise ImproperlyConfigured
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.columns = []
+        self.plan = self.compile(serializer_class(), prefix='')
+
+    @classmethod
+    @cache
+    def for_serializer(cls, serializer_class):
+        return cls(serializer_class)
+
+    def column(self, name) -> int:
+        if name not in self.columns:
+            self.columns.append(name)
+        return self.columns.index(name)
+
+    def compile(self, serializer, prefix) -> list[tuple]:
+        """(key, column index, converter, nested plan) for every readable field, in output order"""
+        plan = []
+        for field in serializer._readable_fields:
+            if field.source == '*' or '.' in field.source or isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{field.field_name} is not a plain column')
+
+            if isinstance(field, serializers.ModelSerializer):
+                nested = self.compile(field, prefix=f'{prefix}{field.source}__')
+                pk_name = field.Meta.model._meta.pk.name
+                plan.append((field.field_name, self.column(f'{prefix}{field.source}__{pk_name}'), None, nested))
+                continue
+
+            if isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{field.field_name} is not a plain column')
+
+            name = field.source
+            model_field = self.model_field(serializer, name)
+            if model_field is not None and model_field.is_relation:
+                name = model_field.attname
+            if isinstance(field, IDENTITY_FIELDS):
+                converter = None
+            elif isinstance(field, serializers.DateTimeField) and DateTimeConverter.supports(field):
+                converter = DateTimeConverter(field)
+            else:
+                converter = field.to_representation
+            plan.append((field.field_name, self.column(f'{prefix}{name}'), converter, None))
+        return plan
+
+    @staticmethod
+    def model_field(serializer, name):
+        meta = getattr(serializer, 'Meta', None)
+        if meta is None:
+            return None
+        try:
+            return meta.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None  # annotation
+
+    def rows(self, queryset):
+        """Named rows, so keyset pagination can read the ordering columns off them"""
+        extra = [name for name in queryset.query.annotations if name not in self.columns]
+        return queryset.values_list(*[*self.columns, *extra], named=True)
+
+    def to_representation(self, rows) -> list[dict]:
+        plan, build = self.bind(self.plan), self.build
+        return [build(plan, row) for row in rows]
+
+    @classmethod
+    def bind(cls, plan) -> list[tuple]:
+        """Resolve per response converters, like the timezone of datetimes"""
+        return [
+            (key, index, converter.bind() if isinstance(converter, DateTimeConverter) else converter,
+             nested and cls.bind(nested))
+            for key, index, converter, nested in plan
+        ]
+
+    @classmethod
+    def build(cls, plan, row) -> dict:
+        data = {}
+        for key, index, converter, nested in plan:
+            value = row[index]
+            if value is None:
+                data[key] = None
+            elif nested is not None:
+                data[key] = cls.build(nested, row)
+            elif converter is None:
+                data[key] = value
+            else:
+                data[key] = converter(value)
+        return data
+
+
+class FastListMixin:
+    """list() through FastRowSerializer and FastJSONRenderer, same bytes as the serializer_class path"""
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    fast_list = True
+    # read the databases of the user's boards once boards are moved off the default one,
+    # the paginator needs a paginate_shards()
+    sharded = False
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+
+        serializer = FastRowSerializer.for_serializer(self.get_serializer_class())
+        queryset = serializer.rows(self.filter_queryset(self.get_queryset()))
+        if self.sharded and sharding.sharded():
+            shards = sharding.user_shards(request.user)
+            if len(shards) > 1:
+                return self.list_shards(serializer, queryset, shards)
+            queryset = queryset.using(shards[0])
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
+
+    def list_shards(self, serializer, queryset, shards):
+        page = self.paginator.paginate_shards(queryset, shards, self.request, view=self)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        keys = KeysetPagination().get_keys(self.request, queryset, self)
+        rows = sharding.gather(queryset.order_by(*[key.order_by() for key in keys]), keys, shards)
+        return Response(serializer.to_representation(rows))
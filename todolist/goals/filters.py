@@ -1,8 +1,11 @@
+from functools import cache
+
 import django_filters
 from django.db import models
 from django_filters import rest_framework
 
-from goals.models import Goal
+from goals import sharding
+from goals.models import Goal, GoalComment
 
 
 class GoalDateFilter(rest_framework.FilterSet):
@@ -18,3 +21,41 @@ class GoalDateFilter(rest_framework.FilterSet):
     filter_overrides = {
         models.DateTimeField: {"filter_class": django_filters.IsoDateTimeFilter},
     }
+
+
+class GoalCommentFilter(rest_framework.FilterSet):
+    class Meta:
+        model = GoalComment
+        fields = ['goal']
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
+@cache
+def sharded_filterset(filterset_class):
+    """
+    filterset_class with foreign keys to sharded models filtered by id: their choices would be
+    looked up on the default database only, rows of moved boards are not there
+    """
+    filters = {}
+    for name, model_filter in filterset_class.base_filters.items():
+        if isinstance(model_filter, django_filters.ModelChoiceFilter) \
+                and model_filter.queryset.model in sharding.SHARDED_MODELS:
+            filter_class = NumberInFilter if isinstance(model_filter, django_filters.BaseInFilter) \
+                else django_filters.NumberFilter
+            filters[name] = filter_class(field_name=model_filter.field_name, lookup_expr=model_filter.lookup_expr)
+    if not filters:
+        return filterset_class
+    return type(f'Sharded{filterset_class.__name__}', (filterset_class,), filters)
+
+
+class ShardedFilterBackend(rest_framework.DjangoFilterBackend):
+    """DjangoFilterBackend filtering through sharded_filterset() once GOAL_SHARDS lists several databases"""
+
+    def get_filterset_class(self, view, queryset=None):
+        filterset_class = super().get_filterset_class(view, queryset)
+        if filterset_class is None or not sharding.sharded():
+            return filterset_class
+        return sharded_filterset(filterset_class)
@@ -0,0 +1,146 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from goals import events, sharding
+from goals.models import Goal, GoalCategory
+from goals.permissions import WRITE_ROLES
+from goals.roles import get_role_map
+from goals.serializers import GoalImportRowSerializer
+
+
+def unreadable(number: int, exc: Exception):
+    return number, None, {'non_field_errors': [f'unreadable input, import stopped: {exc}']}
+
+
+def csv_rows(lines):
+    """Header row names the columns, empty cells count as missing so defaults apply"""
+    number = 0
+    try:
+        for row in csv.DictReader(lines):
+            number += 1
+            yield number, {key: value for key, value in row.items() if key is not None and value != ''}, None
+    except (csv.Error, UnicodeDecodeError) as exc:
+        yield unreadable(number + 1, exc)
+
+
+def ndjson_rows(lines):
+    number = 0
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield number, None, {'non_field_errors': ['invalid JSON']}
+                continue
+            if not isinstance(data, dict):
+                yield number, None, {'non_field_errors': ['expected a JSON object']}
+                continue
+            yield number, data, None
+    except UnicodeDecodeError as exc:
+        yield unreadable(number + 1, exc)
+
+
+# every reader yields (row number, data, parse errors)
+FORMATS = {
+    'csv': csv_rows,
+    'ndjson': ndjson_rows,
+}
+
+
+def import_format(filename: str, default='ndjson') -> str:
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'jsonl':
+        return 'ndjson'
+    return extension if extension in FORMATS else default
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def error(self, number: int, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def as_dict(self) -> dict:
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_batch(user, batch, report: ImportReport):
+    """Validate a batch, resolve its categories and the user's roles once and insert it with one bulk_create"""
+    valid = []
+    for number, data, errors in batch:
+        if errors:
+            report.error(number, errors)
+            continue
+        row = GoalImportRowSerializer(data=data)
+        if row.is_valid():
+            valid.append((number, row.validated_data))
+        else:
+            report.error(number, row.errors)
+
+    writable_boards = [board_id for board_id, role in get_role_map(user.id).items() if role in WRITE_ROLES]
+    shards = list(sharding.by_shard(writable_boards))
+    categories = {}
+    for alias in shards:
+        categories.update(GoalCategory.objects.using(alias).filter(
+            id__in={data['category'] for _, data in valid}, board_id__in=writable_boards, is_deleted=False
+        ).in_bulk())
+
+    now = timezone.now()
+    goals = []
+    for number, data in valid:
+        category = categories.get(data['category'])
+        if category is None:
+            report.error(number, {'category': ['category not found or not writable']})
+            continue
+        goals.append(Goal(
+            title=data['title'],
+            description=data.get('description'),
+            category=category,
+            board_id=category.board_id,
+            status=data.get('status', Goal.Status.to_do),
+            priority=data.get('priority', Goal.Priority.medium),
+            due_date=data.get('due_date'),
+            user=user,
+            created=now,
+            updated=now,
+        ))
+
+    for alias in shards:
+        # goals go to the database of their category, a batch spanning shards commits on each of them
+        with transaction.atomic(using=alias):
+            shard_goals = Goal.objects.using(alias).bulk_create(
+                [goal for goal in goals if goal.category._state.db == alias]
+            )
+            for goal in shard_goals:
+                events.publish(goal.board_id, 'goal', goal.id, 'created', using=alias)
+    report.created += len(goals)
+
+
+def import_goals(user, lines, import_format: str, batch_size: int, max_errors: int) -> dict:
+    """
+    Rows are read lazily from ``lines`` and committed batch by batch: a bad row is reported,
+    not fatal, and memory stays flat whatever the file size
+    """
+    report = ImportReport(max_errors)
+    rows = FORMATS[import_format](lines)
+    while batch := list(islice(rows, batch_size)):
+        import_batch(user, batch, report)
+    return report.as_dict()
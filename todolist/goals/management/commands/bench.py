@@ -0,0 +1,340 @@
+import itertools
+import json
+import math
+import platform
+import time
+from functools import cached_property
+from typing import Callable, NamedTuple
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+from django.test.client import MULTIPART_CONTENT
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import User
+from goals.cascades import queue_cascade
+from goals.models import Board, BoardParticipant, CascadeJob, GoalCategory, Goal, GoalComment
+
+IMPORT_ROWS = 20
+
+
+class Endpoint(NamedTuple):
+    name: str
+    method: str
+    path: str
+    data: dict | None = None
+    # prepare(client) -> (client, path, data) of the next request, called outside the measurement. For writes
+    # that need a fresh object every time, like deletes, or another client, like signup and login
+    prepare: Callable | None = None
+    content_type: str = 'application/json'
+
+
+class Scratch:
+    """Objects of the benchmarked user that write endpoints change or delete, created inside the rollback"""
+
+    def __init__(self, user):
+        self.user = user
+        self.serial = itertools.count()
+        self.password = self.next_password()
+
+    def next_password(self) -> str:
+        return f'Lantern-Travel-{next(self.serial)}'
+
+    def new_board(self) -> Board:
+        board = Board.objects.create(title='bench')
+        BoardParticipant.objects.create(board=board, user=self.user, role=BoardParticipant.Role.owner)
+        return board
+
+    def new_category(self) -> GoalCategory:
+        return GoalCategory.objects.create(title='bench', user=self.user, board=self.board)
+
+    def new_goal(self) -> Goal:
+        return Goal.objects.create(title='bench', category=self.category, user=self.user)
+
+    def new_comment(self) -> GoalComment:
+        return GoalComment.objects.create(goal=self.goal, user=self.user, text='bench')
+
+    @cached_property
+    def board(self) -> Board:
+        return self.new_board()
+
+    @cached_property
+    def category(self) -> GoalCategory:
+        return self.new_category()
+
+    @cached_property
+    def goal(self) -> Goal:
+        return self.new_goal()
+
+    @cached_property
+    def comment(self) -> GoalComment:
+        return self.new_comment()
+
+    @cached_property
+    def job(self) -> CascadeJob:
+        return queue_cascade(CascadeJob.Kind.category, self.category.id, self.user)
+
+    @cached_property
+    def account(self) -> User:
+        """Another user with a known password, for login and password changes"""
+        return User.objects.create_user(username=f'bench_scratch_{self.user.id}', password=self.password)
+
+    def account_client(self) -> Client:
+        client = Client()
+        # the session carries a hash of the password, update-password changes it
+        self.account.refresh_from_db(fields=['password'])
+        client.force_login(self.account)
+        return client
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Nearest rank percentile of already sorted values"""
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def count_rows(response) -> int:
+    if response.streaming:
+        return b''.join(response.streaming_content).count(b'\n')
+    if not response.content:
+        return 0
+    data = response.json()
+    if isinstance(data, list):
+        return len(data)
+    # paginated results, bulk results or the collections of a sync page
+    lists = [value for value in data.values() if isinstance(value, list)]
+    return sum(len(value) for value in lists) if lists else 1
+
+
+class QueryCounter:
+    """connection.execute_wrapper() hook, cheaper than CaptureQueriesContext's SQL log"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive every API endpoint in-process as a seeded user and report latency percentiles as JSON. '
+        'Writes are rolled back, the SSE board events stream served in front of Django is not driven'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark as this user, by default the busiest seed_bench user')
+        parser.add_argument('--prefix', default='bench', help='seed_bench username prefix')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint')
+        parser.add_argument('--limit', type=int, default=100, help='Page size of list endpoints')
+        parser.add_argument('--only', action='append', default=[], help='Endpoint name to run, repeatable')
+        parser.add_argument('--output', help='JSON file to write, stdout by default')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options)
+        endpoints = self.endpoints(user, options['limit'])
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint.name in options['only']]
+            if not endpoints:
+                raise CommandError(f'No endpoint named {", ".join(options["only"])}')
+
+        client = Client()
+        client.force_login(user)
+        results = []
+        with transaction.atomic():
+            for endpoint in endpoints:
+                results.append(self.measure(client, endpoint, options['requests'], options['warmup']))
+            # writes done by the benchmark never outlive it
+            transaction.set_rollback(True)
+
+        report = json.dumps({
+            'started': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'user': user.username,
+            'requests': options['requests'],
+            'limit': options['limit'],
+            'endpoints': results,
+        }, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    @staticmethod
+    def get_user(options) -> User:
+        if options['username']:
+            try:
+                return User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["username"]}" does not exist')
+
+        user = User.objects.filter(username__startswith=f'{options["prefix"]}_user_').annotate(
+            goal_count=Count('participants__board__goals')
+        ).order_by('-goal_count').first()
+        if user is None:
+            raise CommandError('No seeded users, run manage.py seed_bench first')
+        return user
+
+    @staticmethod
+    def endpoints(user, limit) -> list[Endpoint]:
+        board = Board.objects.filter(participants__user=user, is_deleted=False).annotate(
+            goal_count=Count('goals')
+        ).order_by('-goal_count').first()
+        if board is None:
+            raise CommandError(f'User "{user.username}" is not on any board')
+        category = GoalCategory.objects.filter(board=board, is_deleted=False).first()
+        # comment routes only show comments on the user's own goals
+        goal = Goal.objects.filter(board=board, user=user).annotate(comment_count=Count('comments')).order_by(
+            '-comment_count'
+        ).first()
+        comment = GoalComment.objects.filter(goal__user=user).first()
+        page = {'limit': limit}
+
+        endpoints = [
+            Endpoint('board-list', 'get', '/goals/board/list', page),
+            Endpoint('board-detail', 'get', f'/goals/board/{board.id}'),
+            Endpoint('board-stats', 'get', f'/goals/board/{board.id}/stats'),
+            Endpoint('category-list', 'get', '/goals/goal_category/list', page),
+            Endpoint('goal-list', 'get', reverse('goal-list'), page),
+            Endpoint('goal-search', 'get', reverse('goal-list'), {**page, 'search': 'отчет'}),
+            Endpoint('goal-export', 'get', reverse('goal-export'), {'format': 'ndjson'}),
+            Endpoint('sync', 'get', reverse('sync')),
+            Endpoint('cascade-job-list', 'get', '/goals/cascade_job/list', page),
+            Endpoint('profile', 'get', reverse('profile')),
+            Endpoint('board-create', 'post', '/goals/board/create', {'title': 'bench'}),
+        ]
+        if category is not None:
+            endpoints += [
+                Endpoint('category-detail', 'get', f'/goals/goal_category/{category.id}'),
+                Endpoint('goal-create', 'post', reverse('goal-create'), {'title': 'bench', 'category': category.id}),
+            ]
+        if goal is not None:
+            endpoints += [
+                Endpoint('goal-list-category', 'get', reverse('goal-list'), {**page, 'category': goal.category_id}),
+                Endpoint('goal-detail', 'get', reverse('goal-one', args=[goal.id])),
+                Endpoint('goal-update', 'patch', reverse('goal-one', args=[goal.id]), {'priority': Goal.Priority.high}),
+                Endpoint('comment-list', 'get', '/goals/goal_comment/list', {**page, 'goal': goal.id}),
+                Endpoint('comment-create', 'post', '/goals/goal_comment/create', {'goal': goal.id, 'text': 'bench'}),
+                Endpoint('goal-bulk', 'post', reverse('goal-bulk'), {'operations': [
+                    {'op': 'update', 'id': goal_id, 'status': Goal.Status.in_progress}
+                    for goal_id in Goal.objects.filter(board=board).values_list('id', flat=True)[:50]
+                ]}),
+            ]
+        if comment is not None:
+            endpoints.append(Endpoint('comment-detail', 'get', f'/goals/goal_comment/{comment.id}'))
+        return endpoints + Command.write_endpoints(Scratch(user))
+
+    @staticmethod
+    def write_endpoints(scratch: Scratch) -> list[Endpoint]:
+        """Updates and deletes on objects of a scratch board, auth endpoints on a scratch account"""
+        def signup(client):
+            username = f'bench_signup_{next(scratch.serial)}'
+            return Client(), reverse('signup'), {
+                'username': username, 'password': scratch.password, 'password_repeat': scratch.password
+            }
+
+        def update_password(client):
+            # the new password ends the sessions of the old one
+            client = scratch.account_client()
+            old, scratch.password = scratch.password, scratch.next_password()
+            return client, reverse('update_password'), {
+                'old_password': old, 'new_password': scratch.password
+            }
+
+        def import_goals(client):
+            content = '\n'.join(
+                json.dumps({'title': f'bench_{index}', 'category': scratch.category.id}) for index in range(IMPORT_ROWS)
+            )
+            return client, reverse('goal-import'), {'file': SimpleUploadedFile('goals.ndjson', content.encode())}
+
+        return [
+            Endpoint('board-update', 'put', '/goals/board/<pk>', prepare=lambda client: (
+                client, f'/goals/board/{scratch.board.id}', {'title': 'bench', 'participants': []}
+            )),
+            Endpoint('board-delete', 'delete', '/goals/board/<pk>', prepare=lambda client: (
+                client, f'/goals/board/{scratch.new_board().id}', None
+            )),
+            Endpoint('category-create', 'post', '/goals/goal_category/create', prepare=lambda client: (
+                client, '/goals/goal_category/create', {'title': 'bench', 'board': scratch.board.id}
+            )),
+            Endpoint('category-update', 'patch', '/goals/goal_category/<pk>', prepare=lambda client: (
+                client, f'/goals/goal_category/{scratch.category.id}', {'title': 'bench'}
+            )),
+            Endpoint('category-delete', 'delete', '/goals/goal_category/<pk>', prepare=lambda client: (
+                client, f'/goals/goal_category/{scratch.new_category().id}', None
+            )),
+            Endpoint('goal-delete', 'delete', '/goals/goal/<pk>', prepare=lambda client: (
+                client, reverse('goal-one', args=[scratch.new_goal().id]), None
+            )),
+            Endpoint(
+                'goal-import', 'post', reverse('goal-import'), prepare=import_goals, content_type=MULTIPART_CONTENT
+            ),
+            Endpoint('comment-update', 'patch', '/goals/goal_comment/<pk>', prepare=lambda client: (
+                client, f'/goals/goal_comment/{scratch.comment.id}', {'text': 'bench'}
+            )),
+            Endpoint('comment-delete', 'delete', '/goals/goal_comment/<pk>', prepare=lambda client: (
+                client, f'/goals/goal_comment/{scratch.new_comment().id}', None
+            )),
+            Endpoint('cascade-job-detail', 'get', '/goals/cascade_job/<pk>', prepare=lambda client: (
+                client, f'/goals/cascade_job/{scratch.job.id}', None
+            )),
+            Endpoint('profile-update', 'patch', reverse('profile'), {'first_name': scratch.user.first_name}),
+            Endpoint('signup', 'post', reverse('signup'), prepare=signup),
+            Endpoint('login', 'post', reverse('login'), prepare=lambda client: (
+                Client(), reverse('login'), {'username': scratch.account.username, 'password': scratch.password}
+            )),
+            Endpoint('update-password', 'put', reverse('update_password'), prepare=update_password),
+            Endpoint('logout', 'delete', reverse('profile'), prepare=lambda client: (
+                scratch.account_client(), reverse('profile'), None
+            )),
+        ]
+
+    def measure(self, client, endpoint: Endpoint, requests: int, warmup: int) -> dict:
+        latencies, queries, rows = [], 0, 0
+        status_code = None
+        for iteration in range(warmup + requests):
+            request = endpoint.prepare(client) if endpoint.prepare else (client, endpoint.path, endpoint.data)
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = self.call(endpoint, *request)
+                returned = count_rows(response)
+                elapsed = time.perf_counter() - started
+
+            status_code = response.status_code
+            if status_code >= 400:
+                raise CommandError(f'{endpoint.name} answered {status_code}')
+            if iteration >= warmup:
+                latencies.append(elapsed)
+                queries += counter.count
+                rows += returned
+
+        latencies.sort()
+        total = sum(latencies)
+        self.stderr.write(f'{endpoint.name}: p50 {percentile(latencies, 0.5) * 1000:.1f} ms')
+        return {
+            'name': endpoint.name,
+            'method': endpoint.method.upper(),
+            'path': endpoint.path,
+            'status': status_code,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(total / requests * 1000, 3),
+            'queries_per_request': round(queries / requests, 2),
+            'rows_per_request': round(rows / requests, 2),
+            'rows_per_second': round(rows / total, 1) if total else None,
+        }
+
+    @staticmethod
+    def call(endpoint: Endpoint, client, path: str, data):
+        if endpoint.method == 'get':
+            return client.get(path, data)
+        return getattr(client, endpoint.method)(path, data, content_type=endpoint.content_type)
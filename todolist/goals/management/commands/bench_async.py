@@ -0,0 +1,131 @@
+import asyncio
+import json
+import platform
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.asgi import ASGIHandler
+from goals.management.commands.bench import Command as BenchCommand, Endpoint, percentile
+
+# endpoints with an async view, see goals.asyncviews
+READ_ENDPOINTS = ('board-list', 'category-list', 'goal-list', 'goal-list-category', 'goal-detail', 'comment-list')
+
+
+async def asgi_get(application, endpoint: Endpoint, cookie: bytes) -> int:
+    """Status of one GET sent straight to the ASGI application, the body is read and dropped"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': endpoint.path, 'raw_path': endpoint.path.encode(), 'root_path': '',
+        'query_string': urlencode(endpoint.data or {}).encode(),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie)],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the read endpoints through the ASGI handler at several concurrency levels, '
+        'once through the sync views and once through the async ones, and report latency and throughput as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark as this user, by default the busiest seed_bench user')
+        parser.add_argument('--prefix', default='bench', help='seed_bench username prefix')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint and level')
+        parser.add_argument('--concurrency', type=int, action='append', default=[],
+                            help='Requests in flight, repeatable, 1 4 16 64 by default')
+        parser.add_argument('--limit', type=int, default=100, help='Page size of list endpoints')
+        parser.add_argument('--only', action='append', default=[], help='Endpoint name to run, repeatable')
+        parser.add_argument('--output', help='JSON file to write, stdout by default')
+
+    def handle(self, *args, **options):
+        user = BenchCommand.get_user(options)
+        only = options['only'] or READ_ENDPOINTS
+        endpoints = [endpoint for endpoint in BenchCommand.endpoints(user, options['limit']) if endpoint.name in only]
+        if not endpoints:
+            raise CommandError(f'No read endpoint named {", ".join(only)}')
+        levels = options['concurrency'] or [1, 4, 16, 64]
+
+        client = Client()
+        client.force_login(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'.encode()
+        # requests open connections of their own from their sync threads
+        connection.close()
+
+        application = ASGIHandler()
+        results = []
+        for endpoint in endpoints:
+            for mode in ('sync', 'async'):
+                # slow request logs would drown the report
+                with override_settings(ASYNC_READ_VIEWS=mode == 'async', SQL_SLOW_REQUEST_MS=float('inf')):
+                    for level in levels:
+                        results.append(asyncio.run(self.measure(
+                            application, endpoint, cookie, mode, level, options['requests']
+                        )))
+
+        report = json.dumps({
+            'started': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'user': user.username,
+            'requests': options['requests'],
+            'limit': options['limit'],
+            'results': results,
+        }, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    async def measure(self, application, endpoint: Endpoint, cookie: bytes, mode: str, level: int,
+                      requests: int) -> dict:
+        latencies = []
+        pending = iter(range(requests))
+
+        async def worker():
+            for _ in pending:
+                started = time.perf_counter()
+                status = await asgi_get(application, endpoint, cookie)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    raise CommandError(f'{endpoint.name} answered {status}')
+
+        # one unmeasured request per worker, the first one pays for imports and connections
+        await asyncio.gather(*[asgi_get(application, endpoint, cookie) for _ in range(level)])
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(level)])
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stderr.write(
+            f'{endpoint.name} {mode} x{level}: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, '
+            f'{requests / elapsed:.1f} req/s'
+        )
+        return {
+            'name': endpoint.name,
+            'mode': mode,
+            'concurrency': level,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'requests_per_second': round(requests / elapsed, 1),
+        }
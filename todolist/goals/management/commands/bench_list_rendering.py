@@ -0,0 +1,90 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import User
+from goals.models import Board, BoardParticipant, GoalCategory, Goal, GoalComment
+from goals.views import BoardListView, GoalCategoryListView, GoalListView, GoalCommentListView
+
+LIST_VIEWS = [BoardListView, GoalCategoryListView, GoalListView, GoalCommentListView]
+
+
+class Command(BaseCommand):
+    help = 'Compare rows per second of the serializer and the fast list paths, and check they render the same bytes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Rows seeded per list endpoint')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path, the best one is reported')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        failures = []
+
+        with transaction.atomic():
+            user = self.seed(rows)
+            for view_class in LIST_VIEWS:
+                baseline_class = type(
+                    f'Baseline{view_class.__name__}', (view_class,),
+                    {'fast_list': False, 'renderer_classes': [JSONRenderer]},
+                )
+                baseline, baseline_rate = self.measure(baseline_class, user, rows, repeat)
+                fast, fast_rate = self.measure(view_class, user, rows, repeat)
+
+                identical = baseline == fast
+                if not identical:
+                    failures.append(view_class.__name__)
+                self.stdout.write(
+                    f'{view_class.__name__}: serializer {baseline_rate:,.0f} rows/s, fast {fast_rate:,.0f} rows/s '
+                    f'({fast_rate / baseline_rate:.1f}x), output {"identical" if identical else "DIFFERS"}'
+                )
+            # seeded rows never outlive the benchmark
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Fast list output differs in: {", ".join(failures)}')
+
+    @staticmethod
+    def measure(view_class, user, rows, repeat) -> tuple[bytes, float]:
+        view = view_class.as_view()
+        best = None
+        for _ in range(repeat):
+            request = APIRequestFactory().get('/', {'limit': rows})
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return response.content, rows / best
+
+    @staticmethod
+    def seed(rows) -> User:
+        now = timezone.now()
+        user = User.objects.create(username='bench_list_user', password='!', email='bench@example.com')
+        boards = Board.objects.bulk_create(
+            [Board(title=f'Доска {index}', created=now, updated=now) for index in range(rows)]
+        )
+        BoardParticipant.objects.bulk_create([
+            BoardParticipant(board=board, user=user, role=BoardParticipant.Role.owner, created=now, updated=now)
+            for board in boards
+        ])
+        categories = GoalCategory.objects.bulk_create([
+            GoalCategory(title=f'Категория {index}', user=user, board=board, created=now, updated=now)
+            for index, board in enumerate(boards)
+        ])
+        goals = Goal.objects.bulk_create([
+            Goal(title=f'Цель {index}', description='описание ' if index % 2 else None,
+                 category=category, board_id=category.board_id, user=user, status=index % 4 + 1,
+                 priority=index % 4 + 1, due_date=now if index % 3 else None, created=now, updated=now)
+            for index, category in enumerate(categories)
+        ])
+        GoalComment.objects.bulk_create([
+            # \u2028 has to come out escaped on both paths
+            GoalComment(goal=goal, user=user, text=f'Комментарий "{index}"\u2028', created=now, updated=now)
+            for index, goal in enumerate(goals)
+        ])
+        return user
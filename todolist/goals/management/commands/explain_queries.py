@@ -0,0 +1,108 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import User
+from goals.models import Board, BoardParticipant, GoalCategory, Goal, GoalComment
+from goals.views import BoardListView, GoalCategoryListView, GoalListView, GoalCommentListView
+
+LIST_VIEWS = [BoardListView, GoalCategoryListView, GoalListView, GoalCommentListView]
+
+# Postgres: "Seq Scan on goals_goal", SQLite: "SCAN goals_goal" (index scans read "SCAN t USING INDEX ...")
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)(?! USING)(?:\s|$)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queryset of every list view and fail if a sequential scan shows up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Explain as this existing user instead of a seeded dataset')
+        parser.add_argument('--allow', action='append', default=[], help='Table allowed to be scanned')
+        parser.add_argument('--limit', type=int, default=50, help='Page size applied to every queryset')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(f'EXPLAIN audit is not supported for "{vendor}"')
+
+        with transaction.atomic():
+            if vendor == 'postgresql':
+                # tiny tables make seq scans the cheapest plan, we want to know whether an index plan exists
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            if options['username']:
+                user = User.objects.get(username=options['username'])
+            else:
+                user = self.seed()
+
+            failures = [
+                view_class.__name__
+                for view_class in LIST_VIEWS
+                if not self.audit(view_class, user, options, SEQ_SCAN_PATTERNS[vendor])
+            ]
+            # seeded rows and session settings never outlive the audit
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Sequential scans in: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('No sequential scans found'))
+
+    def audit(self, view_class, user, options, pattern) -> bool:
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=user)
+        view = view_class()
+        view.setup(request)
+        view.request = view.initialize_request(request)
+        view.format_kwarg = None
+        queryset = view.filter_queryset(view.get_queryset())[:options['limit']]
+
+        plan = queryset.explain()
+        scans = [
+            match.group('table') for match in pattern.finditer(plan)
+            if match.group('table') not in options['allow']
+        ]
+
+        if scans:
+            self.stdout.write(self.style.ERROR(f'{view_class.__name__}: sequential scan on {", ".join(scans)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{view_class.__name__}: ok'))
+        if scans or options['verbosity'] > 1:
+            self.stdout.write(plan)
+        return not scans
+
+    @staticmethod
+    def seed() -> User:
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            [User(username=f'explain_user_{index}', password='!') for index in range(10)]
+        )
+        boards = Board.objects.bulk_create(
+            [Board(title=f'board_{index}', created=now, updated=now) for index in range(20)]
+        )
+        BoardParticipant.objects.bulk_create([
+            BoardParticipant(board=board, user=user, role=(index + board.id) % 3 + 1, created=now, updated=now)
+            for board in boards
+            for index, user in enumerate(users)
+        ])
+        categories = GoalCategory.objects.bulk_create([
+            GoalCategory(title=f'category_{index}', user=users[index % len(users)], board=board,
+                         created=now, updated=now)
+            for index, board in enumerate(boards * 2)
+        ])
+        goals = Goal.objects.bulk_create([
+            Goal(title=f'goal_{index}', category=category, board_id=category.board_id, user=category.user,
+                 status=index % 4 + 1, priority=index % 4 + 1, due_date=now, created=now, updated=now)
+            for index, category in enumerate(categories * 10)
+        ])
+        GoalComment.objects.bulk_create([
+            GoalComment(goal=goal, user=goal.user, text=f'comment_{index}', created=now, updated=now)
+            for index, goal in enumerate(goals * 2)
+        ])
+        return users[0]
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from core.models import User
+from goals import sharding
+from goals.exports import FORMATS, stream_export
+from goals.models import Goal
+
+
+class Command(BaseCommand):
+    help = 'Stream every goal visible to a user as NDJSON or CSV, the same rows goals/goal/export returns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Export the goals this user sees')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE,
+                            help='Rows per server-side cursor fetch')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+
+        querysets = sharding.user_querysets(Goal.objects.visible_to(user), user)
+        chunks = stream_export(querysets, options['format'], options['chunk_size'])
+        if options['output'] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,36 @@
+import json
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from core.models import User
+from goals.imports import FORMATS, import_format, import_goals
+
+
+class Command(BaseCommand):
+    help = 'Import goals from a CSV or NDJSON file in batches, the same rows goals/goal/import accepts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Goals are created by this user, on boards they can write to')
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=sorted(FORMATS), help='Guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=settings.GOAL_IMPORT_BATCH_SIZE,
+                            help='Rows per bulk_create')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+
+        file_format = options['format'] or import_format(options['path'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            report = import_goals(
+                user, lines, file_format, options['batch_size'], settings.GOAL_IMPORT_MAX_ERRORS
+            )
+
+        for error in report['errors']:
+            self.stderr.write(f'row {error["row"]}: {json.dumps(error["errors"], ensure_ascii=False)}')
+        if report['errors_truncated']:
+            self.stderr.write(f'only the first {len(report["errors"])} errors are listed')
+        self.stdout.write(f'created {report["created"]}, failed {report["failed"]}')
@@ -0,0 +1,138 @@
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from goals.models import Board, BoardParticipant, BoardShard, GoalCategory, Goal, GoalComment
+from goals.sharding import SHARDED_MODELS, copy_board, copy_users, shard_of
+
+# ids created on a database come from its own range, GOAL_SHARDS index * ID_RANGE onwards,
+# so moved rows never collide with the ones created there
+ID_RANGE = 1 << 40
+
+
+def subtree(model, using: str, board_id: int):
+    manager = model._base_manager.using(using)
+    if model is GoalComment:
+        return manager.filter(goal__board_id=board_id)
+    return manager.filter(board_id=board_id)
+
+
+def copy_directory(target: str, board_id: int):
+    """Copy the board row and its participants' profiles, rows on the target reference them"""
+    copy_users(BoardParticipant.objects.using(DEFAULT_DB_ALIAS).filter(
+        board_id=board_id
+    ).values_list('user_id', flat=True), target)
+    copy_board(Board.objects.using(DEFAULT_DB_ALIAS).get(pk=board_id), target)
+
+
+def reserve_ids(using: str):
+    """Point the id sequences of the sharded tables into the database's id range"""
+    connection = connections[using]
+    floor = settings.GOAL_SHARDS.index(using) * ID_RANGE
+    ceiling = floor + ID_RANGE
+    with connection.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f'SELECT MAX(id) FROM {table} WHERE id >= %s AND id < %s', [floor, ceiling])
+            last = max(cursor.fetchone()[0] or 0, floor)
+            if connection.vendor == 'postgresql':
+                # explicit ids leave sequences alone, one already in the range is in use
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [model._meta.db_table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f'SELECT last_value FROM {sequence}')
+                if not floor <= cursor.fetchone()[0] < ceiling:
+                    cursor.execute('SELECT setval(%s, %s, false)', [sequence, last + 1])
+            elif connection.vendor == 'sqlite':
+                # explicit ids push AUTOINCREMENT past them, the copy holds the write lock so nothing raced it
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [last, model._meta.db_table])
+                if cursor.rowcount == 0:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [model._meta.db_table, last])
+            else:
+                raise CommandError(f'Can not reserve ids on {connection.vendor}')
+
+
+def purge(using: str, board_id: int) -> int:
+    """
+    Delete the board's subtree without signals: it lives on elsewhere, no tombstones or cache invalidation.
+    The copy of the board row goes with it, the board itself always stays on the default database
+    """
+    deleted = 0
+    with transaction.atomic(using=using):
+        for model in reversed(SHARDED_MODELS):
+            deleted += subtree(model, using, board_id)._raw_delete(using)
+        if using != DEFAULT_DB_ALIAS:
+            Board._base_manager.using(using).filter(pk=board_id)._raw_delete(using)
+    return deleted
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the categories, goals, counters and comments of a board to another database of GOAL_SHARDS. '
+        'The board and its participants stay on the default database. Writes to the board are refused with 503 '
+        'while it moves, reads keep using the old one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('board_id', type=int)
+        parser.add_argument('shard', help='Database alias listed in GOAL_SHARDS')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows copied per INSERT')
+        parser.add_argument('--settle', type=float, default=5.0,
+                            help='Seconds to wait for writes already past the router before copying')
+
+    def handle(self, *args, **options):
+        board_id, target = options['board_id'], options['shard']
+        if target not in settings.GOAL_SHARDS:
+            raise CommandError(f'{target} is not one of GOAL_SHARDS: {", ".join(settings.GOAL_SHARDS)}')
+        source = shard_of(board_id)
+        if not Board.objects.using(DEFAULT_DB_ALIAS).filter(pk=board_id).exists():
+            raise CommandError(f'No board #{board_id}')
+        if source == target:
+            raise CommandError(f'Board #{board_id} is on {target} already')
+
+        BoardShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            board_id=board_id, defaults={'shard': source, 'moving': True}
+        )
+        try:
+            time.sleep(options['settle'])
+            # leftovers of a failed move
+            purge(target, board_id)
+            with transaction.atomic(using=target):
+                copied = self.copy(source, target, board_id, options['batch_size'])
+                reserve_ids(target)
+        except BaseException:
+            BoardShard.objects.using(DEFAULT_DB_ALIAS).filter(board_id=board_id).update(moving=False)
+            raise
+
+        if target == DEFAULT_DB_ALIAS:
+            BoardShard.objects.using(DEFAULT_DB_ALIAS).filter(board_id=board_id).delete()
+        else:
+            BoardShard.objects.using(DEFAULT_DB_ALIAS).filter(board_id=board_id).update(shard=target, moving=False)
+            # participants added and board renames while it moved were copied to the source
+            copy_directory(target, board_id)
+        purge(source, board_id)
+
+        self.stdout.write(f'Board #{board_id} moved from {source} to {target}: ' + ', '.join(
+            f'{count} {model._meta.model_name}' for model, count in copied.items()
+        ))
+
+    def copy(self, source: str, target: str, board_id: int, batch_size: int) -> dict:
+        if target != DEFAULT_DB_ALIAS:
+            copy_directory(target, board_id)
+            # authors who left the board
+            user_ids = set()
+            for model in (GoalCategory, Goal, GoalComment):
+                user_ids.update(subtree(model, source, board_id).values_list('user_id', flat=True))
+            copy_users(user_ids, target)
+
+        copied = {}
+        for model in SHARDED_MODELS:
+            rows = subtree(model, source, board_id).order_by('pk').iterator(chunk_size=batch_size)
+            copied[model] = 0
+            while batch := list(islice(rows, batch_size)):
+                # the base manager, GoalQuerySet would count the copies into the goal counters again
+                model._base_manager.using(target).bulk_create(batch)
+                copied[model] += len(batch)
+        return copied
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from goals import counters, sharding
+
+
+class Command(BaseCommand):
+    help = 'Rebuild goal counters from the goals table of every database holding boards and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', type=int, action='append', dest='boards', help='Only this board (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without rewriting counters')
+
+    def handle(self, *args, **options):
+        boards = options['boards']
+        drift = []
+        for alias in sharding.by_shard(boards) if boards else sharding.shards_in_use():
+            drift += counters.rebuild(board_ids=boards, dry_run=options['dry_run'], using=alias)
+
+        for (board_id, category_id, status, priority), stored, actual in drift:
+            self.stdout.write(
+                f'board={board_id} category={category_id} status={status} priority={priority}: '
+                f'stored {stored}, actual {actual}'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Counters are consistent'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} drifted counters'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(drift)} drifted counters rebuilt'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management import BaseCommand
+
+from core.db.pool import release_connections
+from goals.cascades import process_next_chunk
+
+
+class Command(BaseCommand):
+    help = 'Process queued board/category delete cascades in bounded chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Goals archived per transaction')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            # hand the connection back to the pool between chunks, a broken one is replaced
+            release_connections()
+            job = process_next_chunk(options['chunk_size'])
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            if options['verbosity'] > 1 or job.status == job.Status.done:
+                self.stdout.write(
+                    f'{job.kind} #{job.target_id}: {job.processed}/{job.total} archived ({job.get_status_display()})'
+                )
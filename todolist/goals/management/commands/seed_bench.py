@@ -0,0 +1,128 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import User
+from goals.models import Board, BoardParticipant, GoalCategory, Goal, GoalComment
+
+WORDS = (
+    'отчет', 'релиз', 'встреча', 'бюджет', 'ревью', 'план', 'клиент', 'дизайн', 'тест', 'миграция',
+    'report', 'release', 'meeting', 'budget', 'review', 'roadmap', 'customer', 'design', 'deploy', 'backlog',
+)
+# goals by status: most of a long lived board is done or archived
+STATUS_WEIGHTS = {
+    Goal.Status.to_do: 25, Goal.Status.in_progress: 15, Goal.Status.done: 45, Goal.Status.archived: 15,
+}
+PRIORITY_WEIGHTS = {
+    Goal.Priority.low: 20, Goal.Priority.medium: 50, Goal.Priority.high: 25, Goal.Priority.critical: 5,
+}
+
+
+def zipf_weights(count: int, exponent: float) -> list[float]:
+    """A few boards/goals get most of the rows, the long tail gets a handful"""
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert a synthetic dataset with production like skew for manage.py bench'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--boards', type=int, default=100)
+        parser.add_argument('--participants', type=int, default=5, help='Participants per board besides the owner')
+        parser.add_argument('--categories', type=int, default=8, help='Categories of the largest board')
+        parser.add_argument('--goals', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of rows per board and per goal')
+        parser.add_argument('--prefix', default='bench', help='Username prefix, also used by manage.py bench')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, same seed same dataset')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        now = timezone.now()
+
+        def moment(days=365):
+            return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+        with transaction.atomic():
+            # hashing is slow on purpose, every seeded user shares one password
+            password = make_password(options['prefix'])
+            users = User.objects.bulk_create([
+                User(username=f'{options["prefix"]}_user_{index}', password=password,
+                     email=f'{options["prefix"]}_user_{index}@example.com', date_joined=moment())
+                for index in range(options['users'])
+            ], batch_size=batch_size)
+            user_weights = zipf_weights(len(users), options['skew'])
+
+            boards = Board.objects.bulk_create([
+                Board(title=f'{rng.choice(WORDS)} {index}', created=moment(), updated=now)
+                for index in range(options['boards'])
+            ], batch_size=batch_size)
+            board_weights = zipf_weights(len(boards), options['skew'])
+
+            members, participants = {}, []
+            for rank, board in enumerate(boards):
+                # the first users own the biggest boards
+                owner = users[rank % len(users)]
+                others = {user.id: user for user in rng.choices(users, user_weights, k=options['participants'])}
+                others.pop(owner.id, None)
+                members[board.id] = [(owner, BoardParticipant.Role.owner)] + [
+                    (user, rng.choice([BoardParticipant.Role.writer, BoardParticipant.Role.reader]))
+                    for user in others.values()
+                ]
+                participants += [
+                    BoardParticipant(board=board, user=user, role=role, created=board.created, updated=board.created)
+                    for user, role in members[board.id]
+                ]
+            BoardParticipant.objects.bulk_create(participants, batch_size=batch_size)
+
+            categories = GoalCategory.objects.bulk_create([
+                GoalCategory(title=f'{rng.choice(WORDS)} {index}', user=members[board.id][0][0], board=board,
+                             created=board.created, updated=board.created)
+                for board, weight in zip(boards, board_weights)
+                for index in range(max(1, round(options['categories'] * weight)))
+            ], batch_size=batch_size)
+            board_categories = {}
+            for category in categories:
+                board_categories.setdefault(category.board_id, []).append(category)
+
+            goals = []
+            for board in rng.choices(boards, board_weights, k=options['goals']):
+                category = rng.choice(board_categories[board.id])
+                created = moment()
+                goals.append(Goal(
+                    title=' '.join(rng.choices(WORDS, k=rng.randint(2, 6))),
+                    description=' '.join(rng.choices(WORDS, k=rng.randint(5, 40))) if rng.random() < 0.6 else None,
+                    category=category,
+                    board_id=board.id,
+                    status=rng.choices(list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values()))[0],
+                    priority=rng.choices(list(PRIORITY_WEIGHTS), list(PRIORITY_WEIGHTS.values()))[0],
+                    due_date=created + timedelta(days=rng.randint(1, 90)) if rng.random() < 0.5 else None,
+                    user=rng.choice(members[board.id])[0],
+                    created=created,
+                    updated=created + (now - created) * rng.random(),
+                ))
+            Goal.objects.bulk_create(goals, batch_size=batch_size)
+
+            comments = []
+            for goal in rng.choices(goals, zipf_weights(len(goals), options['skew']), k=options['comments']):
+                created = goal.created + (now - goal.created) * rng.random()
+                comments.append(GoalComment(
+                    goal=goal,
+                    user=rng.choice(members[goal.board_id])[0],
+                    text=' '.join(rng.choices(WORDS, k=rng.randint(3, 30))),
+                    created=created,
+                    updated=created,
+                ))
+            GoalComment.objects.bulk_create(comments, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(boards)} boards, {len(participants)} participants, '
+            f'{len(categories)} categories, {len(goals)} goals and {len(comments)} comments'
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2026-10-18 12:00
+
+from django.db import migrations, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_goal_board(apps, schema_editor):
+    # fills goal.board by id ranges, each range in its own short transaction,
+    # so locks are never held on the whole goals table
+    Goal = apps.get_model('goals', 'Goal')
+    GoalCategory = apps.get_model('goals', 'GoalCategory')
+
+    category_board = Subquery(GoalCategory.objects.filter(id=OuterRef('category_id')).values('board_id')[:1])
+    last_id = Goal.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Goal.objects.filter(
+                id__gte=start, id__lt=start + BATCH_SIZE, board__isnull=True
+            ).update(board_id=category_board)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('goals', '0010_goal_board'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_goal_board, migrations.RunPython.noop)
+    ]
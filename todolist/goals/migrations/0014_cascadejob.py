@@ -0,0 +1,39 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('goals', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CascadeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(verbose_name='Дата последнего обновления')),
+                ('kind', models.CharField(choices=[('board', 'Доска'), ('category', 'Категория')], max_length=16, verbose_name='Тип')),
+                ('target_id', models.BigIntegerField(verbose_name='Объект')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'В очереди'), (2, 'Выполняется'), (3, 'Завершено')], default=1, verbose_name='Статус')),
+                ('last_goal_id', models.BigIntegerField(default=0, verbose_name='Последняя обработанная цель')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Архивировано целей')),
+                ('total', models.PositiveIntegerField(null=True, verbose_name='Всего целей')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='cascade_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Каскадная задача',
+                'verbose_name_plural': 'Каскадные задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cascadejob',
+            index=models.Index(condition=models.Q(('status', 3), _negated=True), fields=['id'], name='cascade_job_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:20
+
+from django.db import migrations
+
+# The search schema is spelled out here rather than taken from goals.search: a past migration must not change
+# along with the code.
+# PostgreSQL: a generated search_vector column with a GIN index. It is left out of the model and the migration
+# state on purpose: a GENERATED ALWAYS column can not be written, and Django lists every model field in INSERT
+# and UPDATE statements. Queries reach it through RawSQL in goals.search
+POSTGRESQL_INSTALL = [
+    "ALTER TABLE goals_goal ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B')) STORED",
+    'CREATE INDEX goals_goal_search_idx ON goals_goal USING gin (search_vector)',
+    "ALTER TABLE goals_goalcomment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'A')) STORED",
+    'CREATE INDEX goals_goalcomment_search_idx ON goals_goalcomment USING gin (search_vector)',
+]
+POSTGRESQL_UNINSTALL = [
+    'DROP INDEX IF EXISTS goals_goal_search_idx',
+    'ALTER TABLE goals_goal DROP COLUMN IF EXISTS search_vector',
+    'DROP INDEX IF EXISTS goals_goalcomment_search_idx',
+    'ALTER TABLE goals_goalcomment DROP COLUMN IF EXISTS search_vector',
+]
+
+# SQLite: FTS5 shadow tables kept up to date by triggers
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE goals_goal_fts USING fts5(title, description, content='goals_goal', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER goals_goal_fts_ai AFTER INSERT ON goals_goal BEGIN '
+    'INSERT INTO goals_goal_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END',
+    'CREATE TRIGGER goals_goal_fts_ad AFTER DELETE ON goals_goal BEGIN '
+    "INSERT INTO goals_goal_fts(goals_goal_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    'CREATE TRIGGER goals_goal_fts_au AFTER UPDATE OF title, description ON goals_goal BEGIN '
+    "INSERT INTO goals_goal_fts(goals_goal_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    'INSERT INTO goals_goal_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END',
+    "INSERT INTO goals_goal_fts(goals_goal_fts) VALUES ('rebuild')",
+    "CREATE VIRTUAL TABLE goals_goalcomment_fts USING fts5(text, content='goals_goalcomment', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER goals_goalcomment_fts_ai AFTER INSERT ON goals_goalcomment BEGIN '
+    'INSERT INTO goals_goalcomment_fts(rowid, text) VALUES (new.id, new.text); END',
+    'CREATE TRIGGER goals_goalcomment_fts_ad AFTER DELETE ON goals_goalcomment BEGIN '
+    "INSERT INTO goals_goalcomment_fts(goals_goalcomment_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    'CREATE TRIGGER goals_goalcomment_fts_au AFTER UPDATE OF text ON goals_goalcomment BEGIN '
+    "INSERT INTO goals_goalcomment_fts(goals_goalcomment_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    'INSERT INTO goals_goalcomment_fts(rowid, text) VALUES (new.id, new.text); END',
+    "INSERT INTO goals_goalcomment_fts(goals_goalcomment_fts) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS goals_goal_fts_ai',
+    'DROP TRIGGER IF EXISTS goals_goal_fts_ad',
+    'DROP TRIGGER IF EXISTS goals_goal_fts_au',
+    'DROP TABLE IF EXISTS goals_goal_fts',
+    'DROP TRIGGER IF EXISTS goals_goalcomment_fts_ai',
+    'DROP TRIGGER IF EXISTS goals_goalcomment_fts_ad',
+    'DROP TRIGGER IF EXISTS goals_goalcomment_fts_au',
+    'DROP TABLE IF EXISTS goals_goalcomment_fts',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0016_sync_indexes_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            run_for_vendor({'postgresql': POSTGRESQL_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0017_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardShard',
+            fields=[
+                ('board_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Доска')),
+                ('shard', models.CharField(max_length=64, verbose_name='Шард')),
+                ('moving', models.BooleanField(default=False, verbose_name='Переносится')),
+            ],
+            options={
+                'verbose_name': 'Шард доски',
+                'verbose_name_plural': 'Шарды досок',
+            },
+        ),
+    ]
@@ -1,17 +1,36 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
 from django.utils import timezone
 
 from core.models import User
 
 
+class BaseQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # cascades must bump updated too, the sync API relies on it
+        kwargs.setdefault('updated', timezone.now())
+        return super().update(**kwargs)
+
+    def create(self, **kwargs):
+        # save() asks the router with the instance as a hint, board subtrees are written to their board's shard
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
 class BaseModel(models.Model):
     created = models.DateTimeField(verbose_name='Дата создания')
     updated = models.DateTimeField(verbose_name='Дата последнего обновления')
 
+    objects = BaseQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.id:  # new instance has no id
             self.created = timezone.now()
         self.updated = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated']
         return super().save(*args, **kwargs)
 
     class Meta:
@@ -26,6 +45,11 @@ class Board(BaseModel):
         verbose_name = 'Доска'
         verbose_name_plural = 'Доски'
 
+        indexes = [
+            models.Index(fields=['title'], condition=models.Q(is_deleted=False), name='board_active_title_idx'),
+            models.Index(fields=['updated'], name='board_updated_idx'),
+        ]
+
 
 class BoardParticipant(BaseModel):
     class Role(models.IntegerChoices):
@@ -53,6 +77,9 @@ class BoardParticipant(BaseModel):
         constraints = [
             models.UniqueConstraint(fields=['board', 'user'], name='unique_user_board')
         ]
+        indexes = [
+            models.Index(fields=['user', 'role'], name='participant_user_role_idx'),
+        ]
 
 
 class GoalCategory(BaseModel):
@@ -60,6 +87,14 @@ class GoalCategory(BaseModel):
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
 
+        indexes = [
+            models.Index(fields=['board'], condition=models.Q(is_deleted=False), name='category_active_board_idx'),
+            models.Index(
+                fields=['user', 'title'], condition=models.Q(is_deleted=False), name='category_active_user_idx'
+            ),
+            models.Index(fields=['board', 'updated'], name='category_board_updated_idx'),
+        ]
+
     title = models.CharField(verbose_name='Название', max_length=255)
     user = models.ForeignKey(to=User, verbose_name='Автор', on_delete=models.PROTECT)
     is_deleted = models.BooleanField(verbose_name='Удалена', default=False)
@@ -67,10 +102,79 @@ class GoalCategory(BaseModel):
         to=Board, verbose_name='Доска', on_delete=models.PROTECT, related_name='categories'
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_board_id = instance.__dict__.get('board_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        if getattr(self, '_loaded_board_id', self.board_id) != self.board_id:
+            # category moved to another board, its goals follow
+            self.goals.update(board_id=self.board_id)
+        self._loaded_board_id = self.board_id
+        return result
+
     def __str__(self):
         return self.title
 
 
+class GoalQuerySet(BaseQuerySet):
+    """
+    Keeps goal counters and the denormalized board in step with bulk writes.
+    bulk_update() goes through update() with Case expressions, so it is covered as well
+    """
+    counter_fields = {'board', 'board_id', 'category', 'category_id', 'status', 'priority'}
+
+    def visible_to(self, user):
+        """Goals on every board the user participates in"""
+        from goals import roles, sharding
+
+        if sharding.sharded():
+            # participants stay on the default database, goals of moved boards can not join them
+            return self.filter(board_id__in=list(roles.get_role_map(user.id)))
+        return self.filter(board__participants__user=user)
+
+    def update(self, **kwargs):
+        from goals import counters
+
+        # self.db is the database written to, counters live next to the goals
+        self._for_write = True
+        category = kwargs.get('category', kwargs.get('category_id'))
+        if category is not None and not hasattr(category, 'resolve_expression') \
+                and 'board' not in kwargs and 'board_id' not in kwargs:
+            if not isinstance(category, GoalCategory):
+                category = GoalCategory.objects.using(self.db).get(pk=category)
+            kwargs['board_id'] = category.board_id
+
+        if not self.counter_fields & kwargs.keys():
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            # the goals are locked before they are counted, concurrent updates of the same goals would
+            # otherwise both count their transitions from the same state
+            ids = list(self.select_for_update(of=('self',)).values_list('id', flat=True))
+            goals = Goal.objects.using(self.db).filter(id__in=ids)
+            before = counters.group(goals)
+            rows = super(GoalQuerySet, goals).update(**kwargs)
+            values = counters.normalize_update(kwargs)
+            if values is not None:
+                counters.apply_deltas(counters.update_deltas(before, values), using=self.db)
+            else:
+                counters.apply_deltas(counters.diff(before, counters.group(goals)), using=self.db)
+            return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from goals import counters
+
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            counters.apply_deltas(counters.Counter(counters.counter_key(goal) for goal in objs), using=self.db)
+        return objs
+
+
 class Goal(BaseModel):
     class Status(models.IntegerChoices):
         to_do = 1, 'К выполнению'
@@ -104,15 +208,77 @@ class Goal(BaseModel):
     )
     due_date = models.DateTimeField(verbose_name='Дедлайн', null=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name='Автор', related_name='goals')
+    # denormalized category.board, keeps visibility checks to a single join
+    board = models.ForeignKey(
+        to=Board, verbose_name='Доска', on_delete=models.PROTECT, related_name='goals', editable=False
+    )
 
     class Meta:
         verbose_name = 'Цель'
         verbose_name_plural = 'Цели'
 
+        indexes = [
+            models.Index(fields=['category', 'status', 'due_date'], name='goal_category_status_due_idx'),
+            # status 4 is Status.archived, the nested choices class is not visible from Meta
+            models.Index(fields=['board', 'due_date'], condition=~models.Q(status=4), name='goal_board_open_due_idx'),
+            models.Index(fields=['board', 'updated'], name='goal_board_updated_idx'),
+        ]
+
+    objects = GoalQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        from goals import counters
+
+        if self.board_id is None:
+            self.set_board(kwargs)
+        # the board routes the write, see goals.sharding.ShardRouter
+        using = kwargs.get('using') or router.db_for_write(Goal, instance=self)
+        with transaction.atomic(using=using):
+            # the stored row, locked: the instance may have been loaded before another writer changed it
+            stored = None
+            if not self._state.adding:
+                stored = Goal._base_manager.using(using).select_for_update().filter(pk=self.pk).values_list(
+                    *counters.KEY_FIELDS
+                ).first()
+            if stored is not None and stored[1] != self.category_id:
+                self.set_board(kwargs)
+
+            result = super().save(*args, **kwargs)
+            deltas = counters.Counter({counters.counter_key(self): 1})
+            if stored is not None:
+                deltas[stored] -= 1
+            counters.apply_deltas(deltas, using=using)
+        return result
+
+    def set_board(self, save_kwargs: dict):
+        self.board_id = self.category.board_id
+        update_fields = save_kwargs.get('update_fields')
+        if update_fields is not None and 'board' not in update_fields:
+            save_kwargs['update_fields'] = [*update_fields, 'board']
+
     def __str__(self):
         return self.title
 
 
+class GoalCounter(models.Model):
+    """Goals per (board, category, status, priority), maintained on every goal write"""
+    board = models.ForeignKey(to=Board, verbose_name='Доска', on_delete=models.CASCADE, related_name='goal_counters')
+    category = models.ForeignKey(
+        to=GoalCategory, verbose_name='Категория', on_delete=models.CASCADE, related_name='goal_counters'
+    )
+    status = models.PositiveSmallIntegerField(verbose_name='Статус', choices=Goal.Status.choices)
+    priority = models.PositiveSmallIntegerField(verbose_name='Приоритет', choices=Goal.Priority.choices)
+    count = models.IntegerField(verbose_name='Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик целей'
+        verbose_name_plural = 'Счетчики целей'
+
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'category', 'status', 'priority'], name='unique_goal_counter')
+        ]
+
+
 class GoalComment(BaseModel):
     user = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name='Автор', related_name='comments')
     goal = models.ForeignKey(Goal, verbose_name='Цель', on_delete=models.CASCADE, related_name='comments')
@@ -122,5 +288,75 @@ class GoalComment(BaseModel):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
+        indexes = [
+            models.Index(fields=['goal', 'created'], name='comment_goal_created_idx'),
+            models.Index(fields=['updated'], name='comment_updated_idx'),
+        ]
+
     def __str__(self):
         return self.text
+
+
+class CascadeJob(BaseModel):
+    """Goal archival queued by a board/category soft delete, processed by the run_cascades worker"""
+
+    class Kind(models.TextChoices):
+        board = 'board', 'Доска'
+        category = 'category', 'Категория'
+
+    class Status(models.IntegerChoices):
+        pending = 1, 'В очереди'
+        running = 2, 'Выполняется'
+        done = 3, 'Завершено'
+
+    kind = models.CharField(verbose_name='Тип', max_length=16, choices=Kind.choices)
+    target_id = models.BigIntegerField(verbose_name='Объект')
+    user = models.ForeignKey(
+        User, verbose_name='Автор', on_delete=models.PROTECT, related_name='cascade_jobs'
+    )
+    status = models.PositiveSmallIntegerField(verbose_name='Статус', choices=Status.choices, default=Status.pending)
+    last_goal_id = models.BigIntegerField(verbose_name='Последняя обработанная цель', default=0)
+    processed = models.PositiveIntegerField(verbose_name='Архивировано целей', default=0)
+    total = models.PositiveIntegerField(verbose_name='Всего целей', null=True)
+
+    class Meta:
+        verbose_name = 'Каскадная задача'
+        verbose_name_plural = 'Каскадные задачи'
+
+        indexes = [
+            # status 3 is Status.done, the nested choices class is not visible from Meta
+            models.Index(fields=['id'], condition=~models.Q(status=3), name='cascade_job_pending_idx'),
+        ]
+
+    def goals(self, using=DEFAULT_DB_ALIAS):
+        """Goals of the target, on the database of its board, see goals.cascades.job_shard()"""
+        if self.kind == self.Kind.board:
+            return Goal.objects.using(using).filter(board_id=self.target_id)
+        return Goal.objects.using(using).filter(category_id=self.target_id)
+
+
+class SyncTombstone(models.Model):
+    """Hard deleted goal or comment, reported by the sync API"""
+    model = models.CharField(verbose_name='Модель', max_length=32)
+    object_id = models.BigIntegerField(verbose_name='Объект')
+    board_id = models.BigIntegerField(verbose_name='Доска')
+    deleted = models.DateTimeField(verbose_name='Дата удаления', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Удаленный объект'
+        verbose_name_plural = 'Удаленные объекты'
+
+        indexes = [
+            models.Index(fields=['board_id', 'deleted'], name='tombstone_board_deleted_idx'),
+        ]
+
+
+class BoardShard(models.Model):
+    """Database of a board moved off the default one by move_board, boards without a row are on the default"""
+    board_id = models.BigIntegerField(verbose_name='Доска', primary_key=True)
+    shard = models.CharField(verbose_name='Шард', max_length=64)
+    moving = models.BooleanField(verbose_name='Переносится', default=False)
+
+    class Meta:
+        verbose_name = 'Шард доски'
+        verbose_name_plural = 'Шарды досок'
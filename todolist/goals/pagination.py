@@ -0,0 +1,305 @@
+import json
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from copy import copy
+from datetime import date, datetime
+from functools import reduce
+from typing import NamedTuple
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import F, Q
+from rest_framework import filters
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from goals import sharding
+
+
+class KeysetKey(NamedTuple):
+    """One column of a keyset ordering"""
+    field: object
+    descending: bool
+    nulls_last: bool
+
+    @property
+    def attname(self):
+        return self.field.attname
+
+    def reversed(self):
+        return KeysetKey(self.field, not self.descending, not self.nulls_last)
+
+    def order_by(self):
+        expression = F(self.attname)
+        if not self.field.null:
+            return expression.desc() if self.descending else expression.asc()
+        if self.nulls_last:
+            return expression.desc(nulls_last=True) if self.descending else expression.asc(nulls_last=True)
+        return expression.desc(nulls_first=True) if self.descending else expression.asc(nulls_first=True)
+
+    def after(self, value):
+        """Condition for rows strictly after ``value`` in this key's order, None if there are none"""
+        if value is None:
+            if self.nulls_last:
+                return None
+            return Q(**{f'{self.attname}__isnull': False})
+        lookup = 'lt' if self.descending else 'gt'
+        condition = Q(**{f'{self.attname}__{lookup}': value})
+        if self.field.null and self.nulls_last:
+            condition |= Q(**{f'{self.attname}__isnull': True})
+        return condition
+
+    def equal(self, value):
+        if value is None:
+            return Q(**{f'{self.attname}__isnull': True})
+        return Q(**{self.attname: value})
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over the view ordering with a unique ``id`` tie-breaker.
+    Pages are fetched with a ``WHERE (keys) > (last row keys)`` condition, so there is
+    no COUNT(*) and no OFFSET scan no matter how deep the client goes.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 500
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, position, reverse = self.page_queryset(queryset, request, view)
+        return self.set_page(list(queryset), position, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset, position, reverse = self.page_queryset(queryset, request, view)
+        return self.set_page([row async for row in queryset], position, reverse)
+
+    def paginate_shards(self, queryset, shards, request, view=None):
+        """paginate_queryset() over the databases of ``shards``, each one returns a page and the pages are merged"""
+        queryset, position, reverse = self.page_queryset(queryset, request, view)
+        keys = [key.reversed() for key in self.keys] if reverse else self.keys
+        return self.set_page(sharding.gather(queryset, keys, shards)[:self.limit + 1], position, reverse)
+
+    def page_queryset(self, queryset, request, view):
+        """Queryset of the requested page plus one row to tell whether there is another"""
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'offset')
+        self.limit = self.get_limit(request)
+        self.keys = self.get_keys(request, queryset, view)
+
+        position, reverse = self.decode_cursor(request)
+        keys = [key.reversed() for key in self.keys] if reverse else self.keys
+
+        queryset = queryset.order_by(*[key.order_by() for key in keys])
+        if position is not None:
+            queryset = queryset.filter(self.build_after_condition(keys, position))
+        return queryset[:self.limit + 1], position, reverse
+
+    def set_page(self, rows, position, reverse):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_keys(self, request, queryset, view):
+        """Resolve the view ordering (OrderingFilter aware) into keyset keys ending with the tie-breaker"""
+        ordering_filter = next(
+            (backend for backend in getattr(view, 'filter_backends', []) if issubclass(backend, filters.OrderingFilter)),
+            filters.OrderingFilter,
+        )
+        ordering = ordering_filter().get_ordering(request, queryset, view) or []
+        model = queryset.model
+        keys = []
+        for name in ordering:
+            descending = name.startswith('-')
+            field = self.get_field(queryset, name.lstrip('-'))
+            if field is None or not field.concrete:
+                raise ImproperlyConfigured(f'Keyset pagination can not order {model.__name__} by "{name}"')
+            keys.append(KeysetKey(field, descending, nulls_last=True))
+
+        if not any(key.field.name == self.tie_breaker for key in keys):
+            descending = keys[-1].descending if keys else False
+            keys.append(KeysetKey(model._meta.get_field(self.tie_breaker), descending, nulls_last=True))
+        return keys
+
+    @staticmethod
+    def get_field(queryset, name):
+        """Model field, or a detached copy of an annotation's output field named after it"""
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            pass
+        annotation = queryset.query.annotations.get(name)
+        if annotation is None:
+            return None
+        field = copy(annotation.output_field)
+        field.set_attributes_from_name(name)
+        return field
+
+    @staticmethod
+    def build_after_condition(keys, position):
+        """Lexicographic ``(k1, k2, ...) > (v1, v2, ...)`` expressed with plain lookups"""
+        clauses = []
+        equal = Q()
+        for key, value in zip(keys, position):
+            after = key.after(value)
+            if after is not None:
+                clauses.append(equal & after)
+            equal &= key.equal(value)
+        if not clauses:
+            return Q(pk__in=[])
+        return reduce(operator.or_, clauses)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            raw_position = payload['p']
+            reverse = bool(payload.get('r'))
+            if len(raw_position) != len(self.keys):
+                raise ValueError
+            position = [
+                None if value is None else key.field.to_python(value)
+                for key, value in zip(self.keys, raw_position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        position = []
+        for key in self.keys:
+            value = getattr(row, key.attname)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            position.append(value)
+        payload = {'p': position}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class AsyncLimitOffsetPagination(LimitOffsetPagination):
+    """LimitOffsetPagination with twins of paginate_queryset() for async views and for lists over several shards"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+    def paginate_shards(self, queryset, shards, request, view=None):
+        """Every shard returns its first offset + limit rows, deep pages cost as much on each of them"""
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = sum(sharding.scatter(queryset, lambda shard: shard.count(), shards))
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count == 0 or self.offset > self.count:
+            return []
+        keys = KeysetPagination().get_keys(request, queryset, view)
+        stop = self.offset + self.limit
+        queryset = queryset.order_by(*[key.order_by() for key in keys])[:stop]
+        return sharding.gather(queryset, keys, shards)[self.offset:stop]
+
+
+class LimitOffsetKeysetPagination(AsyncLimitOffsetPagination):
+    """
+    Limit/offset contract for existing clients. Passing ``?cursor=...`` (or ``?pagination=cursor``
+    for the first page) switches the request to keyset pagination.
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def paginate_shards(self, queryset, shards, request, view=None):
+        self.keyset = None
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_shards(queryset, shards, request, view)
+        return super().paginate_shards(queryset, shards, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def keyset_requested(self, request):
+        return (
+            self.keyset_class.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
@@ -1,6 +1,35 @@
+from django.db.models import F
 from rest_framework import permissions
 
+from goals import sharding
 from goals.models import BoardParticipant
+from goals.roles import get_board_role, get_role_map
+
+WRITE_ROLES = (BoardParticipant.Role.owner, BoardParticipant.Role.writer)
+
+
+def with_user_role(queryset, user, board_path=''):
+    """
+    Restrict queryset to boards the user participates in and annotate ``user_role``
+    from the same participants join, so object permissions need no extra query
+    """
+    if board_path and sharding.sharded():
+        # participants stay on the default database, rows of moved boards can not join them:
+        # the role map holds the same rows and permissions fall back to it
+        return queryset.filter(**{f'{board_path}__in': list(get_role_map(user.id))})
+    prefix = f'{board_path}__' if board_path else ''
+    return queryset.filter(
+        **{f'{prefix}participants__user': user}
+    ).annotate(
+        user_role=F(f'{prefix}participants__role')
+    )
+
+
+def get_user_role(user, obj, get_board_id):
+    """Role annotated by the view queryset, or the cached role map for objects loaded elsewhere"""
+    if hasattr(obj, 'user_role'):
+        return obj.user_role
+    return get_board_role(user, get_board_id(obj))
 
 
 class IsOwner(permissions.BasePermission):
@@ -9,37 +38,36 @@ class IsOwner(permissions.BasePermission):
         return obj.user_id == request.user.id
 
 
-class BoardPermissions(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        if not request.user.is_authenticated:
-            return False
-        if request.method in permissions.SAFE_METHODS:
-            return BoardParticipant.objects.filter(user=request.user, board=obj).exists()
-        return BoardParticipant.objects.filter(user=request.user, board=obj, role=BoardParticipant.Role.owner).exists()
+class BoardRolePermissions(permissions.BasePermission):
+    write_roles = WRITE_ROLES
 
+    def get_board_id(self, obj):
+        return obj.board_id
 
-class GoalCategoryPermissions(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
+        role = get_user_role(request.user, obj, self.get_board_id)
+        if role is None:
+            return False
         if request.method in permissions.SAFE_METHODS:
-            return BoardParticipant.objects.filter(user=request.user, board=obj.board).exists()
-        return BoardParticipant.objects.filter(user=request.user,
-                                               board=obj.board,
-                                               role__in=[BoardParticipant.Role.owner, BoardParticipant.Role.writer],
-                                               ).exists()
+            return True
+        return role in self.write_roles
 
 
-class GoalPermissions(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        if not request.user.is_authenticated:
-            return False
-        if request.method in permissions.SAFE_METHODS:
-            return BoardParticipant.objects.filter(user=request.user, board=obj.category.board).exists()
-        return BoardParticipant.objects.filter(user=request.user,
-                                               board=obj.category.board,
-                                               role__in=[BoardParticipant.Role.owner, BoardParticipant.Role.writer]
-                                               ).exists()
+class BoardPermissions(BoardRolePermissions):
+    write_roles = (BoardParticipant.Role.owner,)
+
+    def get_board_id(self, obj):
+        return obj.id
+
+
+class GoalCategoryPermissions(BoardRolePermissions):
+    pass
+
+
+class GoalPermissions(BoardRolePermissions):
+    pass
 
 
 class GoalCommentPermissions(permissions.BasePermission):
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with one prebuilt encoder and no circular reference checks, meant for
+    the plain dict/list trees FastRowSerializer produces. Output bytes are the same
+    """
+
+    def __init__(self):
+        self.encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+            check_circular=False,
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = self.encoder.encode(data)
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Picks NDJSON for streamed exports (?format=ndjson), renders their error responses as one line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode() + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """Picks CSV for streamed exports (?format=csv), renders their error responses as a header and a row"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return b''
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return output.getvalue().encode()
@@ -0,0 +1,85 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.db.routers import use_primary
+from core.metrics import CACHE_REQUESTS
+from goals.models import BoardParticipant
+
+ROLE_MAP_KEY = 'goals:roles:{user_id}'
+
+
+class RoleCacheStats:
+    """Process local hit/miss counters of the role map cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        CACHE_REQUESTS.labels('roles', 'hit' if hit else 'miss').inc()
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else None,
+        }
+
+
+stats = RoleCacheStats()
+
+
+def get_role_map(user_id: int) -> dict[int, int]:
+    """board_id -> role of every board the user participates in"""
+    if not settings.CACHE_SHARED:
+        # other workers would keep a revoked role until ROLE_CACHE_TIMEOUT, invalidation can not reach them
+        return load_role_map(user_id)
+
+    key = ROLE_MAP_KEY.format(user_id=user_id)
+    role_map = cache.get(key)
+    if role_map is not None:
+        stats.record(hit=True)
+        return role_map
+
+    stats.record(hit=False)
+    role_map = load_role_map(user_id)
+    cache.set(key, role_map, settings.ROLE_CACHE_TIMEOUT)
+    return role_map
+
+
+def load_role_map(user_id: int) -> dict[int, int]:
+    # cached for ROLE_CACHE_TIMEOUT, a lagging replica would keep revoked roles alive that long
+    with use_primary():
+        return dict(BoardParticipant.objects.filter(user_id=user_id).values_list('board_id', 'role'))
+
+
+def get_board_role(user, board_id: int) -> int | None:
+    if not user.is_authenticated:
+        return None
+    return get_role_map(user.id).get(board_id)
+
+
+def invalidate_role_maps(user_ids):
+    """
+    Drop cached role maps right away (read-your-writes inside the request) and once more
+    after commit, so a concurrent request can not re-cache rows read before the commit
+    """
+    keys = [ROLE_MAP_KEY.format(user_id=user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
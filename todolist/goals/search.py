@@ -0,0 +1,157 @@
+import re
+from typing import NamedTuple
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, TextField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from goals.models import Goal, GoalComment
+
+WORD = re.compile(r'\w+')
+# baked into the generated search_vector column, changing it needs a migration
+POSTGRES_CONFIG = 'russian'
+HIGHLIGHT_START, HIGHLIGHT_STOP = '<mark>', '</mark>'
+
+
+class SearchIndex(NamedTuple):
+    """Indexed text columns of a model with their weights, most important first"""
+    table: str
+    columns: tuple[str, ...]
+    weights: tuple[float, ...]
+
+
+SEARCH_INDEXES = {
+    Goal: SearchIndex('goals_goal', ('title', 'description'), (1.0, 0.4)),
+    GoalComment: SearchIndex('goals_goalcomment', ('text',), (1.0,)),
+}
+
+
+def search_words(request) -> list[str]:
+    return WORD.findall(request.query_params.get(FullTextSearchFilter.search_param, ''))[:10]
+
+
+class PostgresSearch:
+    """
+    Generated tsvector column with a GIN index, ranked with ts_rank and highlighted with ts_headline.
+    The column is created by migration 0017 and left out of the models: Django writes every model field
+    on INSERT and UPDATE, which a GENERATED ALWAYS column rejects
+    """
+    default_weights = (1.0, 0.4, 0.2, 0.1)
+
+    def search(self, queryset, index: SearchIndex, words: list[str]):
+        query = ' & '.join([*words[:-1], f'{words[-1]}:*'])
+        tsquery = f"to_tsquery('{POSTGRES_CONFIG}', %s)"
+        # ts_rank() takes the weights in D, C, B, A order
+        weights = [*index.weights, *self.default_weights[len(index.weights):]]
+        weights = '{' + ','.join(str(weight) for weight in reversed(weights)) + '}'
+        document = " || ' ' || ".join(f"coalesce({index.table}.{column}, '')" for column in index.columns)
+        return queryset.filter(
+            RawSQL(f'{index.table}.search_vector @@ {tsquery}', [query], output_field=BooleanField())
+        ).annotate(
+            # float8 so the rank survives the JSON cursor round trip exactly
+            search_rank=RawSQL(
+                f"ts_rank('{weights}'::float4[], {index.table}.search_vector, {tsquery})::double precision",
+                [query], output_field=FloatField(),
+            ),
+            search_highlight=RawSQL(
+                f"ts_headline('{POSTGRES_CONFIG}', {document}, {tsquery}, "
+                f"'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2')",
+                [query], output_field=TextField(),
+            ),
+        )
+
+
+class SqliteSearch:
+    """FTS5 external content shadow table kept in step by triggers, for local runs. Created by migration 0017"""
+
+    @staticmethod
+    def triggers(index: SearchIndex) -> dict[str, str]:
+        fts = f'{index.table}_fts'
+        columns = ', '.join(index.columns)
+        new_values = ', '.join(f'new.{column}' for column in index.columns)
+        old_values = ', '.join(f'old.{column}' for column in index.columns)
+        delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+        insert = f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});'
+        return {
+            f'{fts}_ai': f'AFTER INSERT ON {index.table} BEGIN {insert} END',
+            f'{fts}_ad': f'AFTER DELETE ON {index.table} BEGIN {delete} END',
+            f'{fts}_au': f'AFTER UPDATE OF {columns} ON {index.table} BEGIN {delete} {insert} END',
+        }
+
+    def install(self, connection, index: SearchIndex):
+        fts = f'{index.table}_fts'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({', '.join(index.columns)}, "
+                f"content='{index.table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [index.table])
+            existing = {name for name, in cursor.fetchall()}
+            missing = {name: body for name, body in self.triggers(index).items() if name not in existing}
+            for name, body in missing.items():
+                cursor.execute(f'CREATE TRIGGER {name} {body}')
+            if missing:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def search(self, queryset, index: SearchIndex, words: list[str]):
+        fts = f'{index.table}_fts'
+        query = ' '.join([*(f'"{word}"' for word in words[:-1]), f'"{words[-1]}"*'])
+        weights = ', '.join(str(weight) for weight in index.weights)
+        match = f'FROM {fts} WHERE {fts} MATCH %s'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid {match}', [query])
+        ).annotate(
+            # bm25() is lower for better matches
+            search_rank=RawSQL(
+                f'(SELECT -bm25({fts}, {weights}) {match} AND rowid = {index.table}.id)',
+                [query], output_field=FloatField(),
+            ),
+            search_highlight=RawSQL(
+                f"(SELECT snippet({fts}, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '…', 24) "
+                f"{match} AND rowid = {index.table}.id)",
+                [query], output_field=TextField(),
+            ),
+        )
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SqliteSearch(),
+}
+
+
+def repair_sqlite_triggers(using='default', **kwargs):
+    """SQLite drops triggers whenever a migration rebuilds the table, put them back after migrate"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    for index in SEARCH_INDEXES.values():
+        if f'{index.table}_fts' in tables:
+            BACKENDS['sqlite'].install(connection, index)
+
+
+class FullTextSearchFilter(filters.BaseFilterBackend):
+    """
+    Ranked full text search over the model's SEARCH_INDEXES entry. Words are ANDed,
+    the last one is a prefix so results follow the user typing.
+    Annotates ``search_rank`` (higher is better) and ``search_highlight``
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        words = search_words(request)
+        if not words:
+            return queryset
+        backend = BACKENDS[connections[queryset.db].vendor]
+        return backend.search(queryset, SEARCH_INDEXES[queryset.model], words)
+
+
+class SearchOrderingFilter(filters.OrderingFilter):
+    """Best matches first while searching unless the client asked for another ordering"""
+
+    def get_default_ordering(self, view):
+        if search_words(view.request):
+            return ['-search_rank']
+        return super().get_default_ordering(view)
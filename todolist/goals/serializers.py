@@ -1,9 +1,17 @@
+from contextlib import ExitStack
+
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers, exceptions
 
 from core.models import User
 from core.serializers import UserSerializer
-from goals.models import GoalCategory, Goal, GoalComment, Board, BoardParticipant
+from goals import events, sharding
+from goals.models import GoalCategory, Goal, GoalComment, Board, BoardParticipant, CascadeJob
+from goals.permissions import WRITE_ROLES
+from goals.roles import get_board_role, get_role_map, invalidate_role_maps
 
 
 # Boards
@@ -22,9 +30,18 @@ class BoardCreateSerializer(serializers.ModelSerializer):
         return board
 
 
+class ParticipantUserField(serializers.SlugRelatedField):
+    """Username of a participant, resolved for the whole list at once by BoardSerializer.validate_participants"""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid')
+        return data
+
+
 class BoardParticipantSerializer(serializers.ModelSerializer):
     role = serializers.ChoiceField(required=True, choices=BoardParticipant.editable_choices)
-    user = serializers.SlugRelatedField(slug_field='username', queryset=User.objects.all())
+    user = ParticipantUserField(slug_field='username', queryset=User.objects.all())
 
     class Meta:
         model = BoardParticipant
@@ -41,30 +58,72 @@ class BoardSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['id', 'created', 'updated']
 
+    def validate_participants(self, participants):
+        usernames = {part['user'] for part in participants}
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        missing = sorted(usernames - users.keys())
+        if missing:
+            raise serializers.ValidationError([f'Object with username={username} does not exist.' for username in missing])
+        for part in participants:
+            part['user'] = users[part['user']]
+        return participants
+
+    def to_representation(self, instance):
+        if 'participants' not in getattr(instance, '_prefetched_objects_cache', {}):
+            prefetch_related_objects(
+                [instance], Prefetch('participants', queryset=BoardParticipant.objects.select_related('user'))
+            )
+        return super().to_representation(instance)
+
     def update(self, instance, validated_data):
         owner = validated_data.pop('user')
-        new_participants = validated_data.pop('participants')
+        new_participants = validated_data.pop('participants', None)
         with transaction.atomic():
-            for part in new_participants:
-                new_part_ids = {part['user'].id: part}
-
-            old_participants = instance.participants.exclude(user=owner)
-
-            for old_participant in old_participants:
-                if old_participant.user_id not in new_part_ids:
-                    old_participant.delete()
-                else:
-                    if old_participant.role != new_part_ids[old_participant.user_id]['role']:
-                        old_participant.role = new_part_ids[old_participant.user_id]['role']
-                        old_participant.save()
-                    new_part_ids.pop(old_participant.user_id)
-            for new_part in new_part_ids.values():
-                BoardParticipant.objects.create(board=instance, user=new_part['user'], role=new_part['role'])
-            instance.title = validated_data['title']
+            if new_participants is not None:
+                self._replace_participants(instance, owner, new_participants)
+            instance.title = validated_data.get('title', instance.title)
             instance.save()
 
         return instance
 
+    @staticmethod
+    def _replace_participants(board, owner, new_participants):
+        """Set based diff: one select, one delete, one bulk_update and one bulk_create whatever the board size"""
+        new_parts = {part['user'].id: part for part in new_participants if part['user'].id != owner.id}
+        old_parts = {part.user_id: part for part in board.participants.exclude(user=owner)}
+
+        removed = old_parts.keys() - new_parts.keys()
+        if removed:
+            board.participants.filter(user_id__in=removed).delete()
+
+        now = timezone.now()
+        changed = []
+        for user_id in old_parts.keys() & new_parts.keys():
+            part = old_parts[user_id]
+            if part.role != new_parts[user_id]['role']:
+                part.role = new_parts[user_id]['role']
+                part.updated = now
+                changed.append(part)
+        if changed:
+            BoardParticipant.objects.bulk_update(changed, fields=['role', 'updated'])
+
+        added = [
+            BoardParticipant(board=board, user=part['user'], role=part['role'], created=now, updated=now)
+            for user_id, part in new_parts.items() if user_id not in old_parts
+        ]
+        if added:
+            BoardParticipant.objects.bulk_create(added)
+            sharding.replicate_users(board.id, [part.user_id for part in added])
+
+        # bulk writes send no signals, deletes above already did
+        for part in changed:
+            events.publish(board.id, 'participant', part.id, 'updated', user=part.user_id)
+        for part in added:
+            events.publish(board.id, 'participant', part.id, 'created', user=part.user_id)
+
+        invalidate_role_maps([*removed, *(part.user_id for part in changed), *(part.user_id for part in added)])
+        board._prefetched_objects_cache = {}
+
 
 class BoardListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -84,12 +143,7 @@ class GoalCategoryCreateSerializer(serializers.ModelSerializer):
     def validate_board(self, value):
         if value.is_deleted:
             raise serializers.ValidationError("not allowed for deleted board")
-        allowed = BoardParticipant.objects.filter(
-            board=value.id,
-            role__in=[BoardParticipant.Role.owner, BoardParticipant.Role.writer],
-            user=self.context["request"].user,
-        ).exists()
-        if not allowed:
+        if get_board_role(self.context['request'].user, value.id) not in WRITE_ROLES:
             raise serializers.ValidationError("must be owner or writer of the board")
         return value
 
@@ -103,36 +157,52 @@ class GoalCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created', 'updated', 'user', 'board']
 
 
+class ShardedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Looked up on the databases of the user's boards, rows of moved boards are not on the default one"""
+
+    def to_internal_value(self, data):
+        if not sharding.sharded():
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            instance = sharding.locate(
+                sharding.user_querysets(self.get_queryset().filter(pk=data), self.context['request'].user)
+            )
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
 # Goals
 class GoalCreateSerializer(serializers.ModelSerializer):
-    category = serializers.PrimaryKeyRelatedField(
+    category = ShardedPrimaryKeyRelatedField(
         queryset=GoalCategory.objects.filter(is_deleted=False)
     )
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Goal
-        fields = '__all__'
+        exclude = ['board']
         read_only_fields = ['id', 'created', 'updated', 'user']
 
     def validate_category(self, value):
         if value.is_deleted:
             raise serializers.ValidationError('not allowed in deleted category')
 
-        allowed = BoardParticipant.objects.filter(
-            board_id=value.board_id,
-            role__in=[BoardParticipant.Role.owner, BoardParticipant.Role.writer],
-            user=self.context["request"].user,
-        ).exists()
-        if not allowed:
+        if get_board_role(self.context['request'].user, value.board_id) not in WRITE_ROLES:
             raise serializers.ValidationError("must be owner or writer of the goal")
         return value
 
 
 class GoalSerializer(serializers.ModelSerializer):
+    serializer_related_field = ShardedPrimaryKeyRelatedField
+
     class Meta:
         model = Goal
-        fields = '__all__'
+        exclude = ['board']
         read_only_fields = ['id', 'created', 'updated', 'user']
 
     def validate_category(self, value):
@@ -140,14 +210,173 @@ class GoalSerializer(serializers.ModelSerializer):
         #     raise exceptions.PermissionDenied
         if value.is_deleted:
             raise serializers.ValidationError('not allowed in deleted category')
+        if self.instance is not None and value._state.db != self.instance._state.db:
+            raise serializers.ValidationError('not allowed in a category on another database, move its board first')
 
         return value
 
 
+class GoalSearchSerializer(GoalSerializer):
+    highlight = serializers.CharField(source='search_highlight', read_only=True)
+
+
+class GoalBulkOperationSerializer(serializers.Serializer):
+    required_fields = {
+        'create': ['title', 'category'],
+        'update': ['id'],
+        'archive': ['id'],
+        'move': ['id', 'category'],
+    }
+
+    op = serializers.ChoiceField(choices=list(required_fields))
+    id = serializers.IntegerField(required=False)
+    title = serializers.CharField(required=False, max_length=255)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    category = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(required=False, choices=Goal.Status.choices)
+    priority = serializers.ChoiceField(required=False, choices=Goal.Priority.choices)
+    due_date = serializers.DateTimeField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        missing = {name: ['This field is required.'] for name in self.required_fields[attrs['op']] if name not in attrs}
+        if missing:
+            raise serializers.ValidationError(missing)
+        if attrs['op'] == 'update' and 'status' not in attrs and 'priority' not in attrs:
+            raise serializers.ValidationError('status or priority is required')
+        return attrs
+
+
+class GoalImportRowSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    category = serializers.IntegerField()
+    status = serializers.ChoiceField(required=False, choices=Goal.Status.choices)
+    priority = serializers.ChoiceField(required=False, choices=Goal.Priority.choices)
+    due_date = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class GoalBulkSerializer(serializers.Serializer):
+    """
+    Batch of goal operations: permissions are checked against one role map lookup,
+    goals and categories are loaded with one query each and changes are written with
+    bulk_create/bulk_update in a single transaction. Invalid items are reported, not applied.
+    """
+    operations = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=settings.GOAL_BULK_MAX_OPERATIONS
+    )
+
+    updated_fields = ['status', 'priority', 'category', 'board', 'updated']
+
+    def save(self, **kwargs):
+        user = self.context['request'].user
+        operations = self.validated_data['operations']
+        results = [None] * len(operations)
+
+        valid = []
+        for index, data in enumerate(operations):
+            item = GoalBulkOperationSerializer(data=data)
+            if item.is_valid():
+                valid.append((index, item.validated_data))
+            else:
+                results[index] = {'index': index, 'op': data.get('op'), 'status': 'error', 'errors': item.errors}
+
+        role_map = get_role_map(user.id)
+        writable_boards = [board_id for board_id, role in role_map.items() if role in WRITE_ROLES]
+        goal_ids = {data['id'] for _, data in valid if 'id' in data}
+        category_ids = {data['category'] for _, data in valid if 'category' in data}
+        shards = list(sharding.by_shard(role_map))
+
+        with ExitStack() as stack:
+            goals, categories = {}, {}
+            for alias in shards:
+                # one transaction per database, a batch spanning boards on several shards is atomic on each of them
+                stack.enter_context(transaction.atomic(using=alias))
+                goals.update(Goal.objects.using(alias).select_for_update().filter(
+                    id__in=goal_ids, board_id__in=list(role_map)
+                ).in_bulk())
+                categories.update(GoalCategory.objects.using(alias).filter(
+                    id__in=category_ids, board_id__in=writable_boards, is_deleted=False
+                ).in_bulk())
+
+            now = timezone.now()
+            created, changed = [], {}
+            for index, data in valid:
+                op = data['op']
+                error = self._check(data, goals, categories, writable_boards)
+                if error:
+                    results[index] = {'index': index, 'op': op, 'status': 'error', 'errors': error}
+                    continue
+
+                if op == 'create':
+                    category = categories[data['category']]
+                    goal = Goal(
+                        title=data['title'],
+                        description=data.get('description'),
+                        category=category,
+                        board_id=category.board_id,
+                        status=data.get('status', Goal.Status.to_do),
+                        priority=data.get('priority', Goal.Priority.medium),
+                        due_date=data.get('due_date'),
+                        user=user,
+                        created=now,
+                        updated=now,
+                    )
+                    created.append((index, goal))
+                    continue
+
+                goal = goals[data['id']]
+                if op == 'update':
+                    for name in ('status', 'priority'):
+                        if name in data:
+                            setattr(goal, name, data[name])
+                elif op == 'archive':
+                    goal.status = Goal.Status.archived
+                elif op == 'move':
+                    category = categories[data['category']]
+                    goal.category = category
+                    goal.board_id = category.board_id
+                goal.updated = now
+                changed[goal.id] = goal
+                results[index] = {'index': index, 'op': op, 'status': 'ok', 'id': goal.id}
+
+            for alias in shards:
+                Goal.objects.using(alias).bulk_create(
+                    [goal for _, goal in created if goal.category._state.db == alias], batch_size=500
+                )
+                Goal.objects.using(alias).bulk_update(
+                    [goal for goal in changed.values() if goal._state.db == alias],
+                    fields=self.updated_fields, batch_size=500,
+                )
+
+            for _, goal in created:
+                events.publish(goal.board_id, 'goal', goal.id, 'created', using=goal._state.db)
+            for goal in changed.values():
+                events.publish(goal.board_id, 'goal', goal.id, 'updated', using=goal._state.db)
+
+        for index, goal in created:
+            results[index] = {'index': index, 'op': 'create', 'status': 'ok', 'id': goal.id}
+        return results
+
+    @staticmethod
+    def _check(data, goals, categories, writable_boards):
+        if 'id' in data:
+            goal = goals.get(data['id'])
+            if goal is None:
+                return {'id': ['goal not found']}
+            if goal.board_id not in writable_boards:
+                return {'id': ['must be owner or writer of the goal']}
+        if 'category' in data and data['category'] not in categories:
+            return {'category': ['category not found or not writable']}
+        if 'id' in data and 'category' in data \
+                and categories[data['category']]._state.db != goals[data['id']]._state.db:
+            return {'category': ['not allowed in a category on another database, move its board first']}
+        return None
+
+
 # GoalComments
 class GoalCommentCreateSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    goal = serializers.PrimaryKeyRelatedField(
+    goal = ShardedPrimaryKeyRelatedField(
         queryset=Goal.objects.all()
     )
 
@@ -157,12 +386,7 @@ class GoalCommentCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created', 'updated', 'user']
 
     def validate_goal(self, value):
-        allowed = BoardParticipant.objects.filter(
-            board_id=value.category.board_id,
-            role__in=[BoardParticipant.Role.owner, BoardParticipant.Role.writer],
-            user=self.context["request"].user,
-        ).exists()
-        if not allowed:
+        if get_board_role(self.context['request'].user, value.board_id) not in WRITE_ROLES:
             raise serializers.ValidationError("must be owner or writer of the goal")
         return value
 
@@ -174,3 +398,14 @@ class GoalCommentSerializer(serializers.ModelSerializer):
         model = GoalComment
         fields = '__all__'
         read_only_fields = ['id', 'created', 'updated', 'user', 'goal']
+
+
+class GoalCommentSearchSerializer(GoalCommentSerializer):
+    highlight = serializers.CharField(source='search_highlight', read_only=True)
+
+
+# Cascade jobs
+class CascadeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CascadeJob
+        exclude = ['user']
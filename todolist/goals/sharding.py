@@ -0,0 +1,232 @@
+import heapq
+from copy import copy
+from functools import total_ordering
+
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.db import routers
+from core.models import User
+from goals.models import Board, BoardShard, GoalCategory, Goal, GoalComment, GoalCounter, SyncTombstone
+from goals.roles import get_role_map
+
+# a board's subtree, rows that always live on the board's shard. In foreign key order.
+# Boards and participants are the directory every request reads, they stay on the default database:
+# shards hold a copy of the board row and of the profiles of its users for their foreign keys
+SHARDED_MODELS = (GoalCategory, Goal, GoalCounter, GoalComment, SyncTombstone)
+# copied next to board rows, what their serializers show. Copies can not log in
+USER_FIELDS = ('username', 'first_name', 'last_name', 'email', 'date_joined')
+
+
+def sharded() -> bool:
+    return len(settings.GOAL_SHARDS) > 1
+
+
+def directory(board_ids) -> dict[int, BoardShard]:
+    """Directory rows of the moved boards, read from the primary since moves must be seen at once"""
+    if not sharded() or not board_ids:
+        return {}
+    return BoardShard.objects.using(DEFAULT_DB_ALIAS).in_bulk(list(board_ids))
+
+
+def shard_map(board_ids) -> dict[int, str]:
+    shards = dict.fromkeys(board_ids, DEFAULT_DB_ALIAS)
+    shards.update((board_id, entry.shard) for board_id, entry in directory(shards).items())
+    return shards
+
+
+def shard_of(board_id: int) -> str:
+    return shard_map([board_id])[board_id]
+
+
+def by_shard(board_ids) -> dict[str, list[int]]:
+    """Boards grouped by database, in GOAL_SHARDS order"""
+    groups = {}
+    for board_id, alias in shard_map(board_ids).items():
+        groups.setdefault(alias, []).append(board_id)
+    return {alias: groups[alias] for alias in settings.GOAL_SHARDS if alias in groups}
+
+
+def shards_in_use() -> list[str]:
+    """The default database and the shards boards were moved to"""
+    if not sharded():
+        return [DEFAULT_DB_ALIAS]
+    moved = set(BoardShard.objects.using(DEFAULT_DB_ALIAS).values_list('shard', flat=True))
+    return [alias for alias in settings.GOAL_SHARDS if alias == DEFAULT_DB_ALIAS or alias in moved]
+
+
+def user_shards(user) -> list[str]:
+    """Databases holding the boards the user participates in, the default one when there are none"""
+    if not sharded():
+        return [DEFAULT_DB_ALIAS]
+    return list(by_shard(get_role_map(user.id))) or [DEFAULT_DB_ALIAS]
+
+
+def user_querysets(queryset, user) -> list:
+    """The queryset on every database of the user's boards, left to the routers while there is one database"""
+    if not sharded():
+        return [queryset]
+    return [queryset.using(alias) for alias in user_shards(user)]
+
+
+def locate(querysets):
+    """First row of the first queryset having one, rows of a board live on a single database"""
+    for queryset in querysets:
+        row = queryset.first()
+        if row is not None:
+            return row
+    return None
+
+
+class BoardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The board is being moved to another database, try again in a minute'
+    default_code = 'board_moving'
+
+
+def writable_shard(board_id: int | None) -> str:
+    """Database to write the board's rows to, BoardMoving while move_board copies them"""
+    entry = directory([board_id]).get(board_id) if board_id is not None else None
+    if entry is None:
+        return DEFAULT_DB_ALIAS
+    if entry.moving:
+        raise BoardMoving()
+    return entry.shard
+
+
+def copy_users(user_ids, using: str):
+    """Copy the profiles of users to a shard, rows there reference them"""
+    users = [
+        User(pk=user.pk, password=UNUSABLE_PASSWORD_PREFIX, **{name: getattr(user, name) for name in USER_FIELDS})
+        for user in User._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=set(user_ids)).only(*USER_FIELDS)
+    ]
+    User._base_manager.using(using).bulk_create(
+        users, batch_size=1000, update_conflicts=True, update_fields=USER_FIELDS, unique_fields=['id'],
+    )
+
+
+def copy_board(board: Board, using: str):
+    fields = [field.name for field in Board._meta.concrete_fields if not field.primary_key]
+    # bulk_create() moves the instances it saves to the database it saved them to
+    Board._base_manager.using(using).bulk_create(
+        [copy(board)], update_conflicts=True, update_fields=fields, unique_fields=['id'],
+    )
+
+
+def replicate_users(board_id: int, user_ids):
+    """Copy users to the board's shard before they write there, on participant creation"""
+    if not sharded():
+        return
+    alias = shard_of(board_id)
+    if alias != DEFAULT_DB_ALIAS:
+        copy_users(user_ids, alias)
+
+
+def board_id_of(instance) -> int | None:
+    if isinstance(instance, GoalComment):
+        goal = instance._state.fields_cache.get('goal')
+        return goal.board_id if goal is not None else None
+    return instance.board_id
+
+
+class ShardRouter:
+    """
+    Rows of a board's subtree are written to the board's shard, refused while move_board moves it,
+    and reads through a row or a board, like related managers, go to the same database. Anything
+    else, the directory included, falls through to ReplicaRouter. Querysets of sharded models do not
+    know their board: code reading them picks the database with using(), see user_querysets().
+    Inert while GOAL_SHARDS only lists the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if not sharded() or instance is None or model not in SHARDED_MODELS:
+            return None
+        if isinstance(instance, Board):
+            return shard_of(instance.pk)
+        if isinstance(instance, SHARDED_MODELS) and instance._state.db is not None:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if not sharded() or instance is None or model not in SHARDED_MODELS:
+            return None
+        if isinstance(instance, Board):
+            alias = writable_shard(instance.pk)
+        elif isinstance(instance, SHARDED_MODELS):
+            if not isinstance(instance, model) and instance._state.db is not None:
+                # a related row, like goal.category = category or category.goals.update()
+                return instance._state.db
+            # the database of a new row comes from its board, whatever the related rows assigned to it set
+            board_id = board_id_of(instance)
+            if board_id is None:
+                return instance._state.db
+            alias = writable_shard(board_id)
+            if not instance._state.adding and instance._state.db is not None:
+                alias = instance._state.db
+        else:
+            return None
+
+        routing = routers.current()
+        if routing is not None:
+            routing.wrote = True
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharded() or not isinstance(obj1, SHARDED_MODELS) or not isinstance(obj2, SHARDED_MODELS):
+            # users and boards have a copy on every shard their rows reference them from
+            return True if sharded() else None
+        if obj1._state.adding or obj2._state.adding or obj1._state.db is None or obj2._state.db is None:
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in settings.GOAL_SHARDS:
+            return None
+        # shards get the whole schema, for the board and user copies, but not the directory
+        return not (app_label == 'goals' and model_name == 'boardshard')
+
+
+@total_ordering
+class Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def merge_key(keys):
+    """Sort key of rows ordered by the pagination.KeysetKey list ``keys``"""
+    def key(row):
+        values = []
+        for keyset_key in keys:
+            value = getattr(row, keyset_key.attname)
+            values.append((value is None) == keyset_key.nulls_last)
+            values.append(0 if value is None else Descending(value) if keyset_key.descending else value)
+        return values
+
+    return key
+
+
+def scatter(queryset, fetch, shards) -> list:
+    """``fetch(queryset)`` on every database of ``shards``, one after the other"""
+    return [fetch(queryset.using(alias)) for alias in shards]
+
+
+def gather(queryset, keys, shards) -> list:
+    """
+    Rows of ``queryset``, ordered (and sliced) by ``keys``, from every database of ``shards`` merged
+    into one list. Strings are merged by code point rather than by the database collation, so titles
+    differing only by case or accents may come out in another order than one database would sort them
+    """
+    return list(heapq.merge(*scatter(queryset, list, shards), key=merge_key(keys)))
@@ -0,0 +1,103 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import User
+from goals import counters, events, sharding
+from goals.models import Board, BoardParticipant, GoalCategory, Goal, GoalComment, SyncTombstone
+from goals.roles import invalidate_role_maps
+
+
+@receiver(post_save, sender=BoardParticipant)
+@receiver(post_delete, sender=BoardParticipant)
+def participant_changed(sender, instance, **kwargs):
+    invalidate_role_maps([instance.user_id])
+
+
+@receiver(post_save, sender=BoardParticipant)
+def participant_replicated(sender, instance, created, **kwargs):
+    if created:
+        sharding.replicate_users(instance.board_id, [instance.user_id])
+
+
+@receiver(post_delete, sender=Goal)
+def goal_deleted(sender, instance, **kwargs):
+    counters.apply_deltas(counters.Counter({counters.counter_key(instance): -1}), using=instance._state.db)
+
+
+@receiver(pre_delete, sender=Goal)
+def goal_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.using(instance._state.db).create(
+        model='goal', object_id=instance.id, board_id=instance.board_id
+    )
+
+
+def comment_board_id(comment) -> int | None:
+    """Board of the comment, without loading its goal unless the goal was loaded already"""
+    if GoalComment.goal.is_cached(comment):
+        return comment.goal.board_id
+    return Goal.objects.using(comment._state.db).filter(id=comment.goal_id).values_list(
+        'board_id', flat=True
+    ).first()
+
+
+@receiver(pre_delete, sender=GoalComment)
+def comment_tombstone(sender, instance, using, **kwargs):
+    # pre_delete runs before the cascade removes the goal, so its board is still there
+    board_id = comment_board_id(instance)
+    if board_id is not None:
+        SyncTombstone.objects.using(instance._state.db).create(
+            model='comment', object_id=instance.id, board_id=board_id
+        )
+        events.publish(board_id, 'comment', instance.id, 'deleted', using=using)
+
+
+@receiver(post_save, sender=Board)
+def board_event(sender, instance, created, using, **kwargs):
+    events.publish(instance.id, 'board', instance.id, 'created' if created else 'updated', using=using)
+
+
+@receiver(post_save, sender=Board)
+def board_replicated(sender, instance, created, **kwargs):
+    # exports read the title next to the goals, new boards are always on the default database
+    if not created and sharding.sharded() and instance._state.db == DEFAULT_DB_ALIAS:
+        alias = sharding.shard_of(instance.id)
+        if alias != DEFAULT_DB_ALIAS:
+            sharding.copy_board(instance, alias)
+
+
+@receiver(post_save, sender=GoalCategory)
+@receiver(post_save, sender=Goal)
+def board_object_event(sender, instance, created, using, **kwargs):
+    model = 'category' if sender is GoalCategory else 'goal'
+    events.publish(instance.board_id, model, instance.id, 'created' if created else 'updated', using=using)
+
+
+@receiver(post_delete, sender=Goal)
+def goal_deleted_event(sender, instance, using, **kwargs):
+    events.publish(instance.board_id, 'goal', instance.id, 'deleted', using=using)
+
+
+@receiver(post_save, sender=GoalComment)
+def comment_event(sender, instance, created, using, **kwargs):
+    action = 'created' if created else 'updated'
+    events.publish(comment_board_id(instance), 'comment', instance.id, action, using=using)
+
+
+@receiver(post_save, sender=BoardParticipant)
+@receiver(post_delete, sender=BoardParticipant)
+def participant_event(sender, instance, using, created=None, **kwargs):
+    action = 'deleted' if created is None else 'created' if created else 'updated'
+    events.publish(instance.board_id, 'participant', instance.id, action, using=using, user=instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_replicated(sender, instance, created, update_fields=None, **kwargs):
+    # new users have no boards yet and last_login on every login is not part of the copies
+    if created or not sharding.sharded():
+        return
+    if update_fields is not None and not set(update_fields) & set(sharding.USER_FIELDS):
+        return
+    for alias in sharding.user_shards(instance):
+        if alias != DEFAULT_DB_ALIAS:
+            sharding.copy_users([instance.id], alias)
@@ -0,0 +1,151 @@
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from core.db.routers import use_primary
+from goals import sharding
+from goals.models import Board, GoalCategory, Goal, GoalComment, SyncTombstone
+from goals.roles import get_role_map
+from goals.serializers import BoardListSerializer, GoalCategorySerializer, GoalSerializer, GoalCommentSerializer
+
+
+class SyncCollection:
+    # rows of moved boards live on their shard, boards themselves stay on the default database
+    sharded = True
+    board_field = 'board_id'
+
+    def __init__(self, name, serializer_class=None, time_field='updated'):
+        self.name = name
+        self.serializer_class = serializer_class
+        self.time_field = time_field
+
+    def get_queryset(self, board_ids):
+        raise NotImplementedError
+
+    def changes(self, board_ids, synced, cursor, limit, shards):
+        """
+        Rows after the (time, id) cursor, oldest first, one extra row tells whether there are more.
+        The cursor only covers the ``synced`` boards, rows of the others are all sent.
+        Each database of ``shards`` returns its first rows and they are merged
+        """
+        queryset = self.get_queryset(board_ids)
+        if cursor is not None:
+            moment, last_id = cursor
+            after = Q(**{f'{self.time_field}__gt': moment}) | Q(**{self.time_field: moment, 'id__gt': last_id})
+            new_board_ids = [board_id for board_id in board_ids if board_id not in synced]
+            if new_board_ids:
+                after |= Q(**{f'{self.board_field}__in': new_board_ids})
+            queryset = queryset.filter(after)
+        queryset = queryset.order_by(self.time_field, 'id')[:limit + 1]
+        if not self.sharded:
+            shards = [DEFAULT_DB_ALIAS]
+        rows = list(heapq.merge(*sharding.scatter(queryset, list, shards), key=attrgetter(self.time_field, 'id')))
+        rows = rows[:limit + 1]
+        return rows[:limit], len(rows) > limit
+
+    def represent(self, rows):
+        return self.serializer_class(rows, many=True).data
+
+
+class BoardCollection(SyncCollection):
+    sharded = False
+    board_field = 'id'
+
+    def get_queryset(self, board_ids):
+        return Board.objects.filter(id__in=board_ids)
+
+
+class CategoryCollection(SyncCollection):
+    def get_queryset(self, board_ids):
+        return GoalCategory.objects.filter(board_id__in=board_ids).select_related('user')
+
+
+class GoalCollection(SyncCollection):
+    def get_queryset(self, board_ids):
+        return Goal.objects.filter(board_id__in=board_ids)
+
+
+class CommentCollection(SyncCollection):
+    board_field = 'goal__board_id'
+
+    def get_queryset(self, board_ids):
+        return GoalComment.objects.filter(goal__board_id__in=board_ids).select_related('user')
+
+
+class TombstoneCollection(SyncCollection):
+    def get_queryset(self, board_ids):
+        return SyncTombstone.objects.filter(board_id__in=board_ids)
+
+    def represent(self, rows):
+        return [{'model': row.model, 'id': row.object_id} for row in rows]
+
+
+COLLECTIONS = [
+    BoardCollection('boards', BoardListSerializer),
+    CategoryCollection('categories', GoalCategorySerializer),
+    GoalCollection('goals', GoalSerializer),
+    CommentCollection('comments', GoalCommentSerializer),
+    TombstoneCollection('deleted', time_field='deleted'),
+]
+
+
+def encode_token(board_ids, cursors: dict) -> str:
+    payload = {
+        'boards': board_ids,
+        'cursors': {name: [moment.isoformat(), last_id] for name, (moment, last_id) in cursors.items()},
+    }
+    return urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode('ascii')
+
+
+def decode_token(token: str | None) -> tuple[set[int], dict]:
+    """Boards the cursors cover and the (time, id) cursor of every collection"""
+    if not token:
+        return set(), {}
+    try:
+        payload = json.loads(urlsafe_b64decode(token.encode('ascii')))
+        return {int(board_id) for board_id in payload['boards']}, {
+            name: (datetime.fromisoformat(moment), int(last_id))
+            for name, (moment, last_id) in payload['cursors'].items()
+        }
+    except (TypeError, ValueError, KeyError, UnicodeError, AttributeError):
+        raise ValidationError({'token': ['invalid sync token']})
+
+
+def sync(user, token: str | None, limit: int) -> dict:
+    """
+    Rows created, updated or deleted since the token on every board the user participates in, and every row
+    of the boards the user joined since. Complete collections restart from "now minus SYNC_SAFETY_WINDOW"
+    next time, so rows committed late by slow transactions are still picked up (clients apply rows
+    idempotently by id)
+    """
+    synced, cursors = decode_token(token)
+    board_ids = list(get_role_map(user.id))
+    shards = list(sharding.by_shard(board_ids)) or [DEFAULT_DB_ALIAS]
+    restart = (timezone.now() - timedelta(seconds=settings.SYNC_SAFETY_WINDOW), 0)
+
+    response = {'board_ids': board_ids, 'has_more': False}
+    next_cursors = {}
+    for collection in COLLECTIONS:
+        # restart cursors assume every row committed before the window is visible, a replica lagging
+        # further behind would make clients skip rows for good
+        with use_primary():
+            rows, has_more = collection.changes(board_ids, synced, cursors.get(collection.name), limit, shards)
+            response[collection.name] = collection.represent(rows)
+        if has_more:
+            response['has_more'] = True
+            last = rows[-1]
+            next_cursors[collection.name] = (getattr(last, collection.time_field), last.id)
+        else:
+            next_cursors[collection.name] = restart
+
+    # rows of new boards up to a truncated collection's last row were sent with it, its cursor covers them now
+    response['token'] = encode_token(board_ids, next_cursors)
+    return response
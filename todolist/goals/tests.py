@@ -1,10 +1,41 @@
-from django.test import TestCase, Client
+import csv
+import heapq
+import json
+from collections import namedtuple
+from io import StringIO
+from tempfile import NamedTemporaryFile
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 
+from core.asgi import ASGIHandler
 from core.models import User
-from goals.models import GoalCategory, Goal, Board, BoardParticipant
+from core.tests import PooledDatabaseMixin
+from goals import events, roles, sharding
+from goals.cascades import process_next_chunk
+from goals.events import BoardEventsApplication
+from goals.fast import FastRowSerializer
+from goals.models import GoalCategory, Goal, Board, BoardParticipant, BoardShard, CascadeJob, GoalCounter, \
+    GoalComment, SyncTombstone
+from goals.pagination import KeysetKey
+from goals.renderers import FastJSONRenderer
+from goals.serializers import BoardListSerializer, GoalCategorySerializer, GoalCommentSerializer, GoalSerializer
+
+# query budgets are for one database, shard lookups read the board directory on top of them
+one_database = override_settings(GOAL_SHARDS=['default'])
 
 
 class GoalCreateTestCase(TestCase):
@@ -150,3 +181,1453 @@ class OneGoalTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Goal.objects.first().status, Goal.Status.archived)
+
+
+class GoalListPaginationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('goal-list')
+        self.user = User.objects.create(
+            username='test_user',
+            password='test_password'
+        )
+        self.board = Board.objects.create(
+            title='test_board_title'
+        )
+        BoardParticipant.objects.create(
+            board=self.board,
+            user=self.user,
+            role=BoardParticipant.Role.owner.value
+        )
+        self.category = GoalCategory.objects.create(
+            title='test_goal_category_title',
+            user=self.user,
+            board=self.board
+        )
+        now = timezone.now()
+        self.goals = [
+            Goal.objects.create(
+                title=f'goal_{index % 3}',
+                category=self.category,
+                due_date=now if index % 2 else None,
+                priority=index % 4 + 1,
+                user=self.user,
+            )
+            for index in range(7)
+        ]
+
+    def _walk(self, url):
+        ids = []
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.json())
+            ids.extend(goal['id'] for goal in response.json()['results'])
+            url = response.json()['next']
+        return ids, pages
+
+    def test_keyset_pages_cover_ordering_without_duplicates(self):
+        self.client.force_login(self.user)
+        expected = [goal.id for goal in sorted(self.goals, key=lambda goal: (goal.priority, goal.id), reverse=True)]
+
+        ids, pages = self._walk(f'{self.url}?pagination=cursor&limit=2&ordering=-priority')
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 4)
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_keyset_nullable_ordering(self):
+        self.client.force_login(self.user)
+
+        ids, _ = self._walk(f'{self.url}?pagination=cursor&limit=3&ordering=due_date')
+
+        self.assertCountEqual(ids, [goal.id for goal in self.goals])
+        self.assertEqual(len(set(ids)), len(self.goals))
+
+    def test_keyset_previous_link(self):
+        self.client.force_login(self.user)
+        first = self.client.get(self.url, {'pagination': 'cursor', 'limit': 3}).json()
+        second = self.client.get(first['next']).json()
+
+        previous = self.client.get(second['previous']).json()
+
+        self.assertEqual(previous['results'], first['results'])
+        self.assertIsNone(previous['previous'])
+
+    def test_keyset_runs_no_count_query(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'pagination': 'cursor', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_limit_offset_still_supported(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {'limit': 2, 'offset': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], len(self.goals))
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class GoalPermissionsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.owner = User.objects.create(username='test_owner', password='test_password')
+        self.reader = User.objects.create(username='test_reader', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.owner, role=BoardParticipant.Role.owner)
+        BoardParticipant.objects.create(board=self.board, user=self.reader, role=BoardParticipant.Role.reader)
+        self.category = GoalCategory.objects.create(
+            title='test_goal_category_title', user=self.owner, board=self.board
+        )
+        self.goal = Goal.objects.create(title='test_goal', category=self.category, user=self.owner)
+        self.url = reverse('goal-one', kwargs={'pk': self.goal.pk})
+
+    @one_database
+    def test_retrieve_checks_role_without_extra_queries(self):
+        self.client.force_login(self.reader)
+        # session, user, goal with annotated role
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reader_can_not_update(self):
+        self.client.force_login(self.reader)
+        response = self.client.patch(self.url, data={'title': 'new_title'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_reader_can_not_comment(self):
+        self.client.force_login(self.reader)
+        response = self.client.post('/goals/goal_comment/create', data={'goal': self.goal.id, 'text': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_owner_can_comment(self):
+        self.client.force_login(self.owner)
+        response = self.client.post('/goals/goal_comment/create', data={'goal': self.goal.id, 'text': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_non_participant_can_not_retrieve(self):
+        outsider = User.objects.create(username='test_outsider', password='test_password')
+        self.client.force_login(outsider)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHE_SHARED=True)
+class RoleMapCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        roles.stats.reset()
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        self.participant = BoardParticipant.objects.create(
+            board=self.board, user=self.user, role=BoardParticipant.Role.writer
+        )
+
+    def test_role_map_is_cached(self):
+        self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.writer)
+        with self.assertNumQueries(0):
+            self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.writer)
+        self.assertEqual(roles.stats.as_dict(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    @override_settings(CACHE_SHARED=False)
+    def test_unshared_cache_is_bypassed(self):
+        self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.writer)
+        self.assertIsNone(cache.get(roles.ROLE_MAP_KEY.format(user_id=self.user.id)))
+        with self.assertNumQueries(1):
+            self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.writer)
+
+    def test_participant_change_invalidates(self):
+        roles.get_board_role(self.user, self.board.id)
+
+        self.participant.role = BoardParticipant.Role.reader
+        self.participant.save()
+        self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.reader)
+
+        self.participant.delete()
+        self.assertIsNone(roles.get_board_role(self.user, self.board.id))
+
+    def test_board_update_invalidates_participants(self):
+        owner = User.objects.create(username='test_owner', password='test_password')
+        BoardParticipant.objects.create(board=self.board, user=owner, role=BoardParticipant.Role.owner)
+        roles.get_board_role(self.user, self.board.id)
+
+        self.client.force_login(owner)
+        response = self.client.put(
+            f'/goals/board/{self.board.id}',
+            data={'title': 'new_title', 'participants': [{'user': 'test_user', 'role': BoardParticipant.Role.reader}]},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(roles.get_board_role(self.user, self.board.id), BoardParticipant.Role.reader)
+
+
+class GoalBoardConsistencyTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        self.other_board = Board.objects.create(title='test_other_board_title')
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.other_category = GoalCategory.objects.create(
+            title='test_other_category', user=self.user, board=self.other_board
+        )
+        self.goal = Goal.objects.create(title='test_goal', category=self.category, user=self.user)
+
+    def test_board_set_on_create(self):
+        self.assertEqual(self.goal.board_id, self.board.id)
+
+    def test_board_follows_goal_category(self):
+        goal = Goal.objects.get(pk=self.goal.pk)
+        goal.category = self.other_category
+        goal.save(update_fields=['category'])
+
+        goal.refresh_from_db()
+        self.assertEqual(goal.board_id, self.other_board.id)
+
+    def test_board_follows_category_move(self):
+        category = GoalCategory.objects.get(pk=self.category.pk)
+        category.board = self.other_board
+        category.save()
+
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.board_id, self.other_board.id)
+
+
+class ExplainQueriesCommandTestCase(TestCase):
+    def test_list_views_use_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('No sequential scans found', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='explain_user_').exists())
+
+
+class FastListRenderingTestCase(TestCase):
+    def test_fast_lists_render_the_serializer_bytes(self):
+        out = StringIO()
+        call_command('bench_list_rendering', rows=30, repeat=1, stdout=out)
+        self.assertEqual(out.getvalue().count('output identical'), 4)
+        self.assertFalse(User.objects.filter(username='bench_list_user').exists())
+
+
+class FastRowSerializerTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(
+            username='test_user', password='test_password', first_name='Имя', last_name='Фамилия',
+            email='test@example.com',
+        )
+        self.other_user = User.objects.create(username='test_other_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        self.deleted_board = Board.objects.create(title='test_deleted_board', is_deleted=True)
+        self.categories = [
+            GoalCategory.objects.create(title='test_category', user=self.user, board=self.board),
+            GoalCategory.objects.create(
+                title='test_deleted_category', user=self.other_user, board=self.board, is_deleted=True
+            ),
+        ]
+        self.goals = [
+            Goal.objects.create(title='test_goal', category=self.categories[0], user=self.user),
+            Goal.objects.create(
+                title='test_due_goal\u2028', description='test_description', category=self.categories[1],
+                user=self.other_user, status=Goal.Status.in_progress, priority=Goal.Priority.critical,
+                due_date=timezone.now().replace(microsecond=123456),
+            ),
+        ]
+        for goal in self.goals:
+            GoalComment.objects.create(goal=goal, user=self.user, text=f'test_comment_{goal.id}')
+            GoalComment.objects.create(goal=goal, user=self.other_user, text='"test" <comment>')
+
+    def assertSameBytes(self, serializer_class, queryset):
+        fast = FastRowSerializer.for_serializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(fast.to_representation(fast.rows(queryset))), expected)
+        return json.loads(expected)
+
+    def test_boards(self):
+        self.assertSameBytes(BoardListSerializer, Board.objects.order_by('id'))
+
+    def test_categories_with_nested_user(self):
+        data = self.assertSameBytes(GoalCategorySerializer, GoalCategory.objects.select_related('user').order_by('id'))
+        self.assertEqual(data[0]['user'], {
+            'id': self.user.id, 'username': 'test_user', 'first_name': 'Имя', 'last_name': 'Фамилия',
+            'email': 'test@example.com',
+        })
+
+    def test_goals_with_null_dates_and_choices(self):
+        for time_zone in ('UTC', 'Asia/Vladivostok'):
+            with self.subTest(time_zone=time_zone), timezone.override(time_zone):
+                data = self.assertSameBytes(GoalSerializer, Goal.objects.order_by('id'))
+                self.assertIsNone(data[0]['due_date'])
+                self.assertIsNone(data[0]['description'])
+                self.assertEqual(data[1]['status'], Goal.Status.in_progress)
+
+    def test_comments_with_nested_user(self):
+        self.assertSameBytes(GoalCommentSerializer, GoalComment.objects.select_related('user').order_by('id'))
+
+
+class GoalBulkTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('goal-bulk')
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        self.foreign_board = Board.objects.create(title='test_foreign_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        BoardParticipant.objects.create(board=self.foreign_board, user=self.user, role=BoardParticipant.Role.reader)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.other_category = GoalCategory.objects.create(title='test_other', user=self.user, board=self.board)
+        self.foreign_category = GoalCategory.objects.create(
+            title='test_foreign', user=self.user, board=self.foreign_board
+        )
+        self.goals = [
+            Goal.objects.create(title=f'test_goal_{index}', category=self.category, user=self.user)
+            for index in range(3)
+        ]
+        self.foreign_goal = Goal.objects.create(title='test_foreign', category=self.foreign_category, user=self.user)
+
+    def _post(self, operations):
+        return self.client.post(self.url, data={'operations': operations}, content_type='application/json')
+
+    def test_mixed_operations(self):
+        self.client.force_login(self.user)
+        response = self._post([
+            {'op': 'create', 'title': 'new_goal', 'category': self.category.id, 'priority': 4},
+            {'op': 'update', 'id': self.goals[0].id, 'status': Goal.Status.done},
+            {'op': 'archive', 'id': self.goals[1].id},
+            {'op': 'move', 'id': self.goals[2].id, 'category': self.other_category.id},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['ok'] * 4)
+        created = Goal.objects.get(pk=results[0]['id'])
+        self.assertEqual((created.title, created.priority, created.board_id), ('new_goal', 4, self.board.id))
+        self.assertIsNotNone(created.created)
+        for goal in self.goals:
+            goal.refresh_from_db()
+        self.assertEqual(self.goals[0].status, Goal.Status.done)
+        self.assertEqual(self.goals[1].status, Goal.Status.archived)
+        self.assertEqual(self.goals[2].category_id, self.other_category.id)
+
+    def test_invalid_items_are_reported(self):
+        self.client.force_login(self.user)
+        response = self._post([
+            {'op': 'archive', 'id': self.foreign_goal.id},
+            {'op': 'create', 'title': 'new_goal', 'category': self.foreign_category.id},
+            {'op': 'update', 'id': self.goals[0].id},
+            {'op': 'archive', 'id': self.goals[0].id},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'error', 'ok'])
+        self.foreign_goal.refresh_from_db()
+        self.assertEqual(self.foreign_goal.status, Goal.Status.to_do)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as small:
+            self._post([{'op': 'archive', 'id': self.goals[0].id}])
+        with CaptureQueriesContext(connection) as large:
+            self._post([{'op': 'archive', 'id': goal.id} for goal in self.goals] + [
+                {'op': 'create', 'title': f'new_{index}', 'category': self.category.id} for index in range(20)
+            ])
+        self.assertLessEqual(len(large), len(small) + 1)
+
+
+class BoardParticipantsUpdateTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.owner = User.objects.create(username='test_owner', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.owner, role=BoardParticipant.Role.owner)
+        self.users = [User.objects.create(username=f'test_user_{index}', password='test_password') for index in range(40)]
+        self.url = f'/goals/board/{self.board.id}'
+
+    def _put(self, participants):
+        return self.client.put(
+            self.url,
+            data={'title': 'test_board_title', 'participants': participants},
+            content_type='application/json'
+        )
+
+    def _replace(self, size, role):
+        participants = [{'user': user.username, 'role': role} for user in self.users[:size]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._put(participants)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_participants_replaced(self):
+        self.client.force_login(self.owner)
+        self._put([{'user': user.username, 'role': BoardParticipant.Role.reader} for user in self.users[:3]])
+
+        response = self._put([
+            {'user': self.users[1].username, 'role': BoardParticipant.Role.writer},
+            {'user': self.users[2].username, 'role': BoardParticipant.Role.reader},
+            {'user': self.users[3].username, 'role': BoardParticipant.Role.reader},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(
+            dict(self.board.participants.values_list('user__username', 'role')),
+            {
+                'test_owner': BoardParticipant.Role.owner,
+                'test_user_1': BoardParticipant.Role.writer,
+                'test_user_2': BoardParticipant.Role.reader,
+                'test_user_3': BoardParticipant.Role.reader,
+            }
+        )
+        self.assertEqual(len(response.json()['participants']), 4)
+
+    def test_unknown_username(self):
+        self.client.force_login(self.owner)
+        response = self._put([{'user': 'missing_user', 'role': BoardParticipant.Role.reader}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_depend_on_board_size(self):
+        self.client.force_login(self.owner)
+        self._replace(2, BoardParticipant.Role.reader)
+        small = self._replace(2, BoardParticipant.Role.writer)
+
+        self._put([])
+        self._replace(40, BoardParticipant.Role.reader)
+        large = self._replace(40, BoardParticipant.Role.writer)
+
+        self.assertEqual(small, large)
+
+
+class CascadeDeleteTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.categories = [
+            GoalCategory.objects.create(title=f'test_category_{index}', user=self.user, board=self.board)
+            for index in range(2)
+        ]
+        for index in range(7):
+            Goal.objects.create(title=f'test_goal_{index}', category=self.categories[index % 2], user=self.user)
+
+    def test_board_delete_queues_cascade(self):
+        self.client.force_login(self.user)
+        response = self.client.delete(f'/goals/board/{self.board.id}')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.board.refresh_from_db()
+        self.assertTrue(self.board.is_deleted)
+        self.assertFalse(GoalCategory.objects.filter(board=self.board, is_deleted=False).exists())
+        job = CascadeJob.objects.get(kind=CascadeJob.Kind.board, target_id=self.board.id)
+        self.assertEqual(job.status, CascadeJob.Status.pending)
+
+        call_command('run_cascades', once=True, chunk_size=3, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.total), (CascadeJob.Status.done, 7, 7))
+        self.assertFalse(Goal.objects.exclude(status=Goal.Status.archived).exists())
+
+        response = self.client.get('/goals/cascade_job/list', {'kind': 'board', 'target_id': self.board.id})
+        self.assertEqual(response.json()[0]['processed'], 7)
+
+    def test_category_cascade_resumes_by_chunks(self):
+        self.client.force_login(self.user)
+        self.client.delete(f'/goals/goal_category/{self.categories[0].id}')
+
+        job = process_next_chunk(chunk_size=2)
+        self.assertEqual((job.status, job.processed, job.total), (CascadeJob.Status.running, 2, 4))
+        self.assertEqual(Goal.objects.filter(status=Goal.Status.archived).count(), 2)
+
+        while process_next_chunk(chunk_size=2):
+            pass
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (CascadeJob.Status.done, 4))
+        self.assertEqual(Goal.objects.filter(category=self.categories[1], status=Goal.Status.archived).count(), 0)
+
+
+class GoalCountersTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.other_category = GoalCategory.objects.create(title='test_other', user=self.user, board=self.board)
+        self.goals = [
+            Goal.objects.create(
+                title=f'test_goal_{index}', category=self.category, user=self.user, priority=index % 2 + 1,
+                due_date=timezone.now() - timezone.timedelta(days=1) if index < 2 else None,
+            )
+            for index in range(5)
+        ]
+
+    def assertConsistent(self):
+        out = StringIO()
+        call_command('reconcile_goal_counters', dry_run=True, stdout=out)
+        self.assertIn('Counters are consistent', out.getvalue())
+
+    def test_counters_follow_every_write_path(self):
+        goal = Goal.objects.get(pk=self.goals[0].pk)
+        goal.status = Goal.Status.in_progress
+        goal.save()
+        Goal.objects.filter(pk=self.goals[1].pk).update(priority=Goal.Priority.critical)
+        Goal.objects.filter(pk=self.goals[2].pk).update(category=self.other_category)
+        Goal.objects.bulk_create([
+            Goal(title='test_bulk', category=self.category, board=self.board, user=self.user,
+                 created=timezone.now(), updated=timezone.now())
+        ])
+        self.goals[3].status = Goal.Status.done
+        Goal.objects.bulk_update([self.goals[3]], fields=['status'])
+        self.goals[4].delete()
+        process_next_chunk(chunk_size=10)
+
+        self.assertConsistent()
+
+    def test_stale_instance_counts_stored_state(self):
+        stale = Goal.objects.get(pk=self.goals[0].pk)
+        Goal.objects.filter(pk=stale.pk).update(status=Goal.Status.done)
+        stale.status = Goal.Status.in_progress
+        stale.save()
+
+        self.assertConsistent()
+
+    def test_cascade_updates_counters(self):
+        self.client.force_login(self.user)
+        self.client.delete(f'/goals/goal_category/{self.category.id}')
+        while process_next_chunk(chunk_size=2):
+            pass
+
+        self.assertConsistent()
+
+    @one_database
+    def test_board_stats(self):
+        self.client.force_login(self.user)
+        Goal.objects.filter(pk=self.goals[0].pk).update(status=Goal.Status.done)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/goals/board/{self.board.id}/stats')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(response.json(), {
+            'board': self.board.id,
+            'total': 5,
+            'by_status': [{'status': Goal.Status.to_do, 'count': 4}, {'status': Goal.Status.done, 'count': 1}],
+            'by_priority': [{'priority': 1, 'count': 3}, {'priority': 2, 'count': 2}],
+            'by_category': [{'category': self.category.id, 'title': 'test_category', 'count': 5}],
+            'overdue': 1,
+        })
+
+    def test_reconcile_repairs_drift(self):
+        GoalCounter.objects.filter(board=self.board).update(count=0)
+
+        out = StringIO()
+        call_command('reconcile_goal_counters', stdout=out)
+
+        self.assertIn('drifted counters rebuilt', out.getvalue())
+        self.assertConsistent()
+
+
+@override_settings(SYNC_SAFETY_WINDOW=0)
+class SyncTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('sync')
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        self.other_board = Board.objects.create(title='test_other_board')
+        for board in (self.board, self.other_board):
+            BoardParticipant.objects.create(board=board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.goals = [
+            Goal.objects.create(title=f'test_goal_{index}', category=self.category, user=self.user)
+            for index in range(3)
+        ]
+        self.comment = GoalComment.objects.create(goal=self.goals[0], user=self.user, text='test_comment')
+        foreign_board = Board.objects.create(title='test_foreign_board')
+        foreign_category = GoalCategory.objects.create(title='test_foreign', user=self.user, board=foreign_board)
+        Goal.objects.create(title='test_foreign_goal', category=foreign_category, user=self.user)
+        self.client.force_login(self.user)
+
+    def _sync(self, token=None):
+        response = self.client.get(self.url, {'token': token} if token else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_full_then_incremental_sync(self):
+        full = self._sync()
+        self.assertFalse(full['has_more'])
+        self.assertEqual({board['id'] for board in full['boards']}, {self.board.id, self.other_board.id})
+        self.assertEqual([goal['id'] for goal in full['goals']], [goal.id for goal in self.goals])
+        self.assertEqual([comment['id'] for comment in full['comments']], [self.comment.id])
+
+        empty = self._sync(full['token'])
+        self.assertEqual(empty['goals'], [])
+        self.assertEqual(empty['deleted'], [])
+
+        # moving the category to another board rewrites its goals with a queryset update
+        self.category.board = self.other_board
+        self.category.save()
+        comment_id = self.comment.id
+        self.comment.delete()
+
+        changes = self._sync(empty['token'])
+        self.assertEqual([category['id'] for category in changes['categories']], [self.category.id])
+        self.assertEqual({goal['id'] for goal in changes['goals']}, {goal.id for goal in self.goals})
+        self.assertEqual(changes['comments'], [])
+        self.assertEqual(changes['deleted'], [{'model': 'comment', 'id': comment_id}])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_truncated_collections_continue_from_the_last_row(self):
+        first = self._sync()
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['goals']), 2)
+
+        second = self._sync(first['token'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual([goal['id'] for goal in second['goals']], [self.goals[2].id])
+
+    @override_settings(SYNC_SAFETY_WINDOW=0, SYNC_PAGE_SIZE=2)
+    def test_joined_boards_are_pulled_in_full(self):
+        joined_board = Board.objects.create(title='test_joined_board')
+        category = GoalCategory.objects.create(title='test_joined', user=self.user, board=joined_board)
+        goals = [Goal.objects.create(title=f'test_joined_{index}', category=category, user=self.user)
+                 for index in range(2)]
+        token = None
+        while True:
+            page = self._sync(token)
+            token = page['token']
+            if not page['has_more']:
+                break
+
+        # rows of the board are older than the token
+        BoardParticipant.objects.create(board=joined_board, user=self.user, role=BoardParticipant.Role.reader)
+        pulled = {'boards': [], 'categories': [], 'goals': []}
+        while True:
+            page = self._sync(token)
+            token = page['token']
+            for name, ids in pulled.items():
+                ids += [row['id'] for row in page[name]]
+            if not page['has_more']:
+                break
+        self.assertEqual(pulled, {'boards': [joined_board.id], 'categories': [category.id], 'goals': [
+            goal.id for goal in goals
+        ]})
+        self.assertEqual(self._sync(token)['goals'], [])
+
+    def test_invalid_token(self):
+        response = self.client.get(self.url, {'token': 'not a token'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BoardEventsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.stranger = User.objects.create(username='test_stranger', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.application = BoardEventsApplication(None)
+        self.sessions = {}
+        for user in (self.user, self.stranger):
+            client = Client()
+            client.force_login(user)
+            self.sessions[user] = client.cookies['sessionid'].value
+
+    def _communicator(self, user=None):
+        headers = [(b'cookie', f'sessionid={self.sessions[user]}'.encode())] if user else []
+        scope = {'type': 'http', 'method': 'GET', 'path': f'/goals/board/{self.board.id}/events', 'headers': headers}
+        return ApplicationCommunicator(self.application, scope)
+
+    async def _open(self, user):
+        communicator = self._communicator(user)
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(await communicator.receive_output(1), {
+            'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True
+        })
+        return communicator
+
+    async def test_subscribe_requires_participation(self):
+        for user, expected in ((None, 403), (self.stranger, 404)):
+            communicator = self._communicator(user)
+            await communicator.send_input({'type': 'http.request'})
+            self.assertEqual((await communicator.receive_output(1))['status'], expected)
+            await communicator.wait()
+
+    async def test_stream_follows_commits_until_access_is_revoked(self):
+        communicator = await self._open(self.user)
+
+        def create_goal():
+            with self.captureOnCommitCallbacks(execute=True):
+                return Goal.objects.create(title='test_goal', category=self.category, user=self.user)
+
+        goal = await sync_to_async(create_goal)()
+        message = await communicator.receive_output(1)
+        self.assertEqual(json.loads(message['body'].removeprefix(b'data: ')), {
+            'board': self.board.id, 'model': 'goal', 'id': goal.id, 'action': 'created'
+        })
+
+        events.hub.dispatch({'board': self.board.id + 1, 'model': 'goal', 'id': 1, 'action': 'created'})
+        events.hub.dispatch({'board': self.board.id, 'model': 'participant', 'id': 1, 'action': 'deleted',
+                             'user': self.user.id})
+        self.assertIn(b'"participant"', (await communicator.receive_output(1))['body'])
+        self.assertFalse((await communicator.receive_output(1)).get('more_body', False))
+        await communicator.wait()
+        self.assertEqual(events.hub.subscribers, {})
+
+    @one_database
+    def test_comment_event_does_not_load_goal(self):
+        goal = Goal.objects.create(title='test_goal', category=self.category, user=self.user)
+        comment = GoalComment.objects.get(pk=GoalComment.objects.create(goal=goal, user=self.user, text='test').pk)
+
+        comment.text = 'test_text'
+        # the update and the goal's board_id, not the goal
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(2):
+            comment.save()
+        self.assertEqual(len(callbacks), 1)
+
+        comment.goal = goal
+        with self.assertNumQueries(1):
+            comment.save()
+
+    async def test_stalled_stream_is_told_to_resync(self):
+        with override_settings(EVENTS_QUEUE_SIZE=2):
+            communicator = await self._open(self.user)
+        for index in range(3):
+            events.hub.dispatch({'board': self.board.id, 'model': 'goal', 'id': index, 'action': 'updated'})
+
+        self.assertEqual((await communicator.receive_output(1))['body'], b'event: resync\ndata: {}\n\n')
+        await communicator.wait()
+
+
+class BoardEventsPoolTestCase(PooledDatabaseMixin, TransactionTestCase):
+    def setUp(self) -> None:
+        user = User.objects.create(username='test_user', password='test_password')
+        stranger = User.objects.create(username='test_stranger', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=user, role=BoardParticipant.Role.owner)
+        self.cookies = {}
+        for user in (user, stranger):
+            client = Client()
+            client.force_login(user)
+            self.cookies[user.username] = f'sessionid={client.cookies["sessionid"].value}'.encode()
+        self.pool = self.use_pooled_database(size=1)
+
+    async def test_authorization_returns_its_connections(self):
+        for username, expected in (('test_user', 200), ('test_stranger', 404), ('test_user', 200)):
+            communicator = ApplicationCommunicator(BoardEventsApplication(None), {
+                'type': 'http', 'method': 'GET', 'path': f'/goals/board/{self.board.id}/events',
+                'headers': [(b'cookie', self.cookies[username])],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            self.assertEqual((await communicator.receive_output(1))['status'], expected)
+            # the stream goes on without holding a connection
+            self.assertEqual(self.in_use(), 0)
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait()
+
+
+class FullTextSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('goal-list')
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.title_match = self._goal('Квартальный отчет', 'собрать цифры')
+        self.description_match = self._goal('Пятница', 'отправить отчет руководителю')
+        self._goal('Спортзал', 'тренировка')
+
+        foreign_board = Board.objects.create(title='test_foreign_board')
+        foreign_category = GoalCategory.objects.create(title='test_foreign', user=self.user, board=foreign_board)
+        Goal.objects.create(title='Чужой отчет', category=foreign_category, user=self.user)
+        self.client.force_login(self.user)
+
+    def _goal(self, title, description):
+        return Goal.objects.create(title=title, description=description, category=self.category, user=self.user)
+
+    def _search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_ranked_prefix_search_with_highlight(self):
+        results = self._search(search='отч')
+
+        self.assertEqual([goal['id'] for goal in results], [self.title_match.id, self.description_match.id])
+        self.assertIn('<mark>отчет</mark>', results[0]['highlight'])
+        self.assertEqual(len(self._search(search='отчет цифры')), 1)
+
+    def test_index_follows_writes(self):
+        Goal.objects.filter(pk=self.title_match.pk).update(title='Годовой план')
+        self.description_match.delete()
+
+        self.assertEqual(self._search(search='отчет'), [])
+        self.assertEqual([goal['id'] for goal in self._search(search='годовой')], [self.title_match.id])
+
+    def test_cursor_pages_follow_rank(self):
+        ids, url, params = [], self.url, {'search': 'отчет', 'pagination': 'cursor', 'limit': 1}
+        while url:
+            page = self.client.get(url, params).json()
+            ids.extend(goal['id'] for goal in page['results'])
+            url, params = page['next'], None
+
+        self.assertEqual(ids, [self.title_match.id, self.description_match.id])
+
+    def test_comment_search(self):
+        comment = GoalComment.objects.create(goal=self.title_match, user=self.user, text='Цифры уже в таблице')
+        GoalComment.objects.create(goal=self.title_match, user=self.user, text='Напомнить завтра')
+
+        response = self.client.get('/goals/goal_comment/list', {'search': 'таблиц'})
+
+        self.assertEqual([row['id'] for row in response.json()], [comment.id])
+        self.assertIn('<mark>таблице</mark>', response.json()[0]['highlight'])
+
+
+class GoalExportTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('goal-export')
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.reader)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.goals = [
+            Goal.objects.create(title=f'test_goal_{index}', description='строка, "с кавычками"',
+                                category=self.category, user=self.user)
+            for index in range(3)
+        ]
+        GoalComment.objects.create(goal=self.goals[1], user=self.user, text='test_comment')
+        GoalComment.objects.create(goal=self.goals[1], user=self.user, text='test_comment')
+
+        foreign_board = Board.objects.create(title='test_foreign_board')
+        foreign_category = GoalCategory.objects.create(title='test_foreign', user=self.user, board=foreign_board)
+        Goal.objects.create(title='test_foreign_goal', category=foreign_category, user=self.user)
+        self.client.force_login(self.user)
+
+    def test_ndjson_export_streams_visible_goals(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [goal.id for goal in self.goals])
+        self.assertEqual([row['comment_count'] for row in rows], [0, 2, 0])
+        self.assertEqual(rows[0]['board_title'], 'test_board_title')
+        self.assertEqual(rows[0]['created'], timezone.localtime(self.goals[0].created).isoformat())
+
+    def test_csv_export_applies_list_filters(self):
+        Goal.objects.filter(pk=self.goals[0].pk).update(status=Goal.Status.done)
+
+        response = self.client.get(self.url, {'format': 'csv', 'status': Goal.Status.done})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="goals.csv"')
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['id', 'title', 'description'])
+        self.assertEqual(rows[1][:3], [str(self.goals[0].id), 'test_goal_0', 'строка, "с кавычками"'])
+        self.assertEqual(len(rows), 2)
+
+    def test_export_goals_command(self):
+        out = StringIO()
+        call_command('export_goals', 'test_user', format='ndjson', chunk_size=1, stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class GoalExportASGITestCase(PooledDatabaseMixin, TransactionTestCase):
+    def setUp(self) -> None:
+        user = User.objects.create(username='test_user', password='test_password')
+        board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=board, user=user, role=BoardParticipant.Role.reader)
+        category = GoalCategory.objects.create(title='test_category', user=user, board=board)
+        Goal.objects.create(title='test_goal', category=category, user=user)
+        client = Client()
+        client.force_login(user)
+        self.cookie = f'sessionid={client.cookies["sessionid"].value}'.encode()
+        self.pool = self.use_pooled_database(size=1)
+
+    async def export(self) -> bytes:
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http', 'method': 'GET', 'path': reverse('goal-export'), 'query_string': b'',
+            'headers': [(b'cookie', self.cookie)],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        self.assertEqual((await communicator.receive_output(5))['status'], status.HTTP_200_OK)
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        return body
+
+    async def test_streamed_export_returns_its_connection(self):
+        # one connection in the pool, a leaked one would fail the next export
+        for _ in range(3):
+            self.assertEqual(len((await self.export()).splitlines()), 1)
+            self.assertEqual(self.in_use(), 0)
+
+
+class GoalImportTestCase(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.url = reverse('goal-import')
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.writer)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+
+        read_only_board = Board.objects.create(title='test_read_only_board')
+        BoardParticipant.objects.create(board=read_only_board, user=self.user, role=BoardParticipant.Role.reader)
+        self.read_only_category = GoalCategory.objects.create(
+            title='test_read_only', user=self.user, board=read_only_board
+        )
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, **data):
+        return self.client.post(self.url, {'file': SimpleUploadedFile(name, content.encode()), **data})
+
+    @override_settings(GOAL_IMPORT_BATCH_SIZE=2)
+    def test_csv_import_reports_bad_rows_and_keeps_the_rest(self):
+        content = (
+            'title,description,category,status,priority,due_date\n'
+            f'test_goal_1,"строка, с запятой",{self.category.id},2,,\n'
+            f',,{self.category.id},,,\n'
+            f'test_goal_2,,{self.read_only_category.id},,,\n'
+            f'test_goal_3,,{self.category.id},,4,2023-01-01T10:00:00Z\n'
+        )
+        started = timezone.now()
+
+        response = self.upload('goals.csv', content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertIn('title', report['errors'][0]['errors'])
+        self.assertIn('category', report['errors'][1]['errors'])
+
+        first, third = Goal.objects.order_by('id')
+        self.assertEqual(first.description, 'строка, с запятой')
+        self.assertEqual((first.status, first.priority), (Goal.Status.in_progress, Goal.Priority.medium))
+        self.assertEqual(third.priority, Goal.Priority.critical)
+        self.assertEqual(third.board_id, self.board.id)
+        self.assertGreaterEqual(third.created, started)
+        self.assertEqual(third.created, third.updated)
+        self.assertEqual(
+            sum(GoalCounter.objects.filter(board=self.board, category=self.category).values_list('count', flat=True)), 2
+        )
+
+    @one_database
+    def test_ndjson_import_resolves_categories_once_per_batch(self):
+        lines = [json.dumps({'title': f'test_goal_{index}', 'category': self.category.id}) for index in range(20)]
+        content = '\n'.join([*lines, '{broken', '[1]', ''])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload('goals.ndjson', content)
+
+        report = response.json()
+        self.assertEqual(report['created'], 20)
+        self.assertEqual([error['row'] for error in report['errors']], [21, 22])
+        self.assertLess(len(queries), 20)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.upload('goals.txt', 'title', format='xml')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_goals_command(self):
+        with NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write(f'title,category\ntest_goal,{self.category.id}\n')
+        out = StringIO()
+
+        call_command('import_goals', 'test_user', file.name, stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), 'created 1, failed 0')
+        self.assertTrue(Goal.objects.filter(title='test_goal', user=self.user).exists())
+
+
+@one_database
+class QueryBudgetTestCase(TestCase):
+    """
+    Every goals route answers in a fixed number of queries: reads are measured on a small and
+    a grown board and must cost the same, writes are checked on the grown one
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.goal = Goal.objects.create(title='test_goal', category=self.category, user=self.user)
+        self.comment = GoalComment.objects.create(goal=self.goal, user=self.user, text='test_comment')
+        self.job = CascadeJob.objects.create(kind=CascadeJob.Kind.board, target_id=0, user=self.user)
+        self.users = []
+        self.client.force_login(self.user)
+
+    def seed(self, size):
+        """size more participants, categories, goals, comments and cascade jobs"""
+        now = timezone.now()
+        offset = len(self.users)
+        users = User.objects.bulk_create([
+            User(username=f'test_participant_{offset + index}', password='!') for index in range(size)
+        ])
+        self.users.extend(users)
+        BoardParticipant.objects.bulk_create([
+            BoardParticipant(board=self.board, user=user, role=BoardParticipant.Role.writer, created=now, updated=now)
+            for user in users
+        ])
+        GoalCategory.objects.bulk_create([
+            GoalCategory(title=f'test_category_{index}', user=self.user, board=self.board, created=now, updated=now)
+            for index in range(size)
+        ])
+        goals = Goal.objects.bulk_create([
+            Goal(title=f'test_goal_{index}', category=self.category, board=self.board, user=self.user,
+                 created=now, updated=now)
+            for index in range(size)
+        ])
+        GoalComment.objects.bulk_create([
+            GoalComment(goal=goal, user=user, text='test_comment', created=now, updated=now)
+            for goal in [self.goal, *goals] for user in users[:3]
+        ])
+        CascadeJob.objects.bulk_create([
+            CascadeJob(kind=CascadeJob.Kind.category, target_id=index, user=self.user, created=now, updated=now)
+            for index in range(size)
+        ])
+
+    def request(self, method, url, data=None, **extra):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'get':
+                response = self.client.get(url, data, **extra)
+            else:
+                response = getattr(self.client, method)(url, data, content_type='application/json', **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300, f'{method} {url}')
+        return len(queries)
+
+    def assertReadBudget(self, budget, url, data=None):
+        counts = []
+        for size in (2, 20):
+            self.seed(size)
+            counts.append(self.request('get', url, data))
+        self.assertEqual(counts[0], counts[1], f'{url} grows with the data: {counts}')
+        self.assertLessEqual(counts[1], budget, url)
+
+    def assertWriteBudget(self, budget, method, url, data=None):
+        self.seed(20)
+        self.assertLessEqual(self.request(method, url, data), budget, f'{method} {url}')
+
+    def test_board_reads(self):
+        self.assertReadBudget(3, '/goals/board/list')
+        self.assertReadBudget(4, f'/goals/board/{self.board.id}')
+        self.assertReadBudget(5, f'/goals/board/{self.board.id}/stats')
+
+    def test_board_writes(self):
+        self.assertWriteBudget(4, 'post', '/goals/board/create', {'title': 'test_board'})
+        participants = [{'user': user.username, 'role': BoardParticipant.Role.reader} for user in self.users[:10]]
+        self.assertWriteBudget(
+            13, 'put', f'/goals/board/{self.board.id}', {'title': 'test_board', 'participants': participants}
+        )
+        self.assertWriteBudget(9, 'delete', f'/goals/board/{self.board.id}')
+
+    def test_category_reads(self):
+        self.assertReadBudget(3, '/goals/goal_category/list')
+        self.assertReadBudget(3, f'/goals/goal_category/{self.category.id}')
+
+    def test_category_writes(self):
+        self.assertWriteBudget(
+            5, 'post', '/goals/goal_category/create', {'title': 'test_category', 'board': self.board.id}
+        )
+        self.assertWriteBudget(4, 'patch', f'/goals/goal_category/{self.category.id}', {'title': 'test_category'})
+        self.assertWriteBudget(7, 'delete', f'/goals/goal_category/{self.category.id}')
+
+    def test_goal_reads(self):
+        self.assertReadBudget(3, reverse('goal-list'))
+        self.assertReadBudget(4, reverse('goal-list'), {'search': 'test', 'limit': 100})
+        self.assertReadBudget(3, reverse('goal-export'))
+        self.assertReadBudget(4, reverse('goal-one', args=[self.goal.id]))
+
+    def test_goal_writes(self):
+        self.assertWriteBudget(
+            8, 'post', reverse('goal-create'), {'title': 'test_goal', 'category': self.category.id}
+        )
+        operations = [
+            {'op': 'create', 'title': f'test_goal_{index}', 'category': self.category.id} for index in range(10)
+        ]
+        operations += [{'op': 'update', 'id': goal.id, 'status': Goal.Status.done} for goal in Goal.objects.all()[:10]]
+        # counters are written per (category, status, priority) touched, not per goal
+        self.assertWriteBudget(22, 'post', reverse('goal-bulk'), {'operations': operations})
+        # Goal.save() reads the stored row under lock to count the transition, deleting archives through it too
+        self.assertWriteBudget(7, 'patch', reverse('goal-one', args=[self.goal.id]), {'status': Goal.Status.done})
+        self.assertWriteBudget(12, 'delete', reverse('goal-one', args=[self.goal.id]))
+
+        content = '\n'.join(
+            json.dumps({'title': f'test_goal_{index}', 'category': self.category.id}) for index in range(50)
+        )
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('goal-import'), {'file': SimpleUploadedFile('goals.ndjson', content.encode())}
+            )
+        self.assertEqual(response.json()['created'], 50)
+        self.assertLessEqual(len(queries), 10)
+
+    def test_comment_reads(self):
+        self.assertReadBudget(3, '/goals/goal_comment/list')
+        self.assertReadBudget(5, '/goals/goal_comment/list', {'goal': self.goal.id, 'limit': 100})
+        self.assertReadBudget(3, f'/goals/goal_comment/{self.comment.id}')
+
+    def test_comment_writes(self):
+        self.assertWriteBudget(
+            5, 'post', '/goals/goal_comment/create', {'goal': self.goal.id, 'text': 'test_comment'}
+        )
+        self.assertWriteBudget(5, 'patch', f'/goals/goal_comment/{self.comment.id}', {'text': 'test_comment'})
+        self.assertWriteBudget(6, 'delete', f'/goals/goal_comment/{self.comment.id}')
+
+    def test_cascade_job_and_sync_reads(self):
+        self.assertReadBudget(3, '/goals/cascade_job/list')
+        self.assertReadBudget(3, f'/goals/cascade_job/{self.job.id}')
+        self.assertReadBudget(8, reverse('sync'))
+
+
+class BenchCommandsTestCase(TestCase):
+    def test_seed_bench_and_bench_report_every_endpoint(self):
+        call_command('seed_bench', users=5, boards=3, goals=40, comments=80, stdout=StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith='bench_user_').count(), 5)
+        self.assertEqual(Goal.objects.count(), 40)
+        self.assertEqual(GoalComment.objects.count(), 80)
+        self.assertEqual(sum(GoalCounter.objects.values_list('count', flat=True)), 40)
+
+        out = StringIO()
+        call_command('bench', requests=2, warmup=0, stdout=out, stderr=StringIO())
+
+        report = json.loads(out.getvalue())
+        names = {endpoint['name'] for endpoint in report['endpoints']}
+        self.assertTrue({'board-list', 'goal-list', 'goal-create', 'goal-bulk', 'sync'} <= names)
+        self.assertTrue({
+            'board-update', 'board-delete', 'category-create', 'category-update', 'category-delete', 'goal-delete',
+            'goal-import', 'comment-update', 'comment-delete', 'cascade-job-detail', 'signup', 'login',
+            'update-password', 'logout',
+        } <= names)
+        for endpoint in report['endpoints']:
+            self.assertLess(endpoint['status'], 300)
+            self.assertLessEqual(endpoint['p50_ms'], endpoint['p99_ms'])
+        # benchmark writes are rolled back
+        self.assertEqual(Goal.objects.count(), 40)
+        self.assertEqual(User.objects.count(), 5)
+
+
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='test_user', password='test_password')
+        self.stranger = User.objects.create(username='test_stranger', password='test_password')
+        self.board = Board.objects.create(title='test_board_title')
+        BoardParticipant.objects.create(board=self.board, user=self.user, role=BoardParticipant.Role.owner)
+        self.category = GoalCategory.objects.create(title='test_category', user=self.user, board=self.board)
+        self.goals = [
+            Goal.objects.create(title=f'goal_{index}', category=self.category, user=self.user, priority=index % 4 + 1)
+            for index in range(5)
+        ]
+        GoalComment.objects.create(goal=self.goals[0], user=self.user, text='test_comment')
+        self.client.force_login(self.user)
+
+    def _urls(self):
+        goal_list = reverse('goal-list')
+        return [
+            ('/goals/board/list', {}),
+            ('/goals/board/list', {'limit': 1, 'offset': 1}),
+            ('/goals/goal_category/list', {'board': self.board.id, 'limit': 10}),
+            ('/goals/goal_category/list', {'board': 'abc'}),
+            (goal_list, {}),
+            (goal_list, {'limit': 2, 'offset': 2, 'ordering': '-priority'}),
+            (goal_list, {'limit': 2, 'pagination': 'cursor'}),
+            (goal_list, {'category': self.category.id, 'status': Goal.Status.to_do}),
+            (reverse('goal-one', args=[self.goals[0].id]), {}),
+            (reverse('goal-one', args=[0]), {}),
+            (reverse('goal-one', args=['abc']), {}),
+            ('/goals/goal_comment/list', {'goal': self.goals[0].id}),
+        ]
+
+    def _get_all(self):
+        responses = []
+        for url, params in self._urls():
+            response = self.client.get(url, params)
+            responses.append((url, params, response.status_code, response.content))
+        return responses
+
+    def test_async_views_answer_like_sync_views(self):
+        with override_settings(ASYNC_READ_VIEWS=False):
+            expected = self._get_all()
+        with override_settings(ASYNC_READ_VIEWS=True):
+            self.assertEqual(self._get_all(), expected)
+
+    def test_permissions_apply_to_async_views(self):
+        url = reverse('goal-one', args=[self.goals[0].id])
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/goals/board/list').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_writes_go_through_sync_views(self):
+        url = reverse('goal-one', args=[self.goals[0].id])
+        response = self.client.patch(url, {'title': 'renamed'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).json()['title'], 'renamed')
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+
+    async def test_async_middleware_chain_counts_queries(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get(reverse('goal-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 5)
+        self.assertRegex(response['Server-Timing'], r'db;desc="[1-9]\d* queries"')
+
+
+class BenchAsyncCommandTestCase(TransactionTestCase):
+    def test_bench_async_reports_both_modes(self):
+        call_command('seed_bench', users=5, boards=3, goals=40, comments=80, stdout=StringIO())
+
+        out = StringIO()
+        call_command('bench_async', requests=4, concurrency=[1, 2], only=['goal-list', 'goal-detail'],
+                     stdout=out, stderr=StringIO())
+
+        results = json.loads(out.getvalue())['results']
+        self.assertEqual(
+            [(result['name'], result['mode'], result['concurrency']) for result in results],
+            [(name, mode, level) for name in ('goal-list', 'goal-detail') for mode in ('sync', 'async')
+             for level in (1, 2)],
+        )
+        for result in results:
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class ShardMergeTestCase(SimpleTestCase):
+    def test_merge_follows_the_database_ordering(self):
+        Row = namedtuple('Row', ['id', 'due_date', 'priority'])
+        keys = [
+            KeysetKey(Goal._meta.get_field('due_date'), descending=False, nulls_last=True),
+            KeysetKey(Goal._meta.get_field('priority'), descending=True, nulls_last=True),
+            KeysetKey(Goal._meta.get_field('id'), descending=False, nulls_last=True),
+        ]
+        rows = [
+            Row(1, '2022-01-01', 4), Row(2, '2022-01-01', 1), Row(3, '2022-02-01', 2),
+            Row(4, None, 3), Row(5, None, 3), Row(6, None, 1),
+        ]
+        shards = [[rows[0], rows[2], rows[4]], [rows[1], rows[3], rows[5]]]
+
+        merged = heapq.merge(*shards, key=sharding.merge_key(keys))
+        self.assertEqual([row.id for row in merged], [1, 2, 3, 4, 5, 6])
+        # a previous page link walks the same rows backwards
+        merged = heapq.merge(*[shard[::-1] for shard in shards], key=sharding.merge_key([key.reversed() for key in keys]))
+        self.assertEqual([row.id for row in merged], [6, 5, 4, 3, 2, 1])
+
+    @override_settings(GOAL_SHARDS=['default'])
+    def test_router_is_inert_on_one_database(self):
+        router = sharding.ShardRouter()
+        board = Board(id=1, title='board')
+        category = GoalCategory(id=1, board=board)
+        self.assertIsNone(router.db_for_write(GoalCategory, instance=board))
+        self.assertIsNone(router.db_for_write(Goal, instance=category))
+        self.assertIsNone(router.db_for_read(Goal, instance=board))
+        self.assertIsNone(router.allow_relation(category, Goal(category=category)))
+
+
+@skipUnless(len(settings.GOAL_SHARDS) > 1, 'set DB_SHARD_URLS to run against a second database')
+class ShardingTestCase(TestCase):
+    databases = {'default', *settings.GOAL_SHARDS}
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', password='test_password', first_name='Test')
+        self.client.force_login(self.user)
+        self.boards, self.categories, self.goals = [], [], []
+        for title in ('b', 'a'):
+            board = Board.objects.create(title=title)
+            BoardParticipant.objects.create(board=board, user=self.user, role=BoardParticipant.Role.owner.value)
+            category = GoalCategory.objects.create(title=f'{title}_category', user=self.user, board=board)
+            for index in range(3):
+                goal = Goal.objects.create(title=f'{title}_{index}', category=category, user=self.user)
+            GoalComment.objects.create(goal=goal, user=self.user, text='comment')
+            self.boards.append(board)
+            self.categories.append(category)
+            self.goals.append(goal)
+        self.moved, self.moved_category, self.moved_goal = self.boards[0], self.categories[0], self.goals[0]
+        self.shard = settings.GOAL_SHARDS[1]
+        call_command('move_board', self.moved.id, self.shard, settle=0, stdout=StringIO())
+
+    def test_move_board_copies_the_subtree_and_flips_the_directory(self):
+        self.assertEqual(sharding.shard_of(self.moved.id), self.shard)
+        # the board and its participants are the directory, the shard holds a copy of the board row
+        self.assertTrue(Board.objects.filter(id=self.moved.id).exists())
+        self.assertTrue(Board.objects.using(self.shard).filter(id=self.moved.id).exists())
+        self.assertFalse(BoardParticipant.objects.using(self.shard).exists())
+        self.assertFalse(Goal.objects.filter(board_id=self.moved.id).exists())
+        self.assertEqual(Goal.objects.using(self.shard).filter(board_id=self.moved.id).count(), 3)
+        self.assertEqual(GoalComment.objects.using(self.shard).filter(goal__board_id=self.moved.id).count(), 1)
+        self.assertEqual(
+            list(GoalCounter.objects.using(self.shard).values_list('board_id', 'count')), [(self.moved.id, 3)]
+        )
+        # profiles only, the copies can not log in
+        copy = User.objects.using(self.shard).get(id=self.user.id)
+        self.assertEqual((copy.username, copy.first_name), ('test_user', 'Test'))
+        self.assertFalse(copy.has_usable_password())
+
+        # moving it back purges the shard
+        call_command('move_board', self.moved.id, 'default', settle=0, stdout=StringIO())
+        self.assertEqual(Goal.objects.filter(board_id=self.moved.id).count(), 3)
+        self.assertFalse(Board.objects.using(self.shard).exists())
+        self.assertFalse(Goal.objects.using(self.shard).exists())
+        self.assertFalse(BoardShard.objects.exists())
+
+    def test_events_wait_for_the_shard_commit(self):
+        with self.captureOnCommitCallbacks(using='default') as on_default, \
+                self.captureOnCommitCallbacks(using=self.shard) as on_shard:
+            response = self.client.post(reverse('goal-create'), {
+                'title': 'test_goal', 'category': self.moved_category.id
+            })
+            self.client.post(reverse('goal-bulk'), {'operations': [
+                {'op': 'update', 'id': self.moved_goal.id, 'status': Goal.Status.done},
+            ]}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((len(on_default), len(on_shard)), (0, 2))
+
+    def test_lists_read_every_shard(self):
+        response = self.client.get('/goals/board/list', {'limit': 10})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual([board['title'] for board in response.json()['results']], ['a', 'b'])
+
+        response = self.client.get(reverse('goal-list'), {'limit': 4, 'offset': 1})
+        self.assertEqual(response.json()['count'], 6)
+        self.assertEqual([goal['title'] for goal in response.json()['results']], ['a_1', 'a_2', 'b_0', 'b_1'])
+
+        titles, url = [], reverse('goal-list') + '?pagination=cursor&limit=4&ordering=-title'
+        while url:
+            page = self.client.get(url).json()
+            titles += [goal['title'] for goal in page['results']]
+            url = page['next']
+        self.assertEqual(titles, ['b_2', 'b_1', 'b_0', 'a_2', 'a_1', 'a_0'])
+
+        response = self.client.get('/goals/goal_category/list', {'limit': 10})
+        self.assertEqual([category['title'] for category in response.json()['results']], ['a_category', 'b_category'])
+        self.assertEqual(response.json()['results'][1]['user']['first_name'], 'Test')
+
+    def test_filters_resolve_rows_of_moved_boards(self):
+        response = self.client.get(reverse('goal-list'), {'category': self.moved_category.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([goal['title'] for goal in response.json()], ['b_0', 'b_1', 'b_2'])
+        response = self.client.get(reverse('goal-list'), {'category__in': f'{self.moved_category.id},0'})
+        self.assertEqual(len(response.json()), 3)
+
+        response = self.client.get('/goals/goal_comment/list', {'goal': self.moved_goal.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([comment['text'] for comment in response.json()], ['comment'])
+
+        response = self.client.get(reverse('goal-export'), {'category': self.moved_category.id})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['title'], row['board_title']) for row in rows], [
+            ('b_0', 'b'), ('b_1', 'b'), ('b_2', 'b'),
+        ])
+
+    def test_detail_and_create_endpoints_follow_the_board(self):
+        url = reverse('goal-one', args=[self.moved_goal.id])
+        self.assertEqual(self.client.get(url).json()['title'], 'b_2')
+        response = self.client.patch(url, {'status': Goal.Status.done}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Goal.objects.using(self.shard).get(id=self.moved_goal.id).status, Goal.Status.done)
+        # goals can not move between databases with their category
+        response = self.client.patch(url, {'category': self.categories[1].id}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(
+            f'/goals/goal_category/{self.moved_category.id}', {'title': 'renamed'}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['title'], 'renamed')
+
+        response = self.client.post(reverse('goal-create'), {'title': 'new', 'category': self.moved_category.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        goal = Goal.objects.using(self.shard).get(id=response.json()['id'])
+        # ids on the shard come from its own range
+        self.assertGreaterEqual(goal.id, settings.GOAL_SHARDS.index(self.shard) << 40)
+
+        response = self.client.post('/goals/goal_category/create', {'title': 'new', 'board': self.moved.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(GoalCategory.objects.using(self.shard).filter(id=response.json()['id']).exists())
+
+        response = self.client.post('/goals/goal_comment/create', {'text': 'new', 'goal': goal.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        comment_url = f'/goals/goal_comment/{response.json()["id"]}'
+        self.assertEqual(self.client.delete(comment_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(SyncTombstone.objects.using(self.shard).filter(model='comment').exists())
+
+        stats = self.client.get(f'/goals/board/{self.moved.id}/stats').json()
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual(stats['by_status'], [
+            {'status': Goal.Status.to_do, 'count': 3}, {'status': Goal.Status.done, 'count': 1},
+        ])
+
+        response = self.client.post(reverse('goal-bulk'), {'operations': [
+            {'op': 'archive', 'id': self.moved_goal.id}, {'op': 'archive', 'id': self.goals[1].id},
+            {'op': 'move', 'id': self.moved_goal.id, 'category': self.categories[1].id},
+        ]}, content_type='application/json')
+        self.assertEqual([result['status'] for result in response.json()['results']], ['ok', 'ok', 'error'])
+        self.assertEqual(Goal.objects.using(self.shard).get(id=self.moved_goal.id).status, Goal.Status.archived)
+
+    def test_role_changes_apply_to_moved_boards(self):
+        other = User.objects.create(username='other_user', password='test_password')
+        url = reverse('goal-one', args=[self.moved_goal.id])
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_login(self.user)
+        response = self.client.put(f'/goals/board/{self.moved.id}', {
+            'title': 'renamed', 'participants': [{'user': 'other_user', 'role': BoardParticipant.Role.reader}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # participants are copied to the shard of the board, renames follow the board row
+        self.assertTrue(User.objects.using(self.shard).filter(id=other.id).exists())
+        self.assertEqual(Board.objects.using(self.shard).get(id=self.moved.id).title, 'renamed')
+
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.patch(url, {'title': 'reader'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('sync')).json()
+        self.assertEqual({goal['title'] for goal in response['goals']}, {'b_0', 'b_1', 'b_2'})
+
+    def test_board_delete_cascades_on_the_shard(self):
+        self.assertEqual(self.client.delete(f'/goals/board/{self.moved.id}').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(GoalCategory.objects.using(self.shard).get(id=self.moved_category.id).is_deleted)
+        while process_next_chunk(2) is not None:
+            pass
+        self.assertEqual(
+            set(Goal.objects.using(self.shard).values_list('status', flat=True)), {Goal.Status.archived}
+        )
+        self.assertEqual(
+            list(GoalCounter.objects.using(self.shard).filter(count__gt=0).values_list('status', 'count')),
+            [(Goal.Status.archived, 3)],
+        )
+
+    def test_writes_are_refused_while_the_board_moves(self):
+        BoardShard.objects.filter(board_id=self.moved.id).update(moving=True)
+        goal = Goal.objects.using(self.shard).get(id=self.moved_goal.id)
+        with self.assertRaises(sharding.BoardMoving):
+            goal.save()
+        self.assertEqual(self.client.delete(f'/goals/board/{self.moved.id}').status_code, 503)
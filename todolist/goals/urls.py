@@ -1,21 +1,32 @@
 from django.urls import path
 
-from goals import views
+from goals import asyncviews, views
+from goals.asyncviews import read_view
 
 urlpatterns = [
     path('goal_category/create', views.GoalCategoryCreateView.as_view()),
-    path('goal_category/list', views.GoalCategoryListView.as_view()),
+    path('goal_category/list', read_view(views.GoalCategoryListView, asyncviews.AsyncGoalCategoryListView)),
     path('goal_category/<pk>', views.GoalCategoryView.as_view()),
 
     path('goal/create', views.GoalCreateView.as_view(), name='goal-create'),
-    path('goal/list', views.GoalListView.as_view(), name='goal-list'),
-    path('goal/<pk>', views.GoalView.as_view(), name='goal-one'),
+    path('goal/list', read_view(views.GoalListView, asyncviews.AsyncGoalListView), name='goal-list'),
+    path('goal/bulk', views.GoalBulkView.as_view(), name='goal-bulk'),
+    path('goal/export', views.GoalExportView.as_view(), name='goal-export'),
+    path('goal/import', views.GoalImportView.as_view(), name='goal-import'),
+    path('goal/<pk>', read_view(views.GoalView, asyncviews.AsyncGoalView), name='goal-one'),
 
     path('goal_comment/create', views.GoalCommentCreateView.as_view()),
-    path('goal_comment/list', views.GoalCommentListView.as_view()),
+    path('goal_comment/list', read_view(views.GoalCommentListView, asyncviews.AsyncGoalCommentListView)),
     path('goal_comment/<pk>', views.GoalCommentView.as_view()),
 
     path('board/create', views.BoardCreateView.as_view()),
-    path('board/list', views.BoardListView.as_view()),
+    path('board/list', read_view(views.BoardListView, asyncviews.AsyncBoardListView)),
     path('board/<pk>', views.BoardView.as_view()),
+    path('board/<pk>/stats', views.BoardStatsView.as_view()),
+    # board/<pk>/events is served by goals.events.BoardEventsApplication in front of Django (ASGI only)
+
+    path('cascade_job/list', views.CascadeJobListView.as_view()),
+    path('cascade_job/<pk>', views.CascadeJobView.as_view()),
+
+    path('sync', views.SyncView.as_view(), name='sync'),
 ]
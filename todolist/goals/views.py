@@ -1,19 +1,58 @@
+import codecs
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Prefetch, Q
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveUpdateDestroyAPIView, RetrieveUpdateAPIView
+from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveUpdateDestroyAPIView, RetrieveUpdateAPIView, \
+    GenericAPIView, RetrieveAPIView
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
-
-from goals.filters import GoalDateFilter
-from goals.models import GoalCategory, Goal, GoalComment, Board
+from rest_framework.response import Response
+
+from goals import sharding
+from goals.cascades import queue_cascade
+from goals.counters import board_stats
+from goals.exports import stream_export
+from goals.fast import FastListMixin
+from goals.filters import GoalCommentFilter, GoalDateFilter, ShardedFilterBackend
+from goals.imports import FORMATS as IMPORT_FORMATS, import_format, import_goals
+from goals.models import GoalCategory, Goal, GoalComment, Board, BoardParticipant, CascadeJob
+from goals.pagination import AsyncLimitOffsetPagination, LimitOffsetKeysetPagination
 from goals.permissions import IsOwner, BoardPermissions, GoalCategoryPermissions, GoalPermissions, \
-    GoalCommentPermissions
+    GoalCommentPermissions, with_user_role
+from goals.renderers import NDJSONRenderer, CSVRenderer
 from goals.serializers import GoalCategoryCreateSerializer, GoalCategorySerializer, GoalCreateSerializer, \
     GoalSerializer, GoalCommentCreateSerializer, GoalCommentSerializer, BoardCreateSerializer, BoardSerializer, \
-    BoardListSerializer
+    BoardListSerializer, GoalBulkSerializer, CascadeJobSerializer, GoalSearchSerializer, GoalCommentSearchSerializer
+from goals.search import FullTextSearchFilter, SearchOrderingFilter, search_words
+from goals.sync import sync
+
+
+class ShardLookupMixin:
+    """get_object() on the databases of the user's boards, rows of moved boards are not on the default one"""
+
+    def get_object(self):
+        if not sharding.sharded():
+            return super().get_object()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            obj = sharding.locate(sharding.user_querysets(
+                queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}), self.request.user
+            ))
+        except (TypeError, ValueError, DjangoValidationError):
+            obj = None
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
 
 
 class BoardCreateView(CreateAPIView):
@@ -29,22 +68,43 @@ class BoardView(RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         # Filtering boards through participants
-        queryset = Board.objects.filter(participants__user=self.request.user, is_deleted=False)
-        return queryset
+        queryset = with_user_role(Board.objects.filter(is_deleted=False), self.request.user)
+        return queryset.prefetch_related(
+            Prefetch('participants', queryset=BoardParticipant.objects.select_related('user'))
+        )
 
     def perform_destroy(self, instance: Board):
         with transaction.atomic():
             instance.is_deleted = True
             instance.save()
             instance.categories.update(is_deleted=True)
-            Goal.objects.filter(category__board=instance).update(status=Goal.Status.archived)
+            # goals are archived by the run_cascades worker in short chunks
+            queue_cascade(CascadeJob.Kind.board, instance.id, self.request.user)
         return instance
 
 
-class BoardListView(ListAPIView):
+class BoardStatsView(RetrieveAPIView):
     model = Board
+    permission_classes = [IsAuthenticated, BoardPermissions]
+
+    def get_queryset(self):
+        return with_user_role(Board.objects.filter(is_deleted=False), self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(board_stats(self.get_object()))
+
+
+class SyncView(GenericAPIView):
     permission_classes = [IsAuthenticated]
-    pagination_class = LimitOffsetPagination
+
+    def get(self, request, *args, **kwargs):
+        return Response(sync(request.user, request.query_params.get('token'), settings.SYNC_PAGE_SIZE))
+
+
+class BoardListView(FastListMixin, ListAPIView):
+    model = Board
+    permission_classes = [IsAuthenticated]
+    pagination_class = AsyncLimitOffsetPagination
     serializer_class = BoardListSerializer
     filter_backends = [
         filters.OrderingFilter,
@@ -64,16 +124,17 @@ class GoalCategoryCreateView(CreateAPIView):
     serializer_class = GoalCategoryCreateSerializer
 
 
-class GoalCategoryListView(ListAPIView):
+class GoalCategoryListView(FastListMixin, ListAPIView):
     model = GoalCategory
     permission_classes = [IsAuthenticated]
     serializer_class = GoalCategorySerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = AsyncLimitOffsetPagination
     filter_backends = [
         DjangoFilterBackend,
         filters.OrderingFilter,
         filters.SearchFilter,
     ]
+    sharded = True
 
     filterset_fields = ['board']
     ordering_fields = ['title', 'created']
@@ -83,22 +144,24 @@ class GoalCategoryListView(ListAPIView):
     def get_queryset(self):
         return GoalCategory.objects.filter(
             user=self.request.user, is_deleted=False
-        )
+        ).select_related('user')
 
 
-class GoalCategoryView(RetrieveUpdateDestroyAPIView):
+class GoalCategoryView(ShardLookupMixin, RetrieveUpdateDestroyAPIView):
     model = GoalCategory
     serializer_class = GoalCategorySerializer
     permission_classes = [IsAuthenticated, GoalCategoryPermissions]
 
     def get_queryset(self):
-        return GoalCategory.objects.filter(board__participants__user=self.request.user, is_deleted=False)
+        return with_user_role(
+            GoalCategory.objects.filter(is_deleted=False).select_related('user'), self.request.user, 'board'
+        )
 
     def perform_destroy(self, instance):
         with transaction.atomic():
             instance.is_deleted = True
             instance.save()
-            Goal.objects.filter(category=instance).update(status=Goal.Status.archived)
+            queue_cascade(CascadeJob.Kind.category, instance.id, self.request.user)
         return instance
 
 
@@ -108,62 +171,146 @@ class GoalCreateView(CreateAPIView):
     serializer_class = GoalCreateSerializer
 
 
-class GoalListView(ListAPIView):
+class GoalListView(FastListMixin, ListAPIView):
     model = Goal
     permission_classes = [IsAuthenticated]
     serializer_class = GoalSerializer
     filterset_class = GoalDateFilter
-    pagination_class = LimitOffsetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = LimitOffsetKeysetPagination
+    filter_backends = [ShardedFilterBackend, FullTextSearchFilter, SearchOrderingFilter]
+    sharded = True
     ordering_fields = ['title', 'created', 'due_date', 'priority']
     ordering = ['title', 'due_date', 'priority']
-    search_fields = ['title', 'description']
 
     def get_queryset(self):
-        return Goal.objects.filter(
-            category__board__participants__user=self.request.user
+        return Goal.objects.visible_to(self.request.user)
+
+    def get_serializer_class(self):
+        if search_words(self.request):
+            return GoalSearchSerializer
+        return GoalSerializer
+
+
+class GoalExportView(GenericAPIView):
+    model = Goal
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    filterset_class = GoalDateFilter
+    filter_backends = [ShardedFilterBackend]
+
+    def get_queryset(self):
+        return Goal.objects.visible_to(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            stream_export(
+                sharding.user_querysets(self.filter_queryset(self.get_queryset()), request.user),
+                renderer.format, settings.EXPORT_CHUNK_SIZE,
+            ),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
         )
+        response['Content-Disposition'] = f'attachment; filename="goals.{renderer.format}"'
+        return response
 
 
-class GoalView(RetrieveUpdateDestroyAPIView):
+class GoalImportView(GenericAPIView):
+    """Multipart upload of a CSV or NDJSON ``file``, the format comes from ``format`` or the file extension"""
+    model = Goal
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.data.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['This field is required.']})
+        file_format = request.data.get('format') or import_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError({'format': [f'must be one of: {", ".join(IMPORT_FORMATS)}']})
+
+        report = import_goals(
+            request.user, codecs.iterdecode(upload, 'utf-8-sig'), file_format,
+            settings.GOAL_IMPORT_BATCH_SIZE, settings.GOAL_IMPORT_MAX_ERRORS,
+        )
+        return Response(report)
+
+
+class GoalView(ShardLookupMixin, RetrieveUpdateDestroyAPIView):
     model = Goal
     permission_classes = [IsAuthenticated, GoalPermissions]  # IsOwner
     serializer_class = GoalSerializer
 
     def get_queryset(self):
-        return Goal.objects.filter(
-            category__board__participants__user=self.request.user
-        )
+        return with_user_role(Goal.objects.all(), self.request.user, 'board')
 
     def perform_destroy(self, instance):
         instance.status = Goal.Status.archived
-        instance.save()
+        instance.save(update_fields=['status', 'updated'])
         return instance
 
 
+class GoalBulkView(GenericAPIView):
+    model = Goal
+    permission_classes = [IsAuthenticated]
+    serializer_class = GoalBulkSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': serializer.save()})
+
+
 class GoalCommentCreateView(CreateAPIView):
     model = GoalComment
     permission_classes = [IsAuthenticated]
     serializer_class = GoalCommentCreateSerializer
 
 
-class GoalCommentListView(ListAPIView):
+class GoalCommentListView(FastListMixin, ListAPIView):
     model = GoalComment
     permission_classes = [IsAuthenticated, GoalCommentPermissions]
     serializer_class = GoalCommentSerializer
-    pagination_class = LimitOffsetPagination
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['goal']
+    pagination_class = LimitOffsetKeysetPagination
+    filter_backends = [ShardedFilterBackend, FullTextSearchFilter, SearchOrderingFilter]
+    sharded = True
+    filterset_class = GoalCommentFilter
     ordering = ['-created']
 
     def get_queryset(self):
-        return GoalComment.objects.filter(goal__user=self.request.user)
+        return GoalComment.objects.filter(goal__user=self.request.user).select_related('user')
 
+    def get_serializer_class(self):
+        if search_words(self.request):
+            return GoalCommentSearchSerializer
+        return GoalCommentSerializer
 
-class GoalCommentView(RetrieveUpdateDestroyAPIView):
+
+class GoalCommentView(ShardLookupMixin, RetrieveUpdateDestroyAPIView):
     model = GoalComment
     permission_classes = [IsAuthenticated]  # IsOwner
     serializer_class = GoalCommentSerializer
 
     def get_queryset(self):
-        return GoalComment.objects.filter(goal__user=self.request.user)
+        return GoalComment.objects.filter(goal__user=self.request.user).select_related('user')
+
+
+class CascadeJobListView(ListAPIView):
+    model = CascadeJob
+    permission_classes = [IsAuthenticated]
+    serializer_class = CascadeJobSerializer
+    pagination_class = LimitOffsetPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['kind', 'target_id', 'status']
+    ordering = ['-id']
+
+    def get_queryset(self):
+        return CascadeJob.objects.filter(user=self.request.user)
+
+
+class CascadeJobView(RetrieveAPIView):
+    model = CascadeJob
+    permission_classes = [IsAuthenticated]
+    serializer_class = CascadeJobSerializer
+
+    def get_queryset(self):
+        return CascadeJob.objects.filter(user=self.request.user)
@@ -0,0 +1,10 @@
+# Picked up by gunicorn from the working directory
+import os
+
+
+def child_exit(server, worker):
+    # drop the dead worker's live gauges (in-flight requests) from the multiprocess metrics
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
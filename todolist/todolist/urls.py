@@ -16,7 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from core.views import ping
+from core.views import metrics, ping
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,5 +24,6 @@ urlpatterns = [
     path('oauth/', include("social_django.urls", namespace="social")),
     path('goals/', include('goals.urls')),
     path('ping/', ping, name='ping'),
+    path('metrics', metrics, name='metrics'),
     path('bot/', include('bot.urls')),
 ]